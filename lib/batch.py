@@ -0,0 +1,155 @@
+'''
+Generate outlines for every C and C++ file in a directory tree, without Sublime Text. Files are parsed
+with the registered text parsers in a pool of worker processes, and each outline is written to the
+output directory, at the same relative path as its source file, either rendered as in the scratch
+view, as JSON, or in the binary format used for cached trees (see lib/serialize.py). Run it from the
+directory containing the package:
+
+    python -m SublimeScopeTree.lib.batch SOURCE_DIR OUTPUT_DIR [--format json|binary] [--jobs N]
+'''
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+import sys
+import time
+
+# Logging is configured from settings when the library is imported. Outside of the editor, keep it
+# quiet and on stdout unless the environment says otherwise.
+os.environ.setdefault('sublime_scope_tree_log_file', 'stdout')
+os.environ.setdefault('sublime_scope_tree_log_level', 'error')
+os.environ.setdefault('sublime_scope_tree_reset_log', '')
+
+from SublimeScopeTree.lib import headless
+headless.install()
+
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.errors import SSTException
+from SublimeScopeTree.lib.log import flush_log
+from SublimeScopeTree.lib.parse import parse_text
+
+# Syntax to parse files with, by extension
+syntaxes = {
+    '.c':   'C',
+    '.h':   'C++',
+    '.cc':  'C++',
+    '.cpp': 'C++',
+    '.cxx': 'C++',
+    '.c++': 'C++',
+    '.hh':  'C++',
+    '.hpp': 'C++',
+    '.hxx': 'C++',
+    '.h++': 'C++',
+    '.inl': 'C++',
+}
+
+# Extension of the output file for each output format
+extensions = {
+    'text':     '.outline',
+    'json':     '.json',
+    'binary':   '.sst',
+}
+
+def find_sources(source_dir):
+    '''
+    Generate the paths, relative to source_dir, of all of the files we know how to parse.
+    '''
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in syntaxes:
+                yield os.path.relpath(os.path.join(root, name), source_dir)
+
+def tree_to_json(tree):
+    def _scope(scope):
+        return {
+            'name': scope.name,
+            'kind': kinds.name(scope.kind()),
+            'begin': scope.source_region().begin(),
+            'end': scope.source_region().end(),
+            'children': [_scope(child) for child in scope.children]
+        }
+    return [_scope(scope) for scope in tree.top_level_scopes()]
+
+def outline_file(source_dir, output_dir, path, output_format):
+    '''
+    Parse one file and write its outline. This runs in a worker process, and returns a summary of
+    the work done.
+    '''
+    result = {'file': path, 'scopes': 0, 'error': None}
+    start = time.perf_counter()
+    try:
+        with open(os.path.join(source_dir, path), encoding='utf-8', errors='replace') as source_file:
+            text = source_file.read()
+        read = time.perf_counter()
+
+        tree = parse_text(text, syntaxes[os.path.splitext(path)[1].lower()], file_name=path)
+        parsed = time.perf_counter()
+
+        output_path = os.path.join(output_dir, path + extensions[output_format])
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        if output_format == 'binary':
+            tree.dump(output_path)
+        else:
+            if output_format == 'json':
+                output = json.dumps({'file': path, 'scopes': tree_to_json(tree)}, indent=1)
+            else:
+                output = tree.render()
+            with open(output_path, 'w', encoding='utf-8') as output_file:
+                output_file.write(output)
+        written = time.perf_counter()
+
+        result['scopes'] = tree.size()
+        result['bytes'] = len(text)
+        result['read_ms'] = (read - start) * 1000
+        result['parse_ms'] = (parsed - read) * 1000
+        result['write_ms'] = (written - parsed) * 1000
+    except (SSTException, OSError) as err:
+        result['error'] = str(err)
+    except Exception as err:
+        # A bug in a parser shouldn't stop the rest of the files from being outlined
+        result['error'] = '{}: {}'.format(type(err).__name__, err)
+    result['total_ms'] = (time.perf_counter() - start) * 1000
+
+    # Workers exit without running atexit handlers, so make sure our log records are written
+    flush_log()
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate outlines for C and C++ source files.')
+    parser.add_argument('source_dir', help='directory to search for source files')
+    parser.add_argument('output_dir', help='directory to write outlines to')
+    parser.add_argument('--format', choices=sorted(extensions), default='text',
+                        help='write rendered outlines (the default), JSON, or binary trees')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    paths = list(find_sources(args.source_dir))
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(outline_file, args.source_dir, args.output_dir, path, args.format) for path in paths
+        ]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            if result['error']:
+                print('{file}: error: {error}'.format(**result), file=sys.stderr)
+            else:
+                print('{file}: {scopes} scopes, parse {parse_ms:.1f} ms, total {total_ms:.1f} ms'.format(**result))
+    elapsed = time.perf_counter() - start
+
+    with open(os.path.join(args.output_dir, 'timings.json'), 'w') as timings_file:
+        json.dump(results, timings_file, indent=1)
+
+    errors = len([result for result in results if result['error']])
+    print('Outlined {} files ({} errors) in {:.2f} s with {} workers'.format(
+        len(results), errors, elapsed, args.jobs))
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+'''
+Time the main tree operations on a synthetic tree (see parsers/mock.py), without Sublime Text. Run it
+from the directory containing the package:
+
+    python -m SublimeScopeTree.lib.bench [--nodes N] [--fan-out N] [--depth-weights W,W,...]
+                                         [--name-length N] [--seed N] [--lookups N]
+'''
+import argparse
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('sublime_scope_tree_log_file', 'stdout')
+os.environ.setdefault('sublime_scope_tree_log_level', 'error')
+os.environ.setdefault('sublime_scope_tree_reset_log', '')
+
+from SublimeScopeTree.lib import headless
+headless.install()
+
+from SublimeScopeTree.lib.parse import TextView
+from SublimeScopeTree.lib.tree import ScopeTree
+from SublimeScopeTree.parsers.mock import synthetic_scopes
+
+class timer:
+    '''
+    Context manager printing the time taken by the code inside it.
+    '''
+    def __init__(self, label, count=None):
+        self._label = label
+        self._count = count
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *_):
+        elapsed = (time.perf_counter() - self._start) * 1000
+        if self._count:
+            print('{:<24} {:10.1f} ms  ({:.2f} us each)'.format(
+                self._label, elapsed, elapsed * 1000 / self._count))
+        else:
+            print('{:<24} {:10.1f} ms'.format(self._label, elapsed))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time tree operations on a synthetic tree.')
+    parser.add_argument('--nodes', type=int, default=100000, help='number of scopes (default: 100000)')
+    parser.add_argument('--fan-out', type=int, default=8, help='most children of a nested scope (default: 8)')
+    parser.add_argument('--depth-weights', default='1,3,3,2,1',
+                        help='relative weights of each depth, from the top level down (default: 1,3,3,2,1)')
+    parser.add_argument('--name-length', type=int, default=16, help='length of each name (default: 16)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--lookups', type=int, default=10000,
+                        help='number of finds and folds to time (default: 10000)')
+    args = parser.parse_args(argv)
+
+    with timer('generate'):
+        scopes = synthetic_scopes(args.nodes, args.fan_out,
+            [float(weight) for weight in args.depth_weights.split(',')], args.name_length, args.seed)
+
+    tree = ScopeTree(TextView(''))
+    with timer('insert', len(scopes)):
+        for region, name in scopes:
+            tree.insert(region, name)
+
+    with timer('render'):
+        text = tree.render()
+    print('{} scopes, {} characters rendered, {} names'.format(tree.size(), len(text), len(tree.names())))
+
+    rng = random.Random(args.seed)
+    all_scopes = list(tree.walk())
+    points = [rng.randrange(len(text)) for _ in range(args.lookups)]
+    sources = [rng.randrange(scopes[-1][0].end()) for _ in range(args.lookups)]
+    folded = [rng.choice(all_scopes) for _ in range(args.lookups)]
+
+    with timer('find', args.lookups):
+        for point in points:
+            tree.find(point)
+    with timer('find_source', args.lookups):
+        for point in sources:
+            tree.find_source(point)
+    with timer('fold_region', args.lookups):
+        for scope in folded:
+            scope.display_region().fold_region()
+
+    # Changes to a rendered tree
+    with timer('rename', args.lookups):
+        for scope in folded:
+            scope.name = scope.name[::-1]
+    with timer('find after rename', args.lookups):
+        for point in points:
+            tree.find(point)
+    with timer('render after rename'):
+        tree.render()
+
+    scope = rng.choice(all_scopes)
+    with timer('remove one'):
+        tree.remove(scope)
+    with timer('render after remove'):
+        tree.render()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
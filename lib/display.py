@@ -6,34 +6,156 @@ log = get_logger('lib.display')
 
 class DisplayRegion(Region):
     '''
-    This class wraps Sublime's region type to keep track of whether a region is folded or not, and
-    provides an API for folding and unfolding the region.
+    This class wraps Sublime's region type to keep track of where a scope is displayed in a scratch
+    view, and which part of it is hidden when the scope is folded.
     '''
-    def __init__(self, a, b, parent, folded=False):
+    def __init__(self, a, b, parent):
         Region.__init__(self, a, b)
         self._parent = parent
-        self._is_folded = folded
 
-    def toggle_fold(self, view):
-        view.sel().clear()
-
-        # Begin selection after name so that the our name is still visible after folding.
-        # Only our children will be hidden.
-        view.sel().add(Region(self.begin() + len(self._parent.render()) - 1, self.end()))
-
-        if self._is_folded:
-            log.info('Unfolding region {} in view {}', self, view.id())
-            command = 'unfold'
-        else:
-            log.info('Folding region {} in view {}', self, view.id())
-            command = 'fold'
-
-        view.run_command(command)
-        view.sel().clear()
-        self._is_folded = not self._is_folded
+    def fold_region(self):
+        # Begin after name so that the our name is still visible after folding. Only our children
+        # will be hidden.
+        return Region(self.begin() + len(self._parent.render()) - 1, self.end())
 
     def set_begin(self, offset):
         self.a = offset
 
     def set_end(self, offset):
         self.b = offset
+
+class OffsetTable:
+    '''
+    The rendered lengths of a list of sibling scopes, kept as a Fenwick tree. The offset of a sibling
+    from the first one, the sibling at a given offset, and a change to the length of one sibling
+    all take logarithmic time. Appending a sibling does too; inserting one elsewhere means building
+    a new table.
+    '''
+    def __init__(self, lengths=()):
+        # Fenwick tree over the lengths, 1-based: _sums[i] is the total length of the siblings in
+        # (i - lowbit(i), i]
+        self._sums = [0]
+        self._sums.extend(lengths)
+        for index in range(1, len(self._sums)):
+            parent = index + (index & -index)
+            if parent < len(self._sums):
+                self._sums[parent] += self._sums[index]
+
+    def __len__(self):
+        return len(self._sums) - 1
+
+    def copy(self):
+        table = OffsetTable()
+        table._sums = list(self._sums)
+        return table
+
+    def total(self):
+        return self.offset(len(self))
+
+    def offset(self, index):
+        '''
+        Get the total length of the siblings before the one at the given index.
+        '''
+        total = 0
+        while index > 0:
+            total += self._sums[index]
+            index -= index & -index
+        return total
+
+    def add(self, index, delta):
+        '''
+        Change the length of the sibling at the given index by delta.
+        '''
+        index += 1
+        while index < len(self._sums):
+            self._sums[index] += delta
+            index += index & -index
+
+    def pop(self):
+        '''
+        Remove the last sibling.
+        '''
+        self._sums.pop()
+
+    def append(self, length):
+        index = len(self._sums)
+        self._sums.append(length + self.offset(index - 1) - self.offset(index - (index & -index)))
+
+    def find(self, offset):
+        '''
+        Get the index of the sibling spanning the given offset from the first one, or the number of
+        siblings if the offset is past the last one.
+        '''
+        index = 0
+        step = 1 << (len(self).bit_length())
+        while step:
+            if index + step < len(self._sums) and self._sums[index + step] <= offset:
+                index += step
+                offset -= self._sums[index]
+            step >>= 1
+        return index
+
+class FoldOverlay:
+    '''
+    The scopes which are folded in one scratch view. A tree may be shown in several views, each
+    folded its own way, so fold state is kept per view rather than in the tree. Scopes are identified
+    by the names of the scopes from the top level down to them, with the position of each among its
+    siblings of the same name, so that folds survive the tree being parsed again, and identical
+    prototypes in different places are folded separately.
+    '''
+    def __init__(self):
+        self._folded = set()
+
+    def __len__(self):
+        return len(self._folded)
+
+    @staticmethod
+    def key(tree, scope):
+        path = tree._path(scope)
+        key = ()
+        for parent, child in zip(path, path[1:]):
+            ordinal = 0
+            for sibling in parent.children:
+                if sibling is child:
+                    break
+                if sibling.name == child.name:
+                    ordinal += 1
+            key += ((child.name, ordinal),)
+        return key
+
+    def is_folded(self, tree, scope):
+        return self.key(tree, scope) in self._folded
+
+    def toggle_fold(self, view, tree, scope):
+        '''
+        Fold or unfold a scope of the rendered tree shown in a view.
+        '''
+        region = tree.display_region(scope).fold_region()
+        key = self.key(tree, scope)
+        if key in self._folded:
+            log.info('Unfolding region {} in view {}', region, view.id())
+            view.unfold(region)
+            self._folded.discard(key)
+        else:
+            log.info('Folding region {} in view {}', region, view.id())
+            view.fold(region)
+            self._folded.add(key)
+
+    def restore(self, view, tree):
+        '''
+        Fold the scopes of a rendered tree which were folded before the text of the view was
+        replaced.
+        '''
+        if not self._folded:
+            return
+
+        def _restore(scopes, parent_key):
+            ordinals = {}
+            for scope in scopes:
+                ordinal = ordinals.get(scope.name, 0)
+                ordinals[scope.name] = ordinal + 1
+                key = parent_key + ((scope.name, ordinal),)
+                if key in self._folded:
+                    view.fold(tree.display_region(scope).fold_region())
+                _restore(scope.children, key)
+        _restore(tree.top_level_scopes(), ())
@@ -15,7 +15,7 @@ class SSTException(Exception):
         return self.args[0]
 
     def log(self):
-        log.error(repr(self))
+        log.error('{}', repr(self))
 
 class DetailException(SSTException):
     def __init__(self, msg, detailed_msg):
@@ -23,7 +23,7 @@ class DetailException(SSTException):
         SSTException.__init__(self, msg)
 
     def log(self):
-        log.error(self.detail)
+        log.error('{}', self.detail)
 
 class FormattedError(SSTException):
     '''
@@ -68,6 +68,14 @@ class RenderError(FormattedError):
     def __init__(self, msg, *args, **kwargs):
         FormattedError.__init__(self, msg, *args, **kwargs)
 
+class FrozenTreeError(FormattedError):
+    '''
+    Raised when changing a version of a tree which has newer versions sharing its scopes (see
+    ScopeTree.edit).
+    '''
+    def __init__(self, msg, *args, **kwargs):
+        FormattedError.__init__(self, msg, *args, **kwargs)
+
 class TestOnlyError(FormattedError):
     def __init__(self, func, caller):
         FormattedError.__init__(self, 'Test-only function {} called by production function {}', func, caller)
@@ -76,6 +84,36 @@ class ParserSyntaxError(FormattedError):
     def __init__(self, msg, *args, **kwargs):
         FormattedError.__init__(self, msg, *args, **kwargs)
 
+class ParseCancelled(FormattedError):
+    '''
+    Raised by a parser when the parse it is doing is no longer wanted. This is not an error, so we
+    don't log it as one.
+    '''
+    def __init__(self, msg, *args, **kwargs):
+        FormattedError.__init__(self, msg, *args, **kwargs)
+
+    def log(self):
+        log.debug('{}', repr(self))
+
+class ParseIncomplete(FormattedError):
+    '''
+    Raised by a parser which has run out of time. The parser's tree holds the scopes found so far,
+    and the parse can be resumed. This is not an error either.
+    '''
+    def __init__(self, msg, *args, **kwargs):
+        FormattedError.__init__(self, msg, *args, **kwargs)
+
+    def log(self):
+        log.debug('{}', repr(self))
+
+class SerializeError(FormattedError):
+    def __init__(self, msg, *args, **kwargs):
+        FormattedError.__init__(self, msg, *args, **kwargs)
+
+class QueryError(FormattedError):
+    def __init__(self, msg, *args, **kwargs):
+        FormattedError.__init__(self, msg, *args, **kwargs)
+
 class ParseError(DetailException):
     def __init__(self, view, region, msg, *args, **kwargs):
         if args or kwargs:
@@ -0,0 +1,112 @@
+'''
+Support for using the library outside of Sublime Text, for example from the batch outline generator.
+Outside of the editor there is no sublime module, so install() provides the small part of its API
+which the library needs when no editor is available: regions, and settings read from the package's
+settings file. Nothing here talks to an editor, so only text parsers can be used headless.
+'''
+import json
+import os
+import re
+import sys
+import types
+
+_package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Region(object):
+    '''
+    A region of text, with the same semantics as sublime.Region.
+    '''
+    def __init__(self, a, b=None, xpos=-1):
+        if b is None:
+            b = a
+        self.a = a
+        self.b = b
+        self.xpos = xpos
+
+    def __str__(self):
+        return '(' + str(self.a) + ', ' + str(self.b) + ')'
+
+    def __repr__(self):
+        return '(' + str(self.a) + ', ' + str(self.b) + ')'
+
+    def __len__(self):
+        return self.size()
+
+    def __eq__(self, rhs):
+        return hasattr(rhs, 'a') and hasattr(rhs, 'b') and self.a == rhs.a and self.b == rhs.b
+
+    def __lt__(self, rhs):
+        return self.begin() < rhs.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def begin(self):
+        return self.b if self.a > self.b else self.a
+
+    def end(self):
+        return self.a if self.a > self.b else self.b
+
+    def size(self):
+        return abs(self.a - self.b)
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.contains(x.a) and self.contains(x.b)
+        return self.begin() <= x and x <= self.end()
+
+    def cover(self, rhs):
+        return Region(min(self.begin(), rhs.begin()), max(self.end(), rhs.end()))
+
+    def intersects(self, rhs):
+        lb, le = self.begin(), self.end()
+        rb, re = rhs.begin(), rhs.end()
+        return (lb == rb and le == re) or \
+            (rb > lb and rb < le) or (re > lb and re < le) or \
+            (lb > rb and lb < re) or (le > rb and le < re)
+
+class Settings(object):
+    def __init__(self, values):
+        self._values = values
+
+    def get(self, key, default=None):
+        return self._values.get(key, default)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def has(self, key):
+        return key in self._values
+
+    def erase(self, key):
+        self._values.pop(key, None)
+
+_settings = {}
+
+def load_settings(base_name):
+    '''
+    Load a settings file from the package directory. Like Sublime, we allow comments in it.
+    '''
+    if base_name not in _settings:
+        values = {}
+        path = os.path.join(_package_dir, base_name)
+        if os.path.isfile(path):
+            with open(path) as settings_file:
+                values = json.loads(re.sub(r'^\s*//.*$', '', settings_file.read(), flags=re.MULTILINE))
+        _settings[base_name] = Settings(values)
+    return _settings[base_name]
+
+def install():
+    '''
+    Make the library importable without Sublime Text. This does nothing when the sublime module is
+    available, so it is safe to call from code which may also run in the editor.
+    '''
+    try:
+        import sublime
+    except ImportError:
+        module = types.ModuleType('sublime')
+        module.Region = Region
+        module.load_settings = load_settings
+        module.CLASS_LINE_START = 64
+        module.CLASS_LINE_END = 128
+        sys.modules['sublime'] = module
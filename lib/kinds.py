@@ -0,0 +1,47 @@
+'''
+Kinds of scope. Parsers give each scope a kind when they insert it, since they know what they
+matched. The kinds are small integers, so that trees store a number per scope rather than a string.
+'''
+import re
+
+from SublimeScopeTree.lib.errors import QueryError
+
+CLASS, STRUCT, UNION, ENUM, NAMESPACE, FUNCTION, OTHER = range(7)
+
+# Name of each kind, by kind
+NAMES = ['class', 'struct', 'union', 'enum', 'namespace', 'function', 'other']
+
+_kind_pattern = re.compile(
+    r'(?:template\s*<[^{;]*>\s*)?(?:(?:typedef|export|inline)\s+)*(class|struct|union|enum|namespace)\b')
+_function_pattern = re.compile(r'\(')
+
+def name(kind):
+    return NAMES[kind]
+
+def from_name(kind_name):
+    '''
+    Get a kind from its name, for kinds given in settings or command arguments.
+    '''
+    try:
+        return NAMES.index(kind_name)
+    except ValueError:
+        raise QueryError('Unknown scope kind {}', kind_name)
+
+def keyword_kind(text, pos=0):
+    '''
+    Get the kind of a class, struct, union, enum or namespace declared at the given position of a
+    text, or None if there is none there.
+    '''
+    match = _kind_pattern.match(text, pos)
+    return NAMES.index(match.group(1)) if match else None
+
+def classify(scope_name):
+    '''
+    Guess the kind of a scope from its name, for scopes inserted without a kind.
+    '''
+    kind = keyword_kind(scope_name)
+    if kind is not None:
+        return kind
+    if _function_pattern.search(scope_name):
+        return FUNCTION
+    return OTHER
@@ -0,0 +1,106 @@
+import time
+
+from sublime import set_timeout, set_timeout_async
+
+from SublimeScopeTree.lib.log import get_logger
+
+log = get_logger('lib.live')
+
+class Debouncer:
+    '''
+    Runs a callback once a stream of events has been quiet for a given delay. Each call to poke
+    starts a new generation; a scheduled run only goes ahead if no newer generation has started by
+    the time it fires, so a burst of events causes at most one run per quiet period. The callback is
+    given a function which returns True once a newer generation has started, so that a run which
+    is already in progress can give up early.
+    '''
+    def __init__(self, callback, delay, schedule=set_timeout_async):
+        self._callback = callback
+        self._delay = delay
+        self._schedule = schedule
+        self._generation = 0
+
+    def poke(self, delay=None):
+        self._generation += 1
+        generation = self._generation
+        self._schedule(lambda: self._fire(generation), self._delay if delay is None else delay)
+
+    def cancel(self):
+        '''
+        Drop any scheduled run, and ask a run in progress to stop.
+        '''
+        self._generation += 1
+
+    def _fire(self, generation):
+        if generation != self._generation:
+            log.debug('Skipping superseded run {} (current is {})', generation, self._generation)
+            return
+        self._callback(lambda: generation != self._generation)
+
+class Throttle:
+    '''
+    Runs a callback at most once per interval, however often it is poked. A poke during the interval
+    schedules one run at the end of it, so the last event is never lost.
+    '''
+    def __init__(self, callback, interval, schedule=set_timeout_async, clock=time.time):
+        self._callback = callback
+        self._interval = interval
+        self._schedule = schedule
+        self._clock = clock
+        self._last = None
+        self._scheduled = False
+
+    def poke(self):
+        if self._scheduled:
+            return
+
+        wait = 0
+        if self._last is not None:
+            wait = max(0, int(self._last + self._interval - self._clock() * 1000))
+        self._scheduled = True
+        self._schedule(self._fire, wait)
+
+    def _fire(self):
+        self._scheduled = False
+        self._last = self._clock() * 1000
+        self._callback()
+
+class SlicedJob:
+    '''
+    Runs a generator on the main thread one step at a time, letting the editor handle events between
+    the steps. This keeps the editor responsive during long jobs which use the view API, which is
+    cheapest on the main thread. Each step should only take a few milliseconds.
+    '''
+    def __init__(self, job, schedule=set_timeout):
+        self._job = job
+        self._schedule = schedule
+        self._running = False
+
+    def start(self):
+        self._running = True
+        self._schedule(self._step, 0)
+
+    def is_running(self):
+        return self._running
+
+    def cancel(self):
+        '''
+        Stop the job before its next step.
+        '''
+        if self._running:
+            self._running = False
+            self._job.close()
+
+    def _step(self):
+        if not self._running:
+            return
+
+        try:
+            next(self._job)
+        except StopIteration:
+            self._running = False
+            return
+        except:
+            self._running = False
+            raise
+        self._schedule(self._step, 0)
@@ -1,6 +1,9 @@
-from inspect import getargspec
+import atexit
+from inspect import getfullargspec
 import logging
+from logging.handlers import QueueHandler, QueueListener
 import os
+from queue import Queue, Full
 import sys
 
 import SublimeScopeTree.lib.settings as settings
@@ -8,32 +11,146 @@ import SublimeScopeTree.lib.settings as settings
 class FormatLogger(logging.LoggerAdapter):
     def __init__(self, logger, name):
         self.logger = logger
-        self.name = name
+        assert logger.name == name
+
+    @property
+    def name(self):
+        # Newer versions of LoggerAdapter define name as a read-only property, so we do the same
+        return self.logger.name
 
     def log(self, level, msg, *args, **kwargs):
         if self.isEnabledFor(level):
             self.logger._log(level, msg.format(*args, **kwargs), (),
-                {key: kwargs[key] for key in getargspec(self.logger._log).args[1:] if key in kwargs})
+                {key: kwargs[key] for key in getfullargspec(self.logger._log).args[1:] if key in kwargs})
+
+class DroppingQueueHandler(QueueHandler):
+    '''
+    Queues records for the writer thread without ever blocking. Logging must not stall parsing, so
+    when the queue is full the record is dropped, and counted so that the writer can say so.
+    '''
+    def __init__(self, queue):
+        QueueHandler.__init__(self, queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        if _listener_pid != os.getpid():
+            start_writer()
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            self.dropped += 1
+
+class BatchingHandler(logging.StreamHandler):
+    '''
+    Writes records on the writer thread. The stream is flushed once the queue has been drained, or
+    after batch_size records, rather than after every record.
+    '''
+    def __init__(self, stream, queue_handler, batch_size=100):
+        logging.StreamHandler.__init__(self, stream)
+        self._queue_handler = queue_handler
+        self._batch_size = batch_size
+        self._pending = 0
+        self._reported = 0
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+            return
+
+        self._pending += 1
+        if self._pending >= self._batch_size or self._queue_handler.queue.empty():
+            self.flush()
+
+    def flush(self):
+        dropped = self._queue_handler.dropped
+        if dropped > self._reported:
+            self.stream.write('{} log records dropped because the log queue was full\n'.format(
+                dropped - self._reported))
+            self._reported = dropped
+        self._pending = 0
+        logging.StreamHandler.flush(self)
+
+# The handler shared by every logger, and the listener which writes its records, started by the
+# process with id _listener_pid. See get_handler.
+_handler = None
+_listener = None
+_listener_pid = None
+
+# Where the writer writes, and how many records may wait for it, read from settings once
+_log_file = None
+_queue_size = None
 
 def get_logger(name):
     logger = logging.getLogger(name)
-    logger.addHandler(get_handler())
+    handler = get_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
     logger.setLevel(log_level())
     return FormatLogger(logger, name)
 
 def get_handler():
-    handler = None
-    filename = settings.get_setting('log_file', None)
-    filename = filename or 'stdout'
+    '''
+    Get the handler shared by all loggers. Records are put on a bounded queue and written by a
+    single background thread, so that logging from hot loops doesn't wait for the disk.
+    '''
+    global _handler, _log_file, _queue_size
+    if not _handler:
+        _log_file = settings.get_setting('log_file', None) or 'stdout'
+        _queue_size = int(settings.get_setting('log_queue_size', 10000))
+        _handler = DroppingQueueHandler(None)
+        start_writer()
+    return _handler
 
-    if filename == 'stdout':
-        handler = logging.StreamHandler(sys.stdout)
+def start_writer():
+    '''
+    Start the thread writing the records of the shared handler. A forked process, like a worker of a
+    process pool, inherits the handler but not the thread, so it gets a queue and thread of its own
+    the first time it logs.
+    '''
+    global _listener, _listener_pid
+    if _log_file == 'stdout':
+        stream = sys.stdout
     else:
-        handler = logging.FileHandler(filename)
+        stream = open(_log_file, 'a')
+
+    _handler.queue = Queue(_queue_size)
+    writer = BatchingHandler(stream, _handler)
+    writer.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    _listener = QueueListener(_handler.queue, writer)
+    _listener_pid = os.getpid()
+    _listener.start()
+
+def flush_log():
+    '''
+    Wait until every queued record has been written. Processes which may exit without running atexit
+    handlers, such as pool workers, should call this when they finish a piece of work.
+    '''
+    if _listener and _listener_pid == os.getpid():
+        _handler.queue.join()
+
+def stop_logging():
+    '''
+    Write any queued records and stop the writer thread.
+    '''
+    global _listener
+    if not _listener or _listener_pid != os.getpid():
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        # At exit, the stream may have been closed already, like a stdout replaced by a test runner
+        if getattr(handler.stream, 'closed', False):
+            continue
+        try:
+            handler.flush()
+            if _log_file != 'stdout':
+                handler.stream.close()
+        except (ValueError, OSError):
+            pass
+    _listener = None
 
-    assert handler
-    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
-    return handler
+atexit.register(stop_logging)
 
 def log_level():
     levels = {
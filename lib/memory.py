@@ -0,0 +1,155 @@
+'''
+Estimates of the memory used by scope trees and by parsing, for sizing caches. Tree sizes are
+estimated with sys.getsizeof over the objects making up the tree, which counts each object's own
+size but not memory shared with other trees. If the trace_parse_memory setting is on, parses are
+traced with tracemalloc, when it is available, to find their peak allocations.
+'''
+import sys
+
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.settings import get_setting
+
+try:
+    import tracemalloc
+except ImportError:
+    # Sublime Text 3 runs plugins with Python 3.3, which doesn't have tracemalloc
+    tracemalloc = None
+
+log = get_logger('lib.memory')
+
+# Allocation statistics of the last traced parse, see trace_allocations
+_last_parse = None
+
+def _object_size(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def _memo_size(memo):
+    size = sys.getsizeof(memo)
+    for key, value in memo.items():
+        size += sys.getsizeof(key)
+        if isinstance(value, list):
+            size += sys.getsizeof(value) + sum(_object_size(item) for item in value)
+        else:
+            size += _object_size(value)
+    return size
+
+def source_memory(source):
+    '''
+    Estimate the memory used by the source of a tree. A TextView, and the ViewSnapshot given to
+    parsers in the editor, keep a copy of the text, and a snapshot also keeps the results of the
+    selector queries made by the parser. Other sources, like a view itself, don't count.
+    '''
+    from SublimeScopeTree.lib.parse import TextView, ViewSnapshot
+
+    if not isinstance(source, TextView):
+        return 0
+    size = _object_size(source) + sys.getsizeof(source.text()) + sys.getsizeof(source._line_starts)
+    if isinstance(source, ViewSnapshot):
+        size += _memo_size(source._scores) + _memo_size(source._scopes) + _memo_size(source._selections)
+    return size
+
+def tree_memory(tree):
+    '''
+    Estimate the memory used by a tree. Returns a dict with the number of scopes, the approximate
+    total bytes, and the bytes of that taken by the name table and by the source the tree keeps (see
+    source_memory).
+    '''
+    name_bytes = sum(sys.getsizeof(name) for name in tree.names())
+    source_bytes = source_memory(tree.source())
+    size = name_bytes + sys.getsizeof(tree.names()) + _object_size(tree) + sys.getsizeof(tree._name_indices)
+    size += source_bytes
+
+    # The arrays kept for searching source regions
+    for array in (tree._preorder, tree._begins, tree._ends, tree._parents):
+        if array is not None:
+            size += sys.getsizeof(array)
+
+    for scope in tree.walk():
+        size += _object_size(scope) + sys.getsizeof(scope.children)
+        size += _object_size(scope.source_region()) + _object_size(scope._display_region)
+        if scope._text is not None:
+            size += sys.getsizeof(scope._text)
+        if scope._lengths is not None:
+            size += _object_size(scope._lengths) + sys.getsizeof(scope._lengths._sums)
+        if scope.name_span() is not None:
+            size += _object_size(scope.name_span())
+
+    return {'scopes': tree.size(), 'bytes': size, 'name_bytes': name_bytes, 'source_bytes': source_bytes}
+
+def last_parse():
+    '''
+    Get the allocation statistics of the last traced parse, or None if no parse has been traced.
+    '''
+    return _last_parse
+
+class trace_allocations:
+    '''
+    Context manager tracing the allocations made inside it with tracemalloc, if the
+    trace_parse_memory setting is on and tracemalloc is available. The peak traced memory, the
+    memory still allocated at the end, and the lines which allocated the most are recorded; see
+    last_parse.
+    '''
+    def __init__(self, label, top=5):
+        self._label = label
+        self._top = top
+        self._tracing = False
+        self._started = False
+
+    def __enter__(self):
+        if tracemalloc is None or not get_setting('trace_parse_memory', False):
+            return self
+
+        self._tracing = True
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        elif hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self._before = tracemalloc.take_snapshot()
+        self._start_memory = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, *_):
+        if not self._tracing:
+            return
+
+        global _last_parse
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().compare_to(self._before, 'lineno')[:self._top]
+        if self._started:
+            tracemalloc.stop()
+
+        _last_parse = {
+            'label': self._label,
+            'peak_bytes': peak - self._start_memory,
+            'retained_bytes': current - self._start_memory,
+            'top': [(str(stat.traceback), stat.size_diff) for stat in statistics],
+        }
+        log.debug('Traced {}: peak {} bytes', self._label, _last_parse['peak_bytes'])
+
+def report(trees):
+    '''
+    Write a report of the memory used by the given (key, tree) pairs, and by the last traced parse,
+    to the log. Returns the total approximate bytes used by the trees.
+    '''
+    total = 0
+    for key, tree in trees:
+        memory = tree_memory(tree)
+        total += memory['bytes']
+        log.info('Tree {}: {} scopes, ~{} bytes, {} bytes of names, ~{} bytes of source',
+            key, memory['scopes'], memory['bytes'], memory['name_bytes'], memory['source_bytes'])
+    log.info('Trees use ~{} bytes in total', total)
+
+    if tracemalloc is None:
+        log.info('Parse allocations are not available: no tracemalloc in Python {}.{}', *sys.version_info[:2])
+    elif _last_parse is None:
+        log.info('No traced parse; turn on the trace_parse_memory setting to trace parses')
+    else:
+        log.info('Last traced parse of {}: peak {} bytes, {} bytes retained',
+            _last_parse['label'], _last_parse['peak_bytes'], _last_parse['retained_bytes'])
+        for line, size in _last_parse['top']:
+            log.info('    {} bytes at {}', size, line)
+    return total
@@ -0,0 +1,97 @@
+'''
+Structured records of each render of an outline, for tracking outline latency over time. If the
+metrics_file setting is set, every render appends one record to that file as a line of JSON, with
+the size and syntax of the source, the shape of the tree, the time taken by each phase of the
+render, how much was reused from caches, and the number of calls made to the outline view. When
+the source was parsed for the render, the calls the parser made to the source view are recorded
+too. See lib/metrics_summary.py for summarizing the records.
+'''
+import json
+import os
+import time
+
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.settings import get_setting
+
+log = get_logger('lib.metrics')
+
+# Identifies the records written by one run of the plugin
+SESSION = '{}-{}'.format(int(time.time()), os.getpid())
+
+# View methods answered by the plugin host without a call to the editor
+LOCAL_METHODS = frozenset(['id'])
+
+class CountingView:
+    '''
+    Wraps a view, counting the calls made to it. Each call goes to the editor, so the count is the
+    number of round trips a render took. Methods in LOCAL_METHODS aren't counted.
+    '''
+    def __init__(self, view):
+        self._view = view
+        self.calls = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self._view, name)
+        if not callable(attr) or name in LOCAL_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            return attr(*args, **kwargs)
+        return call
+
+class phase:
+    '''
+    Context manager adding the time taken by the code inside it to a phase of a RenderRecord.
+    '''
+    def __init__(self, record, name):
+        self._record = record
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *_):
+        phases = self._record.phases
+        phases[self._name] = phases.get(self._name, 0) + (time.perf_counter() - self._start) * 1000
+
+class RenderRecord:
+    '''
+    The measurements of one render. The record is only written if the metrics_file setting is set;
+    otherwise it only times its phases, which is cheap, and callers should skip measurements which
+    aren't, see enabled.
+    '''
+    def __init__(self, **fields):
+        self._path = get_setting('metrics_file', '')
+        self._start = time.perf_counter()
+        self.fields = fields
+        self.phases = {}
+
+    def enabled(self):
+        return bool(self._path)
+
+    def phase(self, name):
+        return phase(self, name)
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def write(self):
+        '''
+        Append the record to the metrics file, with the time since it was created as its total.
+        '''
+        if not self._path:
+            return
+
+        record = {
+            'time': time.time(),
+            'session': SESSION,
+            'total_ms': round((time.perf_counter() - self._start) * 1000, 3),
+            'phases': {name: round(ms, 3) for name, ms in self.phases.items()},
+        }
+        record.update(self.fields)
+        try:
+            with open(self._path, 'a') as metrics:
+                metrics.write(json.dumps(record, sort_keys=True) + '\n')
+        except OSError as err:
+            log.warning('Could not write render metrics to {}: {}', self._path, err)
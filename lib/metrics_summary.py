@@ -0,0 +1,105 @@
+'''
+Summarize the render records written to the metrics_file setting (see lib/metrics.py), across any
+number of files and sessions. Run it from the directory containing the package:
+
+    python -m SublimeScopeTree.lib.metrics_summary FILE [FILE ...] [--by FIELD]
+                                                   [--percentiles P,P,...]
+'''
+import argparse
+import json
+import math
+import sys
+
+# Measurements summarized, besides the time of each phase
+FIELDS = ['total_ms', 'scopes', 'max_depth', 'rendered_scopes', 'file_size', 'view_calls',
+          'parse_view_calls']
+
+def percentile(values, p):
+    '''
+    Get the p-th percentile of a sorted list of values, by nearest rank.
+    '''
+    rank = max(int(math.ceil(p / 100 * len(values))), 1)
+    return values[rank - 1]
+
+def read_records(paths):
+    '''
+    Get the records in the given files, skipping lines which aren't records, like a line cut off by
+    the editor exiting during a write.
+    '''
+    records = []
+    for path in paths:
+        with open(path) as metrics:
+            for number, line in enumerate(metrics, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print('{}:{}: skipping malformed record'.format(path, number), file=sys.stderr)
+                    continue
+                if isinstance(record, dict):
+                    records.append(record)
+    return records
+
+def measurements(records):
+    '''
+    Get the sorted values of each field and phase in the given records, by name.
+    '''
+    values = {}
+    for record in records:
+        for field in FIELDS:
+            if isinstance(record.get(field), (int, float)):
+                values.setdefault(field, []).append(record[field])
+        for name, ms in (record.get('phases') or {}).items():
+            values.setdefault('phase ' + name, []).append(ms)
+    for field_values in values.values():
+        field_values.sort()
+    return values
+
+def summarize(records, percentiles, out=sys.stdout):
+    sessions = set(record.get('session') for record in records)
+    print('{} renders in {} sessions'.format(len(records), len(sessions)), file=out)
+
+    cached = [record['tree_cache'] for record in records if 'tree_cache' in record]
+    if cached:
+        print('tree cache hit rate: {:.1f}% of {}'.format(
+            100 * cached.count('hit') / len(cached), len(cached)), file=out)
+
+    values = measurements(records)
+    columns = ['p{:g}'.format(p) for p in percentiles] + ['max']
+    print(('{:<20} {:>8}' + ' {:>10}' * len(columns)).format('', 'count', *columns), file=out)
+    names = [field for field in FIELDS if field in values]
+    names += sorted(name for name in values if name not in FIELDS)
+    for name in names:
+        field_values = values[name]
+        row = [percentile(field_values, p) for p in percentiles] + [field_values[-1]]
+        print(('{:<20} {:>8}' + ' {:>10.4g}' * len(row)).format(name, len(field_values), *row),
+              file=out)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Summarize render metrics.')
+    parser.add_argument('files', nargs='+', help='metrics files written by the plugin')
+    parser.add_argument('--by', help='summarize each value of a field separately, like syntax or session')
+    parser.add_argument('--percentiles', default='50,90,99',
+                        help='percentiles to show (default: 50,90,99)')
+    args = parser.parse_args(argv)
+
+    percentiles = [float(p) for p in args.percentiles.split(',')]
+    records = read_records(args.files)
+    if not records:
+        print('No records found')
+        return 1
+
+    if not args.by:
+        summarize(records, percentiles)
+        return 0
+
+    groups = {}
+    for record in records:
+        groups.setdefault(str(record.get(args.by)), []).append(record)
+    for value in sorted(groups):
+        print('{} = {}'.format(args.by, value))
+        summarize(groups[value], percentiles)
+        print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
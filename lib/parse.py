@@ -1,26 +1,103 @@
+from bisect import bisect_right
+from collections import namedtuple
 import os
+import re
+import time
 
-from SublimeScopeTree.lib.errors import ParserSyntaxError
+from sublime import Region
+
+from SublimeScopeTree.lib.errors import ParserSyntaxError, ParseCancelled, ParseIncomplete, ParseError, ScopeError
 from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.memory import trace_allocations
+from SublimeScopeTree.lib.settings import get_setting
+from SublimeScopeTree.lib.tree import ScopeTree
 
 log = get_logger('lib.parse')
 
 _parser_factories = {}
+_text_parser_factories = {}
+
+def parse(view, lazy=False, cancelled=None, budget=None):
+    '''
+    Return a scope tree representing the source code in the given view. If lazy is True, the parser
+    may return a tree containing only the top level scopes, and parse nested scopes as they are
+    expanded (see ScopeTree.expand). If given, cancelled is called periodically during the parse,
+    and if it returns True the parse is abandoned with ParseCancelled.
+
+    If a budget is given, parsers which support it stop after about that many milliseconds, and
+    return a tree of the scopes found so far. The tree is then not complete, and the parse can be
+    continued with ScopeTree.resume.
+    '''
+    with trace_allocations('parse of view {}'.format(view.id())):
+        # Building the parser copies the text of the view, which counts towards the budget
+        deadline = time.time() + budget / 1000 if budget else None
+        parser = get_parser(view)
+        if cancelled:
+            parser.set_cancel_check(cancelled)
+        return run_budgeted(parser, lambda: parser.parse_lazy() if lazy else parser.parse(), budget,
+                            deadline)
+
+def run_budgeted(parser, step, budget, deadline=None):
+    '''
+    Run part of a parse within a budget in milliseconds, or without one if budget is None. If the
+    parser runs out of time, its partial tree is returned, set up to resume the parse. The budget
+    starts now, unless the time it ends is given as deadline.
+    '''
+    if deadline is None and budget:
+        deadline = time.time() + budget / 1000
+    parser.set_deadline(deadline)
+    try:
+        tree = step()
+        tree.set_resume(None)
+        return tree
+    except ParseIncomplete:
+        log.info('Parse ran out of its {} ms budget with {} scopes', budget, parser.tree.size())
+        parser.tree.set_resume(lambda tree, budget: _resume(parser, tree, budget), parser.progress)
+        return parser.tree
+    finally:
+        # The deadline only applies to this part of the parse, not to expanding lazy scopes later
+        parser.set_deadline(None)
+
+def resume_in_slices(tree, slice_ms):
+    '''
+    Continue the parse of an incomplete tree in slices of about slice_ms milliseconds, yielding its
+    progress (see ScopeTree.progress) after each slice until the tree is complete. The caller can
+    let the editor handle events between slices; see SlicedJob in lib/live.py.
+    '''
+    while not tree.resume(slice_ms):
+        yield tree.progress()
 
-def parse(view):
+def parse_text(text, syntax, file_name=None):
     '''
-    Return a scope tree representing the source code in the given view
+    Return a scope tree representing the given source code, using a text parser for the given
+    syntax. This does not need a view, or the editor's syntax engine.
     '''
-    return get_parser(view).parse()
+    return get_text_parser(TextView(text, file_name), syntax).parse()
 
 def get_parser(view):
     import SublimeScopeTree.parsers
 
     syntax = get_syntax(view)
     log.info('Using syntax {} for view {}', syntax, view.id())
+
+    # Users can opt in to parsing the text alone, for syntaxes which have a text parser
+    if get_setting('parser_backend', 'syntax') == 'text' and syntax in _text_parser_factories:
+        return get_text_parser(ViewSnapshot(view), syntax)
+
     if syntax not in _parser_factories:
         raise ParserSyntaxError('No parser for syntax {}', syntax)
-    return _parser_factories[syntax](view)
+    return _parser_factories[syntax](ViewSnapshot(view))
+
+def get_text_parser(view, syntax):
+    '''
+    Get a text parser for the given syntax. The view can be any TextView, including a ViewSnapshot.
+    '''
+    import SublimeScopeTree.parsers
+
+    log.info('Using text parser for syntax {} for {}', syntax, view.file_name())
+    if syntax not in _text_parser_factories:
+        raise ParserSyntaxError('No text parser for syntax {}', syntax)
+    return _text_parser_factories[syntax](view)
 
 def get_syntax(view):
     '''
@@ -31,6 +108,26 @@ def get_syntax(view):
         raise ParserSyntaxError('Unable to determine syntax for view: syntax file {} does not have .sublime-syntax extension', syntax_file)
     return syntax_file[:-15]
 
+def _resume(parser, tree, budget):
+    # The parser's tree may since have been replaced by a newer version of it (see ScopeTree.edit),
+    # in which case we carry on in that one.
+    parser.tree = tree
+    return run_budgeted(parser, parser.resume, budget)
+
+def end_before_next(scopes):
+    '''
+    Siblings in a tree must not touch, but with no whitespace between them, like int h();int k();,
+    one scope may end where the next begins. Get the given (region, ...) tuples of a parser with such
+    scopes ending a character early. Their children end there too, so they are shortened the same
+    way and stay nested.
+    '''
+    begins = set(scope[0].begin() for scope in scopes)
+    return [
+        (Region(scope[0].begin(), scope[0].end() - 1),) + tuple(scope[1:])
+            if scope[0].end() in begins and not scope[0].empty() else scope
+        for scope in scopes
+    ]
+
 def register_parser(syntax, parser_t):
     def factory(view):
         assert get_syntax(view) == syntax
@@ -41,12 +138,330 @@ def register_parser_factory(syntax, factory):
     assert syntax not in _parser_factories, 'Duplicate parser'
     _parser_factories[syntax] = factory
 
+def register_selector_parser(syntax, rules):
+    '''
+    Register a SelectorParser for a syntax, driven by the given list of SelectorRules.
+    '''
+    register_parser_factory(syntax, lambda view: SelectorParser(view, rules))
+
+def register_text_parser(syntax, parser_t):
+    assert syntax not in _text_parser_factories, 'Duplicate text parser'
+    _text_parser_factories[syntax] = parser_t
+
 class Parser():
     '''
     API for a parser: return a ScopeTree object which represents the source code in the given view.
     '''
+    # Cancellation check, see set_cancel_check
+    _cancelled = None
+
+    # Time by which the parse must stop, see set_deadline
+    _deadline = None
+
     def __init__(self, view):
         pass
 
     def parse(self):
         raise NotImplementedError('Derived class must implement parse')
+
+    def set_cancel_check(self, cancelled):
+        self._cancelled = cancelled
+
+    def check_cancelled(self):
+        '''
+        Parsers should call this regularly while parsing, so that unwanted parses stop early.
+        '''
+        if self._cancelled and self._cancelled():
+            raise ParseCancelled('Parse cancelled')
+
+    def set_deadline(self, deadline):
+        self._deadline = deadline
+
+    def check_deadline(self):
+        '''
+        Parsers which can be resumed should call this regularly while parsing, at points from which
+        resume can carry on, that is, with every scope they found so far in their tree.
+        '''
+        if self._deadline is not None and time.time() > self._deadline:
+            raise ParseIncomplete('Parse ran out of time')
+
+    def resume(self):
+        '''
+        Continue a parse which ran out of time, returning the tree. Parsers which call
+        check_deadline must implement this.
+        '''
+        raise NotImplementedError('Derived class must implement resume to use deadlines')
+
+    def progress(self):
+        '''
+        Get the fraction of a resumable parse which is done, or None if the parser can't tell.
+        '''
+        return None
+
+    def parse_lazy(self):
+        '''
+        Return a ScopeTree in which some scopes may not have been expanded yet. Parsers which do not
+        support lazy parsing just parse everything.
+        '''
+        return self.parse()
+
+# A row of the table driving a SelectorParser:
+#
+#   selector    scope selector matching the scopes, like 'meta.class'
+#   kind        kind of the scopes (see lib/kinds.py)
+#   name_end    regular expression matching the end of the name, which is everything from the
+#               beginning of the scope up to the match. If there is no match within the scope, the
+#               name is the first line.
+#   indented    True if the syntax only matches the header of these scopes, and their bodies are the
+#               indented lines which follow, as in Python
+SelectorRule = namedtuple('SelectorRule', ['selector', 'kind', 'name_end', 'indented'])
+
+_blank_pattern = re.compile(r'[ \t]*(?:\n|$)')
+_indent_pattern = re.compile(r'[ \t]*')
+
+class SelectorParser(Parser):
+    '''
+    A parser for any syntax whose scopes can be found by scope selectors, configured by a table of
+    SelectorRules. The regions matching each rule are found with find_by_selector, and then sorted
+    by position and nested with a single sweep, keeping a stack of the scopes which are still open.
+
+    Nested scopes matching the same selector are merged into one region by find_by_selector, so each
+    selector is repeated (as in 'meta.class meta.class') until it finds nothing more. Unlike the
+    C++ parser, the number of queries only grows with the nesting of scopes of the same kind.
+    '''
+    def __init__(self, view, rules):
+        Parser.__init__(self, view)
+        self.view = view
+        self.rules = rules
+        self.tree = ScopeTree(view)
+        self.tree.set_name_format(lambda name: ' '.join(name.split()))
+        self._name_ends = {rule: re.compile(rule.name_end) for rule in rules if rule.name_end}
+
+    def parse(self):
+        log.debug('Parsing view {} with {} selector rules', self.view.id(), len(self.rules))
+
+        # State of find_scopes: the rule being searched, the selector of its next query, and the
+        # (region, rule) pairs found so far
+        self._rule = 0
+        self._selector = None
+        self._found = []
+
+        # The scopes to insert, once they are all found
+        self._scopes = None
+        self._next = 0
+
+        # Stack of the ends of the scopes containing the current one
+        self._stack = []
+        return self.resume()
+
+    def resume(self):
+        if self._scopes is None:
+            self.find_scopes()
+            self._scopes = sorted(self._found, key=lambda scope: (scope[0].begin(), -scope[0].end()))
+            self._scopes = end_before_next(self._scopes)
+            self._found = None
+
+        scopes, stack = self._scopes, self._stack
+        while self._next < len(scopes):
+            index = self._next
+            region, rule = scopes[index]
+            self._next += 1
+            if index % 1024 == 0:
+                self.check_cancelled()
+            if index and scopes[index - 1][0] == region:
+                # Matched by more than one rule; the first one wins
+                continue
+            while stack and stack[-1] <= region.begin():
+                stack.pop()
+            if stack and region.end() > stack[-1]:
+                log.debug('Skipping region {} overlapping an enclosing scope', region)
+                continue
+            stack.append(region.end())
+
+            try:
+                self.tree.insert(region, self.name_span(region, rule), kind=rule.kind)
+            except ScopeError as err:
+                raise ParseError(self.view, region, repr(err))
+            if self._next < len(scopes):
+                self.check_deadline()
+        return self.tree
+
+    def progress(self):
+        # Finding the scopes counts for as much as inserting them
+        if self._scopes is None:
+            return self._rule / len(self.rules) / 2
+        return (1 + self._next / len(self._scopes)) / 2
+
+    def find_scopes(self):
+        '''
+        Find (region, rule) pairs for every scope matching a rule, adding them to self._found. The
+        deadline is checked after each query, and calling this again carries on with the next one.
+        '''
+        while self._rule < len(self.rules):
+            rule = self.rules[self._rule]
+            selector = self._selector or rule.selector
+            regions = self.view.find_by_selector(selector)
+            log.debug('Found {} regions matching {}', len(regions), selector)
+            if regions:
+                for region in regions:
+                    self._found.append(((self.indented_region(region) if rule.indented else region), rule))
+                self._selector = selector + ' ' + rule.selector
+            else:
+                self._rule += 1
+                self._selector = None
+            if self._rule < len(self.rules):
+                self.check_deadline()
+
+    def name_span(self, region, rule):
+        text = self.view.text()
+        match = self._name_ends[rule].search(text, region.begin(), region.end()) if rule.name_end else None
+        if match:
+            return Region(region.begin(), match.start())
+        end = text.find('\n', region.begin(), region.end())
+        return Region(region.begin(), region.end() if end == -1 else end)
+
+    def indented_region(self, region):
+        '''
+        Extend the header of a scope to include the following lines which are indented more than the
+        line it starts on, and any blank lines between them.
+        '''
+        text = self.view.text()
+        line = self.view.line(region.begin()).begin()
+        indent = _indent_pattern.match(text, line).end() - line
+
+        end = region.end()
+        point = text.find('\n', region.end())
+        while point != -1:
+            point += 1
+            if _blank_pattern.match(text, point):
+                point = text.find('\n', point)
+                continue
+            if _indent_pattern.match(text, point).end() - point <= indent:
+                break
+            end = text.find('\n', point)
+            if end == -1:
+                end = len(text)
+            point = text.find('\n', point)
+        return Region(region.begin(), end)
+
+class TextParser(Parser):
+    '''
+    API for a parser which works on source text alone: return a ScopeTree object which represents
+    the text of the given TextView. Text parsers may only use the TextView API, so they work the same
+    on a ViewSnapshot in the editor and on a TextView outside of it.
+    '''
+    pass
+
+class TextView():
+    '''
+    A read-only, view-like wrapper around source text. This supports the parts of the view API which
+    only need the text, so that parsers and ScopeTrees can work without an editor.
+    '''
+    def __init__(self, text, file_name=None):
+        self._text = text
+        self._file_name = file_name
+
+        # Offset of the first character of each line, so that rowcol is a bisect
+        self._line_starts = [0]
+        index = text.find('\n')
+        while index != -1:
+            self._line_starts.append(index + 1)
+            index = text.find('\n', index + 1)
+
+    def id(self):
+        return None
+
+    def file_name(self):
+        return self._file_name
+
+    def text(self):
+        return self._text
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def rowcol(self, point):
+        row = bisect_right(self._line_starts, point) - 1
+        return row, point - self._line_starts[row]
+
+    def text_point(self, row, col):
+        return self._line_starts[row] + col
+
+    def line(self, x):
+        if isinstance(x, Region):
+            begin, end = x.begin(), x.end()
+        else:
+            begin = end = x
+        begin = self._line_starts[self.rowcol(begin)[0]]
+        end = self._text.find('\n', end)
+        return Region(begin, len(self._text) if end == -1 else end)
+
+class ViewSnapshot(TextView):
+    '''
+    A read-only stand-in for a view, given to parsers in place of the view itself. Every call to the
+    view API crosses the plugin host boundary, and parsers ask for the same text and scopes over and
+    over. The snapshot copies the text of the view once, and memoizes selector queries per point.
+    Anything not covered here is forwarded to the view. The calls made to the view are counted in
+    calls.
+    '''
+    def __init__(self, view):
+        TextView.__init__(self, view.substr(Region(0, view.size())), view.file_name())
+        self.view = view
+        self._change_count = view.change_count()
+        self.calls = 4
+        self._scores = {}
+        self._scopes = {}
+        self._selections = {}
+
+    def __getattr__(self, attr):
+        value = getattr(self.view, attr)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            return value(*args, **kwargs)
+        return call
+
+    def __eq__(self, other):
+        if isinstance(other, ViewSnapshot):
+            other = other.view
+        return self.view == other
+
+    def __hash__(self):
+        return hash(self.view)
+
+    def id(self):
+        return self.view.id()
+
+    def is_current(self):
+        '''
+        True if the view hasn't changed since the snapshot was taken. Otherwise, scopes the view
+        finds now don't match the text of the snapshot, or the scopes found before.
+        '''
+        self.calls += 1
+        return self.view.change_count() == self._change_count
+
+    def score_selector(self, point, selector):
+        key = (point, selector)
+        if key not in self._scores:
+            self.calls += 1
+            self._scores[key] = self.view.score_selector(point, selector)
+        return self._scores[key]
+
+    def extract_scope(self, point):
+        if point not in self._scopes:
+            self.calls += 1
+            self._scopes[point] = self.view.extract_scope(point)
+        return self._scopes[point]
+
+    def find_by_selector(self, selector):
+        if selector not in self._selections:
+            self.calls += 1
+            self._selections[selector] = self.view.find_by_selector(selector)
+        return self._selections[selector]
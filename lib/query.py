@@ -0,0 +1,186 @@
+'''
+Queries over the scopes of a ScopeTree: select scopes by kind, name, depth and source range, and
+build trees containing only the selected scopes, for filtered outlines. Queries are evaluated over a
+ScopeIndex, which a tree builds from its preorder arrays after rendering (see ScopeTree.index), so
+they look at the columns of the index rather than walking the tree.
+'''
+from bisect import bisect_left, bisect_right
+from fnmatch import translate
+import re
+
+from SublimeScopeTree.lib.errors import QueryError
+from SublimeScopeTree.lib.kinds import from_name
+from SublimeScopeTree.lib.log import get_logger
+
+log = get_logger('lib.query')
+
+class ScopeIndex:
+    '''
+    Columns describing each scope of a rendered tree, in preorder, with indices from kinds and names
+    to positions in the columns. Kinds and definitions are those recorded by the parser (see
+    lib/kinds.py).
+    '''
+    def __init__(self, tree, preorder, begins, ends, parents):
+        self.tree = tree
+        self.scopes = preorder
+        self.begins = begins
+        self.ends = ends
+        self.parents = parents
+        self.depths = [scope.depth() for scope in preorder]
+        self.kinds = [scope.kind() for scope in preorder]
+
+        # Positions of the scopes with each name and of each kind, in preorder
+        self.by_name = {}
+        self.by_kind = {}
+        for position, scope in enumerate(preorder):
+            self.by_name.setdefault(scope.name_index(), []).append(position)
+            self.by_kind.setdefault(self.kinds[position], []).append(position)
+
+        # Computed on first use; see definitions
+        self._definitions = None
+
+        log.debug('Indexed {} scopes with {} names', len(preorder), len(self.by_name))
+
+    def __len__(self):
+        return len(self.scopes)
+
+    def definitions(self):
+        '''
+        Get a column which is True for each scope which is a definition rather than a declaration.
+        For scopes whose parser did not say, a scope is a definition if its source does not end in a
+        semicolon, which needs the source text of the tree.
+        '''
+        if self._definitions is None:
+            definitions = [scope.is_definition() for scope in self.scopes]
+            if None in definitions:
+                source = self.tree.source()
+                if not hasattr(source, 'substr'):
+                    raise QueryError('Cannot tell definitions from declarations without the source text')
+                for position, definition in enumerate(definitions):
+                    if definition is None:
+                        definitions[position] = source.substr(self.ends[position] - 1) != ';'
+            self._definitions = definitions
+        return self._definitions
+
+    def ancestors(self, position):
+        '''
+        Generate the positions of the ancestors of the scope at the given position, innermost first.
+        '''
+        position = self.parents[position]
+        while position >= 0:
+            yield position
+            position = self.parents[position]
+
+class Query:
+    '''
+    A selection of scopes. Each criterion which is given must match:
+
+    kinds       a collection of kinds, like kinds.CLASS, or their names, like 'class'
+    name        a glob which must match the whole name, like 'operator*'
+    regex       a regular expression which must match part of the name
+    min_depth   the least depth of the scope, where top level scopes have depth 0
+    max_depth   the greatest depth of the scope
+    region      a region of the source which must contain the scope
+    definition  True for definitions only, or False for declarations only
+    '''
+    def __init__(self, kinds=None, name=None, regex=None, min_depth=None, max_depth=None, region=None,
+                 definition=None):
+        if kinds is not None:
+            kinds = frozenset(from_name(kind) if isinstance(kind, str) else kind for kind in kinds)
+
+        patterns = []
+        try:
+            if name is not None:
+                patterns.append(re.compile(translate(name)).match)
+            if regex is not None:
+                patterns.append(re.compile(regex).search)
+        except re.error as err:
+            raise QueryError('Invalid name pattern: {}', err)
+
+        self.kinds = kinds
+        self.patterns = patterns
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        self.region = region
+        self.definition = definition
+
+    def positions(self, index):
+        '''
+        Get the positions in the index of the matching scopes, in preorder.
+        '''
+        # Start from the smallest set of candidates we can get from an index, and filter it by the
+        # remaining criteria.
+        candidates = None
+        if self.patterns:
+            tree = index.tree
+            names = [
+                name for name in index.by_name
+                if all(pattern(tree.name_at(name)) for pattern in self.patterns)
+            ]
+            candidates = sorted(position for name in names for position in index.by_name[name])
+        if self.kinds is not None:
+            by_kind = sorted(position for kind in self.kinds for position in index.by_kind.get(kind, []))
+            if candidates is None:
+                candidates = by_kind
+            else:
+                candidates = sorted(set(by_kind).intersection(candidates))
+        if self.region is not None:
+            # Scopes are in order of their beginnings, so we can bisect for the ones beginning in
+            # the region
+            first = bisect_left(index.begins, self.region.begin())
+            last = bisect_right(index.begins, self.region.end())
+            if candidates is None:
+                candidates = range(first, last)
+            else:
+                candidates = [position for position in candidates if first <= position < last]
+        if candidates is None:
+            candidates = range(len(index))
+
+        definitions = index.definitions() if self.definition is not None else None
+        matches = []
+        for position in candidates:
+            depth = index.depths[position]
+            if self.min_depth is not None and depth < self.min_depth:
+                continue
+            if self.max_depth is not None and depth > self.max_depth:
+                continue
+            if self.region is not None and index.ends[position] > self.region.end():
+                continue
+            if definitions is not None and definitions[position] != self.definition:
+                continue
+            matches.append(position)
+
+        log.debug('Query matched {} of {} scopes', len(matches), len(index))
+        return matches
+
+    def scopes(self, index):
+        '''
+        Get the matching scopes, in preorder.
+        '''
+        return [index.scopes[position] for position in self.positions(index)]
+
+    def filter(self, index):
+        '''
+        Get a new tree containing copies of the matching scopes and their ancestors, which can be
+        rendered as a filtered outline.
+        '''
+        from SublimeScopeTree.lib.tree import ScopeTree
+
+        selected = set()
+        for position in self.positions(index):
+            if position in selected:
+                continue
+            selected.add(position)
+            for ancestor in index.ancestors(position):
+                if ancestor in selected:
+                    break
+                selected.add(ancestor)
+
+        # Lazily parsed scopes stay unexpanded, and can be expanded in the filtered tree too
+        tree = ScopeTree(index.tree.source())
+        tree.set_expander(index.tree._expander)
+        for position in sorted(selected):
+            scope = index.scopes[position]
+            tree.insert(scope.source_region(), scope.name, expanded=scope.is_expanded(),
+                        kind=scope.kind(), definition=scope.is_definition())
+        return tree
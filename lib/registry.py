@@ -0,0 +1,116 @@
+from SublimeScopeTree.lib.log import get_logger
+
+log = get_logger('lib.registry')
+
+class TreeRegistry:
+    '''
+    The trees shown in outline views. Trees are keyed by the buffer they were parsed from and its
+    change count, and shared by every outline of that buffer, so cloned views and repeated renders
+    of the same buffer are only parsed and stored once. Anything specific to one outline view, like
+    its folds, is kept outside of the tree.
+
+    Trees in the registry are replaced rather than changed: a new parse, or a new version of a tree
+    (see ScopeTree.edit), is swapped in with a single assignment, so a reader sees either the old
+    tree or the new one, and a reader holding the old one can keep using it.
+    '''
+    def __init__(self, parse):
+        # Called with a source view to get a new tree for it
+        self._parse = parse
+
+        # Buffer id => (change count, tree)
+        self._trees = {}
+
+        # Outline view id => buffer id
+        self._buffers = {}
+
+    def __contains__(self, outline_id):
+        return outline_id in self._buffers
+
+    def __len__(self):
+        return len(self._trees)
+
+    def items(self):
+        '''
+        Generate (buffer id, tree) pairs for every tree in the registry.
+        '''
+        for buffer_id, (_, tree) in self._trees.items():
+            yield buffer_id, tree
+
+    def tree(self, buffer_id):
+        '''
+        Get the tree of the given buffer, or None.
+        '''
+        entry = self._trees.get(buffer_id)
+        return entry[1] if entry else None
+
+    def get(self, outline_id):
+        '''
+        Get the tree shown in the given outline view, or None.
+        '''
+        if outline_id not in self._buffers:
+            return None
+        return self._trees[self._buffers[outline_id]][1]
+
+    def outlines(self, buffer_id):
+        '''
+        Get the ids of the outline views showing the tree of the given buffer.
+        '''
+        return [outline_id for outline_id, buffer in self._buffers.items() if buffer == buffer_id]
+
+    def is_current(self, source_view):
+        '''
+        True if there is a tree for the current contents of the buffer of a source view, so that
+        acquire won't parse it.
+        '''
+        entry = self._trees.get(source_view.buffer_id())
+        return entry is not None and entry[0] == source_view.change_count()
+
+    def acquire(self, outline_id, source_view):
+        '''
+        Get the tree for the buffer of a source view, to show in the given outline view. The buffer
+        is parsed only if there is no tree for its current contents yet. If there is a tree for
+        older contents, the new parse replaces it for every outline sharing it; the return value is
+        then (tree, True) to say that those outlines must be rendered again.
+        '''
+        buffer_id, change_count = source_view.buffer_id(), source_view.change_count()
+        self._buffers[outline_id] = buffer_id
+
+        if buffer_id in self._trees and self._trees[buffer_id][0] == change_count:
+            log.info('Sharing tree of buffer {} (change {}) with outline {}', buffer_id, change_count, outline_id)
+            return self._trees[buffer_id][1], False
+
+        return self.update(buffer_id, change_count, self._parse(source_view))
+
+    def update(self, buffer_id, change_count, tree):
+        '''
+        Record a new parse of a buffer, replacing any older tree for every outline sharing it.
+        Returns the tree and whether it replaced an existing one.
+        '''
+        previous = self._trees.get(buffer_id)
+        self._trees[buffer_id] = (change_count, tree)
+        if previous:
+            log.info('Replaced tree of buffer {} from change {} with change {}', buffer_id, previous[0], change_count)
+            return tree, True
+
+        log.info('New tree for buffer {} at change {}', buffer_id, change_count)
+        return tree, False
+
+    def replace(self, buffer_id, tree):
+        '''
+        Swap in a new version of the tree of a buffer, for the same contents of the buffer.
+        '''
+        change_count, _ = self._trees[buffer_id]
+        self._trees[buffer_id] = (change_count, tree)
+        log.debug('New version of tree of buffer {} at change {}', buffer_id, change_count)
+
+    def release(self, outline_id):
+        '''
+        Forget an outline view. A tree is dropped once no outline shows it, in which case the id of
+        its buffer is returned.
+        '''
+        buffer_id = self._buffers.pop(outline_id, None)
+        if buffer_id is not None and not self.outlines(buffer_id):
+            log.info('Dropping tree of buffer {}', buffer_id)
+            del self._trees[buffer_id]
+            return buffer_id
+        return None
@@ -0,0 +1,188 @@
+'''
+Compact binary representation of a ScopeTree, used for caching trees on disk. The format is:
+
+    magic       b'SSTR'
+    version     varint
+    source size varint, the size of the source file
+    names       varint count, then for each name a varint length and that many bytes of UTF-8. Each
+                distinct name is stored once.
+    scopes      varint count of top level scopes, then a record for each scope in preorder
+
+Each scope record is
+
+    name        varint index into the name table
+    begin       varint offset from the end of the previous sibling, or from the beginning of the
+                parent if this is the first child
+    length      varint length of the source region
+    kind        varint kind of the scope (see lib/kinds.py) shifted left by 2, or'ed with 1 for a
+                declaration, 2 for a definition, or 0 if the parser didn't say
+    children    varint number of children
+    size        varint number of bytes taken by the records of the children, which follow
+
+The size of the children lets a reader skip a subtree without decoding it. Loading is lazy: only the
+top level scopes are decoded from a memory map of the file, and each subtree is decoded when it is
+expanded (see ScopeTree.expand).
+'''
+import mmap
+import os
+
+from SublimeScopeTree.lib.errors import SerializeError
+from SublimeScopeTree.lib.log import get_logger
+
+from sublime import Region
+
+log = get_logger('lib.serialize')
+
+MAGIC = b'SSTR'
+VERSION = 2
+
+# Encoding of Scope.is_definition() in the kind field
+_definitions = {None: 0, False: 1, True: 2}
+
+def encode_varint(value, out):
+    assert value >= 0, 'Cannot encode negative varint {}'.format(value)
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def decode_varint(data, offset):
+    '''
+    Decode the varint at the given offset, returning the value and the offset following it.
+    '''
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise SerializeError('Truncated varint at offset {}', offset)
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+def dump(tree, path):
+    '''
+    Write the tree to the given path. The file is written in full and then moved into place, so
+    that readers never see a partially written tree.
+    '''
+    names = []
+    name_indices = {}
+
+    def _scopes(parent_begin, scopes):
+        out = bytearray()
+        previous = parent_begin
+        for scope in scopes:
+            if scope.name not in name_indices:
+                name_indices[scope.name] = len(names)
+                names.append(scope.name)
+
+            region = scope.source_region()
+            children = _scopes(region.begin(), scope.children)
+            encode_varint(name_indices[scope.name], out)
+            encode_varint(region.begin() - previous, out)
+            encode_varint(region.size(), out)
+            encode_varint(scope.kind() << 2 | _definitions[scope.is_definition()], out)
+            encode_varint(len(scope.children), out)
+            encode_varint(len(children), out)
+            out += children
+            previous = region.end()
+        return out
+
+    top_level_scopes = tree.top_level_scopes()
+    scopes = _scopes(0, top_level_scopes)
+
+    out = bytearray(MAGIC)
+    encode_varint(VERSION, out)
+    encode_varint(tree.source_size(), out)
+    encode_varint(len(names), out)
+    for name in names:
+        encoded = name.encode('utf-8')
+        encode_varint(len(encoded), out)
+        out += encoded
+    encode_varint(len(top_level_scopes), out)
+    out += scopes
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as tree_file:
+        tree_file.write(out)
+    os.replace(temp_path, path)
+    log.info('Wrote {} scopes with {} names in {} bytes to {}', tree.size(), len(names), len(out), path)
+
+def load(path, lazy=True):
+    '''
+    Read a tree written by dump. If lazy is True, only the top level scopes are decoded, and the
+    rest of the tree is decoded from a memory map of the file as it is expanded.
+    '''
+    from SublimeScopeTree.lib.tree import ScopeTree
+
+    with open(path, 'rb') as tree_file:
+        if os.fstat(tree_file.fileno()).st_size == 0:
+            raise SerializeError('Empty scope tree file {}', path)
+        data = mmap.mmap(tree_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if data[:len(MAGIC)] != MAGIC:
+        raise SerializeError('{} is not a scope tree file', path)
+    version, offset = decode_varint(data, len(MAGIC))
+    if version != VERSION:
+        raise SerializeError('Unsupported scope tree version {} in {}', version, path)
+
+    source_size, offset = decode_varint(data, offset)
+    count, offset = decode_varint(data, offset)
+    names = []
+    for _ in range(count):
+        length, offset = decode_varint(data, offset)
+        names.append(data[offset:offset + length].decode('utf-8'))
+        offset += length
+
+    tree = ScopeTree(_Source(source_size))
+
+    # Offset of the children of each unexpanded scope, by source region
+    pending = {}
+
+    def _decode(tree, offset, parent_begin, count):
+        previous = parent_begin
+        for _ in range(count):
+            name, offset = decode_varint(data, offset)
+            begin, offset = decode_varint(data, offset)
+            length, offset = decode_varint(data, offset)
+            kind, offset = decode_varint(data, offset)
+            children, offset = decode_varint(data, offset)
+            size, offset = decode_varint(data, offset)
+
+            begin += previous
+            region = Region(begin, begin + length)
+            definition = (None, False, True)[kind & 3]
+            if lazy and children:
+                tree.insert(region, names[name], expanded=False, kind=kind >> 2, definition=definition)
+                pending[(region.begin(), region.end())] = (offset, children)
+            else:
+                tree.insert(region, names[name], kind=kind >> 2, definition=definition)
+                _decode(tree, offset, begin, children)
+
+            offset += size
+            previous = region.end()
+
+    def expander(tree, scope):
+        region = scope.source_region()
+        offset, count = pending.pop((region.begin(), region.end()))
+        _decode(tree, offset, region.begin(), count)
+
+    tree.set_expander(expander)
+    count, offset = decode_varint(data, offset)
+    _decode(tree, offset, 0, count)
+    if not lazy:
+        data.close()
+    log.info('Loaded {} scopes from {}', tree.size(), path)
+    return tree
+
+class _Source:
+    '''
+    Stands in for the view of the source of a loaded tree, of which we only know the size.
+    '''
+    def __init__(self, size):
+        self._size = size
+
+    def size(self):
+        return self._size
@@ -0,0 +1,135 @@
+'''
+An index of the symbols in every tree shown in an outline, for jumping to a symbol in any open file.
+The identifiers in each scope's name are indexed by a key, typically the id of the source buffer. The
+index is updated one tree at a time, when that tree is parsed again or dropped, so the cost of an
+update does not depend on how many other trees are indexed.
+'''
+from bisect import bisect_left
+from collections import namedtuple
+import re
+
+from SublimeScopeTree.lib.log import get_logger
+
+log = get_logger('lib.symbols')
+
+# A search result: the view a symbol is in, the source region of its scope, and the name of the scope
+Symbol = namedtuple('Symbol', ['view', 'region', 'name'])
+
+_identifier_pattern = re.compile(r'[A-Za-z_]\w*')
+
+# Words in names which are not worth searching for
+_ignored = frozenset([
+    'auto', 'bool', 'char', 'class', 'const', 'constexpr', 'double', 'enum', 'explicit', 'extern',
+    'float', 'friend', 'inline', 'int', 'long', 'namespace', 'operator', 'short', 'signed', 'static',
+    'struct', 'template', 'typename', 'union', 'unsigned', 'virtual', 'void', 'volatile',
+])
+
+def identifiers(name):
+    '''
+    Get the identifiers which can be searched for in a scope name. Parameter lists are left out, so
+    that searching for a type finds its scopes rather than every function taking it.
+    '''
+    name = name.split('(', 1)[0]
+    return [
+        word.lower() for word in _identifier_pattern.findall(name) if word not in _ignored
+    ]
+
+def is_subsequence(query, word):
+    position = 0
+    for char in query:
+        position = word.find(char, position) + 1
+        if not position:
+            return False
+    return True
+
+class SymbolIndex:
+    def __init__(self):
+        # Distinct identifiers, lower case and sorted, for prefix search
+        self._words = []
+
+        # Identifier => key => [(source region, name)]
+        self._postings = {}
+
+        # Key => (view, identifiers indexed for that key)
+        self._keys = {}
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._words)
+
+    def update(self, key, view, tree):
+        '''
+        Index the scopes of a tree under the given key, replacing anything indexed for that key.
+        '''
+        self.remove(key)
+
+        words = set()
+        for scope in tree.walk():
+            name = scope.name
+            entry = (scope.source_region(), name)
+            for word in identifiers(name):
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = {}
+                    self._words.insert(bisect_left(self._words, word), word)
+                postings.setdefault(key, []).append(entry)
+                words.add(word)
+
+        self._keys[key] = (view, words)
+        log.debug('Indexed {} symbols for {}', len(words), key)
+
+    def remove(self, key):
+        '''
+        Remove everything indexed under the given key.
+        '''
+        if key not in self._keys:
+            return
+
+        _, words = self._keys.pop(key)
+        for word in words:
+            postings = self._postings[word]
+            del postings[key]
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+        log.debug('Removed {} symbols for {}', len(words), key)
+
+    def search(self, query, limit=100):
+        '''
+        Get up to limit Symbols matching the query. Identifiers beginning with the query come first,
+        shortest first. If there are not enough of them, identifiers containing the characters of
+        the query in order follow.
+        '''
+        query = query.lower()
+        if not query:
+            return []
+
+        # Identifiers with the query as a prefix are together in sorted order
+        prefixed = []
+        index = bisect_left(self._words, query)
+        while index < len(self._words) and self._words[index].startswith(query):
+            prefixed.append(self._words[index])
+            index += 1
+        prefixed.sort(key=len)
+
+        words = prefixed
+        if self._count(words) < limit:
+            matched = set(prefixed)
+            words = prefixed + sorted(
+                (word for word in self._words if word not in matched and is_subsequence(query, word)),
+                key=len)
+
+        results = []
+        for word in words:
+            for key, entries in self._postings[word].items():
+                view = self._keys[key][0]
+                for region, name in entries:
+                    results.append(Symbol(view, region, name))
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def _count(self, words):
+        return sum(len(entries) for word in words for entries in self._postings[word].values())
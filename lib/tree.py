@@ -1,7 +1,10 @@
+from bisect import bisect_right
 import re
 
-from SublimeScopeTree.lib.display import DisplayRegion
-from SublimeScopeTree.lib.errors import ScopeIntersectError, ScopeNestingError, DuplicateScopeError, RenderError
+from SublimeScopeTree.lib.display import DisplayRegion, OffsetTable
+from SublimeScopeTree.lib.errors import ScopeError, ScopeIntersectError, ScopeNestingError, DuplicateScopeError, \
+    RenderError, FrozenTreeError, ParseCancelled
+from SublimeScopeTree.lib.kinds import classify
 from SublimeScopeTree.lib.log import get_logger
 from SublimeScopeTree.lib.settings import get_setting
 from SublimeScopeTree.lib.test import test_only
@@ -16,13 +19,67 @@ class ScopeTree:
     of scope. Each node is a region that exists at that level of scope. The tree supports insertion
     of new scopes from a source code region, and lookup of the region in the scratch view display
     which contains a given point (this is used for folding/unfolding regions in the output).
+
+    Once the tree has been rendered, each scope knows the rendered length of its subtree, and keeps
+    the lengths of its children in an OffsetTable. Display regions are worked out from these on
+    demand, so inserting, removing or renaming a scope only updates the lengths along its path to the
+    root, and display regions and find stay correct without rendering the whole tree again.
+
+    Each scope also keeps its rendered text, including everything nested in it, until it or one of
+    its descendants changes. Rendering after a small change renders only the scopes on the paths
+    from the changes to the root, and copies the text of the rest.
+
+    A tree can be changed in a new version (see edit), which shares its scopes with the old version
+    until they change. The old version is then never changed, so it can still be rendered and
+    searched, for instance by an outline showing it, while the new one is built.
     '''
 
     def __init__(self, view):
+        # Token marking the scopes of this version of the tree, which it may change in place. Other
+        # scopes are shared with older versions, and copied before they are changed. See edit.
+        self._owner = object()
+        self._frozen = False
+
         # Top level file scope
         self._root = FileScope(view, self)
+        self._source = view
         self._size = 0
         self._needs_render = True
+        self._expander = None
+
+        # True once the rendered lengths of the scopes are known, see render. Each change to the
+        # lengths starts a new layout, so that display regions worked out for an older one are
+        # worked out again. See Scope.display_region.
+        self._measured = False
+        self._layout = 0
+
+        # Continues the parse of this tree if it ran out of time, and tells how far it got, see resume
+        self._resume = None
+        self._progress = None
+
+        # Intern table for scope names. Generated code repeats the same prototypes many times, so
+        # scopes store an index into this table rather than a string of their own.
+        self._names = []
+        self._name_indices = {}
+
+        # Turns the source text of a name span into a name. See insert.
+        self._name_format = None
+
+        # Indent width the cached text of the scopes was rendered with, and the number of scopes
+        # rendered by the last render, see render
+        self._indent_width = None
+        self._rendered = 0
+
+        # Scopes in preorder, with the source offsets and parent of each, built when first needed
+        # after rendering. Scopes are nested, so preorder is also the order of their beginnings. See
+        # find_source.
+        self._preorder = None
+        self._begins = None
+        self._ends = None
+        self._parents = None
+
+        # Index for queries, built from the preorder arrays when first needed. See index.
+        self._index = None
 
     @test_only
     def __repr__(self):
@@ -62,41 +119,415 @@ class ScopeTree:
         return eq(self._root, other._root)
 
     def render(self):
+        '''
+        Get the text of the outline. Only scopes which changed since the last render, and the scopes
+        containing them, are rendered again; the cached text of the others is reused.
+        '''
+        indent_width = get_setting('indent_width')
+        if indent_width != self._indent_width:
+            # Every line but the top level ones changes
+            for scope in self.walk():
+                scope._text = None
+            self._root._text = None
+            self._indent_width = indent_width
+
+        if self._root._text is not None:
+            self._needs_render = False
+            self._rendered = 0
+            return self._root._text
+
+        # Scopes whose text is reused keep their old display regions until they are next asked for,
+        # and then work them out from the lengths
+        self._layout += 1
+        rendered = 0
+
         def _render(root, offset):
-            root.display_start(offset)
-            ret = root.render()
+            nonlocal rendered
+            if root._text is not None:
+                return root._text
+
+            rendered += 1
+            # Scopes shared with other versions may be displayed elsewhere in those, so only the
+            # scopes of this version keep their display regions
+            owned = root._owner is self._owner
+            if owned:
+                root.display_start(offset)
+            parts = [root.render(indent_width)]
+            offset += len(parts[0])
+            lengths = []
             for child in root.children:
-                ret += _render(child, offset + len(ret))
-            root.display_stop(offset + len(ret) - 1)
-            return ret
+                text = _render(child, offset)
+                parts.append(text)
+                lengths.append(len(text))
+                offset += len(text)
+
+            text = ''.join(parts)
+            root._text = text
+            root._length = len(text)
+            root._lengths = OffsetTable(lengths)
+            if owned:
+                root.display_stop(offset - 1)
+                root._placed = self._layout
+            return text
 
         ret = _render(self._root, 0)
+        log.debug('Rendered {} of {} scopes', rendered - 1, self._size)
+        self._rendered = rendered - 1
+        self._preorder = self._begins = self._ends = self._parents = None
+        self._index = None
         self._needs_render = False
+        self._measured = True
         return ret
 
+    def _build_preorder(self):
+        '''
+        Build the preorder arrays used by find_source and index, if they are out of date.
+        '''
+        if self._preorder is not None:
+            return
+
+        preorder, begins, ends, parents = [], [], [], []
+        def _walk(root, parent):
+            for child in root.children:
+                preorder.append(child)
+                begins.append(child.source_region().begin())
+                ends.append(child.source_region().end())
+                parents.append(parent)
+                _walk(child, len(preorder) - 1)
+
+        _walk(self._root, -1)
+        # Readers on other threads check _preorder, so it is set last
+        self._begins, self._ends, self._parents = begins, ends, parents
+        self._preorder = preorder
+
     def size(self):
         return self._size
 
-    def insert(self, region, name):
+    def rendered_count(self):
+        '''
+        Get the number of scopes rendered by the last render. The text of the others was reused.
+        '''
+        return self._rendered
+
+    def is_rendered(self):
+        '''
+        True if the display regions of the scopes are up to date with the tree.
+        '''
+        return not self._needs_render
+
+    def source(self):
+        '''
+        Get the view this tree was parsed from.
+        '''
+        return self._source
+
+    def source_size(self):
+        '''
+        Get the size of the source file this tree represents.
+        '''
+        return self._root.source_region().size()
+
+    def dump(self, path):
+        '''
+        Write the tree to a file in a compact binary format (see lib/serialize.py).
+        '''
+        from SublimeScopeTree.lib.serialize import dump
+        dump(self, path)
+
+    @staticmethod
+    def load(path, lazy=True):
+        '''
+        Read a tree written by dump. If lazy is True, only the top level scopes are read right away,
+        and other scopes are read when their parent is expanded.
+        '''
+        from SublimeScopeTree.lib.serialize import load
+        return load(path, lazy)
+
+    def intern(self, name):
+        '''
+        Get the index of the given name in this tree's name table, adding it if necessary.
+        '''
+        index = self._name_indices.get(name)
+        if index is None:
+            index = len(self._names)
+            self._names.append(name)
+            self._name_indices[name] = index
+        return index
+
+    def name_at(self, index):
+        return self._names[index]
+
+    def set_name_format(self, name_format):
+        '''
+        Register a function which turns the source text of a scope's name span into its name, for
+        scopes inserted with a name span rather than a name.
+        '''
+        self._name_format = name_format
+
+    def extract_name(self, span):
+        '''
+        Get the index in the name table of the name in the given region of the source.
+        '''
+        name = self._source.substr(span)
+        if self._name_format:
+            name = self._name_format(name)
+        return self.intern(name)
+
+    def names(self):
+        '''
+        Get the distinct names of the scopes in this tree.
+        '''
+        return self._names
+
+    def index(self):
+        '''
+        Get the ScopeIndex used to evaluate queries on this tree (see lib/query.py). The tree must
+        have been rendered. The index is built once per render.
+        '''
+        if self._needs_render:
+            raise RenderError('Must render tree before querying it')
+        if self._index is None:
+            from SublimeScopeTree.lib.query import ScopeIndex
+            self._build_preorder()
+            self._index = ScopeIndex(self, self._preorder, self._begins, self._ends, self._parents)
+        return self._index
+
+    def query(self, query):
+        '''
+        Get the scopes matching a Query, in preorder.
+        '''
+        return query.scopes(self.index())
+
+    def filter(self, query):
+        '''
+        Get a new tree containing only the scopes matching a Query, and their ancestors.
+        '''
+        return query.filter(self.index())
+
+    def kind_regions(self):
+        '''
+        Get the regions of the rendered tree showing the names of the scopes of each kind, as a dict
+        from kind (see lib/kinds.py) to a list of regions, for coloring an outline by kind. The tree
+        must have been rendered.
+        '''
+        # The rendered tree is the text of each scope in preorder: its indent, then its name, which
+        # may span several lines, then a newline
+        index = self.index()
+        regions = {}
+        offset = 0
+        for scope, depth, kind in zip(index.scopes, index.depths, index.kinds):
+            begin = offset + depth * self._indent_width
+            offset = begin + len(scope.name) + 1
+            regions.setdefault(kind, []).append(Region(begin, offset - 1))
+        return regions
+
+    def top_level_scopes(self):
+        return self._root.children
+
+    def walk(self):
+        '''
+        Generate every scope in the tree (excluding the file-level scope) in preorder.
+        '''
+        return self._walk_from(self._root)
+
+    def set_expander(self, expander):
+        '''
+        Register a callback which parses the children of a lazily parsed scope. The callback is
+        given this tree and the scope to expand, and is expected to insert that scope's children
+        into the tree.
+        '''
+        self._expander = expander
+
+    def expand(self, scope):
+        '''
+        Parse the children of a scope that was inserted unexpanded. Returns True if the tree changed
+        as a result, in which case it must be rendered again. The results are kept in the tree, so
+        each scope is only ever expanded once. If the expander raises ParseCancelled, the scope stays
+        unexpanded.
+        '''
+        if scope.is_expanded():
+            return False
+
+        # The scope may be from an older version of the tree, which expanded it only in this one
+        self._check_mutable()
+        path = self._path(scope)
+        if path is None or path[-1].is_expanded():
+            return False
+        scope = self._path(scope, own=True)[-1]
+
+        log.info('Expanding lazily parsed scope {}', scope.name)
+        assert self._expander, 'Unexpanded scope in tree without an expander'
+
+        # Mark the scope before calling the expander, so that a scope with no children is not parsed
+        # again the next time it is expanded.
+        scope._expanded = True
+        size = self._size
+        try:
+            self._expander(self, scope)
+        except ParseCancelled:
+            # The expander can't parse the scope any more, like when its source has changed
+            scope._expanded = False
+            raise
+        return self._size != size
+
+    def is_complete(self):
+        '''
+        False if the parse of this tree ran out of time, and only some of its scopes are in the tree.
+        '''
+        return self._resume is None
+
+    def set_resume(self, resume, progress=None):
+        '''
+        Register a callback which continues the parse of an incomplete tree. The callback is given
+        this tree and a budget in milliseconds (or None), and inserts more scopes into the tree,
+        setting a new callback if it runs out of time again, or None once the tree is complete. If
+        given, progress is called with no arguments to get the fraction of the parse done so far.
+        '''
+        self._resume = resume
+        self._progress = progress
+
+    def progress(self):
+        '''
+        Get the fraction of the parse of this tree which is done, or None if the parser can't tell.
+        '''
+        if self._resume is None:
+            return 1.0
+        return self._progress() if self._progress else None
+
+    def resume(self, budget=None):
+        '''
+        Continue parsing an incomplete tree, for about budget milliseconds, or until it is done if
+        budget is None. Returns True once the tree is complete. The tree must be rendered again.
+        '''
+        if self._resume is None:
+            return True
+
+        self._check_mutable()
+        log.info('Resuming parse of incomplete tree with {} scopes', self._size)
+        self._resume(self, budget)
+        return self._resume is None
+
+    def edit(self):
+        '''
+        Get a new version of this tree, which can be changed without changing this one. The versions
+        share their scopes, and a scope is copied, with the scopes containing it, only when it is
+        first changed in the new version. This version can't be changed any more, but it can still be
+        rendered and searched.
+        '''
+        self._frozen = True
+
+        version = ScopeTree.__new__(ScopeTree)
+        version.__dict__.update(self.__dict__)
+        version._owner = object()
+        version._frozen = False
+        version._root = version._copy(self._root)
+        version._preorder = version._begins = version._ends = version._parents = None
+        version._index = None
+        log.debug('New version of tree with {} scopes', self._size)
+        return version
+
+    def _check_mutable(self):
+        if self._frozen:
+            raise FrozenTreeError('Cannot change a tree with newer versions; change a new version instead')
+
+    def _copy(self, scope):
+        '''
+        Copy a scope of another version into this one. The copy shares the children of the scope.
+        '''
+        copy = Scope.__new__(type(scope))
+        copy.__dict__.update(scope.__dict__)
+        copy.children = list(scope.children)
+        if scope._lengths is not None:
+            copy._lengths = scope._lengths.copy()
+        copy._display_region = DisplayRegion(None, None, copy)
+        copy._placed = None
+        copy._parent = self
+        copy._owner = self._owner
+        return copy
+
+    def _own(self, scope):
+        '''
+        Get a scope which this version may change in place: the scope itself if it belongs to this
+        version, or else a copy, which the caller must put in its place.
+        '''
+        return scope if scope._owner is self._owner else self._copy(scope)
+
+    def _own_child(self, scope, index):
+        '''
+        Replace the child at the given index of a scope of this version by a copy, if it is shared.
+        '''
+        child = scope.children[index]
+        if child._owner is not self._owner:
+            child = scope.children[index] = self._copy(child)
+            child._outer = scope
+        return child
+
+    def _path(self, scope, own=False):
+        '''
+        Get the scopes from the root down to the scope of this tree with the same source region as
+        the given one, or None if there is no such scope. If own is True, scopes on the path which
+        are shared with other versions are replaced by copies first, so that they can be changed.
+        '''
+        if scope._owner is self._owner:
+            # The scopes containing a scope of this version are all of this version too, so we can
+            # follow the scopes they are nested in up to the root
+            path = [scope]
+            while path[-1]._outer is not None:
+                path.append(path[-1]._outer)
+            path.reverse()
+            return path if path[0] is self._root else None
+
+        region = scope.source_region()
+        path = [self._root]
+        root = self._root
+        while True:
+            index = root.find_child(scope, Scope.source_region)
+            if index == len(root.children) or not root.children[index].contains(scope, Scope.source_region):
+                return None
+            root = self._own_child(root, index) if own else root.children[index]
+            path.append(root)
+            if root.source_region() == region:
+                return path
+
+    def _reindent(self, scope):
         '''
-        Insert a new node with the given region and identifier.
+        Set the depth of everything nested in a scope from the depth of the scope. Shared scopes are
+        copied, since their depth changes.
         '''
-        def _insert(root, child):
+        for index in range(len(scope.children)):
+            child = self._own_child(scope, index)
+            child._indent = scope._indent + 1
+            child._text = None
+            self._reindent(child)
+
+    def insert(self, region, name, expanded=True, kind=None, definition=None):
+        '''
+        Insert a new node with the given region and identifier. If expanded is False, the children
+        of the new node have not been parsed yet; see expand.
+
+        The name may be a region of the source instead of a string, in which case it is only read
+        from the source, and formatted (see set_name_format), when it is first needed, typically
+        when rendering. Parsers should give the kind of the scope (see lib/kinds.py) and whether it
+        is a definition or only a declaration, if they know.
+        '''
+        def _insert(root, child, path):
             log.info('Inserting {} as a descendant of {}', child, root)
 
             assert root
+            path.append(root)
             children, index = root.children, root.find_child(child, Scope.source_region)
             if index < len(children):
                 log.info('Insertion point is in place of {} at position {}.', children[index], index)
                 if children[index].source_region() == child.source_region():
                     raise DuplicateScopeError(child, children[index])
                 elif children[index].contains(child, Scope.source_region):
-                    _insert(children[index], child)
-                    return
+                    return _insert(self._own_child(root, index), child, path)
                 elif child.contains(children[index], Scope.source_region):
                     # Add the new child where children[index] was. Children[index] becomes a child
                     # of the newly added scope.
-                    child.add_child(children[index])
+                    child._outer = root
+                    child._indent = 0 if root is self._root else root._indent + 1
+                    child.add_child(self._own(children[index]))
                     children[index] = child
 
                     # The new scope may contain a range of children. We have to find all of these,
@@ -106,7 +537,7 @@ class ScopeTree:
                     while pre >= 0 and child.contains(children[pre], Scope.source_region):
                         # Since the old list is sorted, each previous child will be the first in the
                         # new list, so we add at index 0.
-                        child.add_child(children[pre], 0)
+                        child.add_child(self._own(children[pre]), 0)
                         children.pop(pre)
                         pre -= 1
                         new_children += 1
@@ -115,51 +546,209 @@ class ScopeTree:
                     while post < len(children) and child.contains(children[post], Scope.source_region):
                         # Since the old list is sorted, each post child will be the last in the
                         # new list, so we add at the end of that list.
-                        child.add_child(children[post], len(child.children))
+                        child.add_child(self._own(children[post]), len(child.children))
                         children.pop(post)
                         # No need to increment post, since pop will shift all of the indices by 1
                         new_children += 1
 
+                    # The scopes taken over are now one level deeper, and so is everything in them
+                    self._reindent(child)
+
                     log.info('Inserted {new} in place of {old}, {num} scopes added as children of {new}',
                              new=child, old=children[index], num=new_children)
-                    return
+                    return path
 
             root.add_child(child, index)
             log.info('Inserted {} as child of {}', child, root)
+            return path
 
-        child = Scope(region, name)
+        self._check_mutable()
+
+        # Invalidate the display before inserting, since the new scope has no display region yet
+        self._needs_render = True
+
+        child = Scope(region, name if isinstance(name, Region) else self.intern(name), parent=self,
+            kind=kind, definition=definition)
+        child._expanded = expanded
         log.debug('Inserting {} from top level.', child)
-        _insert(self._root, child)
+        path = _insert(self._root, child, [])
+        parent = path[-1]
         self._size += 1
+        self._invalidate(path)
+
+        if self._measured:
+            # Only the new scope and the scopes it took over from its parent need measuring. Taking
+            # over scopes changes their depth, and so the length of every line below them.
+            length = self._measure(child)
+            before = parent._length
+            line = before - parent._lengths.total()
+            if parent.children[-1] is child and len(parent._lengths) == len(parent.children) - 1:
+                parent._lengths.append(length)
+            else:
+                parent._lengths = OffsetTable(scope._length for scope in parent.children)
+            parent._length = line + parent._lengths.total()
+            self._resize(path, parent._length - before)
+
+    def remove(self, scope):
+        '''
+        Remove a scope, and everything nested in it, from the tree.
+        '''
+        self._check_mutable()
+        path = self._path(scope, own=True)
+        if path is None:
+            raise ScopeError('Scope {} is not in this tree.', scope)
+        scope = path.pop()
+        outer = path[-1]
+        index = outer.find_child(scope, Scope.source_region)
+        outer.children.pop(index)
+        self._size -= 1 + sum(1 for _ in self._walk_from(scope))
         self._needs_render = True
+        self._invalidate(path)
+        log.debug('Removed {} from {}', scope, outer)
+
+        if self._measured:
+            before = outer._length
+            line = before - outer._lengths.total()
+            if index == len(outer.children):
+                outer._lengths.pop()
+            else:
+                outer._lengths = OffsetTable(child._length for child in outer.children)
+            outer._length = line + outer._lengths.total()
+            self._resize(path, outer._length - before)
 
-    def find(self, point):
+    def rename(self, scope, name):
         '''
-        Return the smallest display region containing the given point, or None if no region contains
-        the point.
+        Rename a scope of this version of the tree. Unlike setting the name of the scope, this works
+        for scopes shared with older versions, which are copied first.
         '''
-        def _find(root, target):
-            log.info('Looking for {} as a child of {}', target, root)
+        self._check_mutable()
+        path = self._path(scope, own=True)
+        if path is None:
+            raise ScopeError('Scope {} is not in this tree.', scope)
+        path[-1].name = name
 
-            if root is None or not root.contains(target, Scope.display_region):
-                return None
+    def _invalidate(self, path):
+        '''
+        Drop the cached text of the last scope of a path from the root, which changed, and of the
+        scopes containing it. A scope without cached text never has an ancestor with cached text,
+        so we can stop at the first one.
+        '''
+        for scope in reversed(path):
+            if scope._text is None:
+                break
+            scope._text = None
+
+    def _walk_from(self, root):
+        for child in root.children:
+            yield child
+            yield from self._walk_from(child)
+
+    def _measure(self, scope):
+        '''
+        Work out the rendered lengths of a scope and everything nested in it. Returns the length of
+        the scope.
+        '''
+        for child in scope.children:
+            self._measure(child)
+        scope._lengths = OffsetTable(child._length for child in scope.children)
+        scope._length = scope.line_length() + scope._lengths.total()
+        return scope._length
+
+    def _resize(self, path, delta):
+        '''
+        Update the lengths of the scopes containing the last scope of a path from the root, whose
+        length changed by delta.
+        '''
+        self._needs_render = True
+        self._layout += 1
+        if not delta:
+            return
+        for index in range(len(path) - 1, 0, -1):
+            outer = path[index - 1]
+            outer._lengths.add(outer.find_child(path[index], Scope.source_region), delta)
+            outer._length += delta
+
+    def display_begin(self, scope):
+        '''
+        Get the offset in the rendered tree at which a scope begins, from the lengths of the scopes
+        before it.
+        '''
+        path = self._path(scope)
+        if path is None:
+            raise RenderError('Scope {} is not in this tree', scope.source_region())
 
-            # Now we have to find it somewhere
-            children, index = root.children, root.find_child(target, Scope.display_region)
-            if index < len(children) and children[index].contains(target, Scope.display_region):
-                return _find(children[index], target)
+        begin = 0
+        for outer, scope in zip(path, path[1:]):
+            begin += outer._length - outer._lengths.total() \
+                + outer._lengths.offset(outer.find_child(scope, Scope.source_region))
+        return begin
 
-            # Couldn't find it in a child, so the root is as deep as we can go
-            log.info('Successful find: {} is a child of {}', target, root)
-            return root
+    def display_region(self, scope):
+        '''
+        Get the display region of a scope in this version of the tree. A scope shared with other
+        versions may be displayed elsewhere in those, so its region is worked out each time rather
+        than kept in the scope.
+        '''
+        if scope._owner is self._owner:
+            return scope.display_region()
+        if not self._measured:
+            raise RenderError('Must render tree before calculating display regions')
+        begin = self.display_begin(scope)
+        return DisplayRegion(begin, begin + scope._length - 1, scope)
 
-        target = Point(point)
-        log.debug('Searching for {} at top level.', target)
-        child = _find(self._root, target)
-        if not child or child == self._root:
+    def find(self, point):
+        '''
+        Return the smallest display region containing the given point, or None if no region contains
+        the point.
+        '''
+        scope = self.find_scope(point)
+        return self.display_region(scope) if scope else None
+
+    def find_scope(self, point):
+        '''
+        Return the innermost scope whose display region contains the given point, or None if no
+        scope contains the point.
+        '''
+        if not self._root.children:
+            return None
+        if not self._measured:
+            raise RenderError('Must render tree before searching display regions')
+
+        # Walk down from the root, using the lengths of each scope's children to find the child
+        # spanning the point, until the point is on the line of the scope itself.
+        log.debug('Searching for {} at top level.', point)
+        scope, begin = self._root, 0
+        while True:
+            line = scope._length - scope._lengths.total()
+            index = scope._lengths.find(point - begin - line)
+            if point - begin < line or index == len(scope.children):
+                break
+            begin += line + scope._lengths.offset(index)
+            scope = scope.children[index]
+
+        if scope is self._root:
             # We pretend the file-level scope doesn't exist
             return None
-        return child.display_region()
+        log.info('Successful find: {} contains {}', scope, point)
+        if scope._owner is self._owner:
+            scope.place(begin)
+        return scope
+
+    def find_source(self, point):
+        '''
+        Return the innermost scope whose source region contains the given point, or None if no
+        scope contains the point. The tree must have been rendered.
+        '''
+        if self._needs_render:
+            raise RenderError('Must render tree before searching source regions')
+
+        # The last scope beginning before the point contains it if any scope does, unless it ends
+        # before the point, in which case one of its ancestors might.
+        self._build_preorder()
+        index = bisect_right(self._begins, point) - 1
+        while index >= 0 and self._ends[index] < point:
+            index = self._parents[index]
+        return self._preorder[index] if index >= 0 else None
 
     @test_only
     def set_top_level_scopes(self, *scopes):
@@ -167,7 +756,9 @@ class ScopeTree:
             scopes = scopes[0]
 
         self._root.children = []
+        self._root._text = None
         self._size = 0
+        self._measured = False
         for scope in scopes:
             if not isinstance(scope, Scope):
                 raise TypeError('Root of tree must be of type Scope')
@@ -178,6 +769,7 @@ class ScopeTree:
         # Since we're going over the tree anyways, we add up the size as we go
         def _set_parent(root):
             root._parent = self
+            root._owner = self._owner
             for child in root.children:
                 self._size += 1
                 _set_parent(child)
@@ -193,29 +785,120 @@ class Scope:
     which is sorted in the same order as the scopes appear in the source. Each node knows about its
     region in the source code, and its region when displayed to the user in a scratch view.
     '''
-    def __init__(self, region, name, parent=None):
+    def __init__(self, region, name, parent=None, kind=None, definition=None):
         '''
         Create a new node with the given scope region. Offset is the position in the scratch view at
         which the node should start displaying itself and its children. Name should be the
-        identifier of the scope, for example, a class declaration or a function signature.
+        identifier of the scope, for example, a class declaration or a function signature. Scopes
+        created by a ScopeTree are given the index of their name in the tree's name table instead,
+        or the region of their name in the source, which is replaced by the index once it is read.
         '''
         self.children = []
-        self.name = name
+        self._name = name
+        self._kind = kind
+        self._definition = definition
 
         self._parent = parent
         self._region = region
         self._indent = 0
+        self._expanded = True
 
-        # Display region bounds
+        # The version of the tree which may change this scope in place, see ScopeTree.edit
+        self._owner = parent._owner if parent is not None else None
+
+        # The scope this one is nested in, which is the file-level scope for top level scopes. A
+        # scope shared by several versions is nested in a different copy of its parent in each, so
+        # this is only kept up to date in the version which owns the scope.
+        self._outer = None
+
+        # Rendered length of this scope and everything nested in it, and the lengths of the
+        # children, once the tree has been rendered. See ScopeTree.render.
+        self._length = None
+        self._lengths = None
+
+        # Rendered text of this scope and everything nested in it, or None if it changed since the
+        # tree was last rendered
+        self._text = None
+
+        # Display region bounds, and the layout of the tree they were worked out for
         self._display_region = DisplayRegion(None, None, self)
+        self._placed = None
 
     def __eq__(self, other):
         if not isinstance(other, Scope):
             return False
 
+        if self.source_region() != other.source_region():
+            return False
+
         # We don't need to compare display regions; if the name and source regions are the same,
-        # so will be the display regions.
-        return self.name == other.name and self.source_region() == other.source_region()
+        # so will be the display regions. Names interned in the same tree are equal if their
+        # indices are.
+        if type(self._name) == type(other._name) == int and self._parent is other._parent:
+            return self._name == other._name
+        return self.name == other.name
+
+    @property
+    def name(self):
+        if type(self._name) == int:
+            return self._parent.name_at(self._name)
+        if isinstance(self._name, Region):
+            return self._parent.name_at(self.name_index())
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        tree = self._parent
+        if tree is not None:
+            tree._check_mutable()
+        measured = tree is not None and tree._measured and self._length is not None
+        if measured:
+            before = self._length - self._lengths.total()
+
+        if type(self._name) == int or isinstance(self._name, Region):
+            self._name = tree.intern(name)
+        else:
+            self._name = name
+
+        if tree is not None:
+            path = tree._path(self) or [self]
+            tree._invalidate(path)
+        if measured:
+            delta = self.line_length() - before
+            self._length += delta
+            tree._resize(path, delta)
+
+    def name_index(self):
+        '''
+        Get the index of this scope's name in its tree's name table.
+        '''
+        if isinstance(self._name, Region):
+            self._name = self._parent.extract_name(self._name)
+        elif type(self._name) != int:
+            return self._parent.intern(self._name)
+        return self._name
+
+    def name_span(self):
+        '''
+        Get the region of the source containing this scope's name, if it has not been read yet.
+        '''
+        return self._name if isinstance(self._name, Region) else None
+
+    def kind(self):
+        '''
+        Get the kind of this scope (see lib/kinds.py). If the parser didn't give one, it is guessed
+        from the name.
+        '''
+        if self._kind is None:
+            self._kind = classify(self.name)
+        return self._kind
+
+    def is_definition(self):
+        '''
+        True if this scope is a definition, False if it is only a declaration, or None if the parser
+        didn't say.
+        '''
+        return self._definition
 
     def __repr__(self):
         # Give as much information as we can
@@ -223,9 +906,11 @@ class Scope:
         if self._parent and not self._parent._needs_render:
             display_diag = repr(self.display_region())
 
-        # Render and append diagnostic information to the end of the line
+        # Render and append diagnostic information to the end of the line. We don't read a name from
+        # the source just to log it, though.
+        rendered = self.render() if self.name_span() is None else 'name at {}\n'.format(self.name_span())
         return re.sub(r'\n$', ' {{source={source}, display={display}}}\n'.format(
-            source=repr(self.source_region()), display=display_diag), self.render())
+            source=repr(self.source_region()), display=display_diag), rendered)
 
     def add_child(self, child, index=None):
         '''
@@ -234,6 +919,7 @@ class Scope:
         index = index or self.find_child(child, Scope.source_region)
         child._indent = self._indent + 1
         child._parent = self._parent
+        child._outer = self
 
         self.validate_insert(index, child)
         self.children.insert(index, child)
@@ -258,6 +944,18 @@ class Scope:
         # We couldn't find the child. Return the insertion point instead
         return start
 
+    def depth(self):
+        '''
+        Get the nesting level of this scope. Top level scopes have depth 0.
+        '''
+        return self._indent
+
+    def is_expanded(self):
+        '''
+        False if this scope was lazily parsed and its children have not been parsed yet.
+        '''
+        return self._expanded
+
     def source_region(self):
         '''
         Get the region in the source code represented by this node
@@ -270,14 +968,33 @@ class Scope:
         '''
         if not self._parent:
             raise RenderError('Must set parent before calculating display region')
-        if self._parent._needs_render:
+        if not self._parent._measured:
             raise RenderError('Must render parent before caclulating display region')
 
+        # The tree changed since this region was worked out, so the scopes before this one may not
+        # have the same lengths any more
+        if self._placed != self._parent._layout:
+            self.place(self._parent.display_begin(self))
+
         # If the preconditions are met, we should have a valid region
         assert self._display_region.begin() is not None and self._display_region.end() is not None
 
         return self._display_region
 
+    def place(self, begin):
+        '''
+        Set the display region of this scope to begin at the given offset, in the current layout.
+        '''
+        self._display_region.set_begin(begin)
+        self._display_region.set_end(begin + self._length - 1)
+        self._placed = self._parent._layout
+
+    def line_length(self):
+        '''
+        Get the length of the line showing this scope when rendered.
+        '''
+        return len(self.render())
+
     def validate_insert(self, index, child):
         '''
         Do some error checking
@@ -321,8 +1038,14 @@ class Scope:
         log.debug('{name}: end display region at {offset}', name=self.name, offset=offset)
         self._display_region.set_end(offset)
 
-    def render(self):
-        return ' '*self._indent*get_setting('indent_width') + self.name + '\n'
+    def render(self, indent_width=None):
+        '''
+        Get the line showing this scope in the outline. The indent width is read from the settings if
+        it isn't given.
+        '''
+        if indent_width is None:
+            indent_width = get_setting('indent_width')
+        return ' '*self._indent*indent_width + self.name + '\n'
 
 class FileScope(Scope):
     '''
@@ -335,13 +1058,14 @@ class FileScope(Scope):
     def __repr__(self):
         return ''
 
-    def render(self):
+    def render(self, indent_width=None):
         return ''
 
     def add_child(self, child, index=None):
         index = index or self.find_child(child, Scope.source_region)
         child._indent = 0
         child._parent = self._parent
+        child._outer = self
 
         self.validate_insert(index, child)
         self.children.insert(index, child)
@@ -349,6 +1073,9 @@ class FileScope(Scope):
     def contains(self, *_):
         return True
 
+    def line_length(self):
+        return 0
+
     def display_start(self, offset):
         pass
     def display_stop(self, offset):
@@ -1,2 +1,4 @@
 import SublimeScopeTree.parsers.cpp
 import SublimeScopeTree.parsers.mock
+import SublimeScopeTree.parsers.cpp_text
+import SublimeScopeTree.parsers.generic
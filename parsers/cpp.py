@@ -1,57 +1,93 @@
+from bisect import bisect_left, bisect_right
 import itertools
-import re
 
-from SublimeScopeTree.lib.errors import ParseError, ScopeError
+from SublimeScopeTree.lib.errors import ParseCancelled, ParseError, ScopeError
+from SublimeScopeTree.lib.kinds import FUNCTION, OTHER
 from SublimeScopeTree.lib.log import get_logger
 from SublimeScopeTree.lib.parse import Parser, register_parser
 from SublimeScopeTree.lib.tree import ScopeTree
+from SublimeScopeTree.parsers.cpp_lexer import CppTokens, format_name
 
 from sublime import Region, CLASS_LINE_START, CLASS_LINE_END
 
 log = get_logger('parsers.C++')
 
 class CppParser(Parser):
+    selector_types = [
+        'meta.class',
+        'meta.struct',
+        'meta.namespace',
+        'meta.function',
+        'meta.method'
+    ]
+
     def __init__(self, view):
         Parser.__init__(self, view)
         self.tree = ScopeTree(view)
+        self.tree.set_name_format(format_name)
         self.view = view
+        self.text = view.text()
+        self.tokens = CppTokens(self.text)
+
+        # Scopes found at each selector depth, memoized for lazy expansion
+        self._scopes_at_depth = {}
 
     def parse(self):
         log.debug('Parsing view {} as C++', self.view.id())
-        for scope in self.find_scopes():
-            region, name = self.describe(scope)
-            log.debug('Inserting region {} {}', name, region)
+        self._pending = self.find_scopes(), True
+        return self.resume()
+
+    def parse_lazy(self):
+        log.debug('Lazily parsing top level of view {} as C++', self.view.id())
+        self.tree.set_expander(self.expand)
+        self._pending = iter(self.scopes_at_depth(1)), False
+        return self.resume()
+
+    def resume(self):
+        # The scopes not inserted yet, and whether to insert them expanded
+        scopes, expanded = self._pending
+        self.insert_scopes(scopes, expanded=expanded, deadline=True)
+        return self.tree
+
+    def expand(self, tree, scope):
+        '''
+        Parse the scopes one level below the given scope. They are inserted unexpanded, so that
+        their own children are parsed only once they are expanded in turn.
+        '''
+        region = scope.source_region()
+        candidates = self.scopes_at_depth(scope.depth() + 2)
+
+        # Candidates are in source order, so we can bisect for the ones within the scope
+        begins = [candidate.begin() for candidate in candidates]
+        first = bisect_left(begins, region.begin())
+        last = bisect_right(begins, region.end())
+        log.debug('Expanding {} with {} scopes at depth {}', scope.name, last - first, scope.depth() + 2)
+
+        self.insert_scopes(candidates[first:last], expanded=False, tree=tree)
+
+    def insert_scopes(self, scopes, expanded=True, tree=None, deadline=False):
+        '''
+        Describe and insert the given scopes. If deadline is True, stop when the parse runs out of
+        time. The deadline is checked after each insertion, so that every scope taken from the
+        iterator is in the tree, and the rest of the iterator can be inserted by resume. The time
+        taken to find and describe the next scope counts towards the deadline at the next check.
+        '''
+        tree = tree or self.tree
+        for scope in scopes:
+            self.check_cancelled()
+            region, name, kind, definition = self.describe(scope)
+            log.debug('Inserting region {} named {}', region, name)
             try:
-                self.tree.insert(region, name)
+                tree.insert(region, name, expanded=expanded, kind=kind, definition=definition)
             except ScopeError as err:
                 raise ParseError(self.view, region, repr(err))
-        return self.tree
+            if deadline:
+                self.check_deadline()
 
     def find_scopes(self):
-        selector_types = [
-            'meta.class',
-            'meta.struct',
-            'meta.namespace',
-            'meta.function',
-            'meta.method'
-        ]
-
         for depth in itertools.count(1):
-            # Asking for a single selector only gives us scopes of that type at the top level. To
-            # get nested scopes, we have to generate a selector of the form '{type1} ... type{n}'
-            # at every depth n. Furthermore, we have s^n of these selectors where s is the number
-            # of types; ie 'meta.class meta.function' picks member functions, while
-            # 'meta.class meta.class' picks nested classes. We thus take the set S x S x ... S,
-            # where S is the set of selector types, and we join its elements to form the
-            # comma-separated selector. We do this at increasing depth until we reach a depth which
-            # has no more scopes.
-            nested_selectors = ','.join([
-                ' '.join(selector) for selector in itertools.product(selector_types, repeat=depth)
-            ])
-            log.debug('Searching depth {} with selector {}', depth, nested_selectors)
-
             count = 0
-            for scope in self.view.find_by_selector(nested_selectors):
+            for scope in self.scopes_at_depth(depth):
                 count  += 1
                 yield scope
 
@@ -61,82 +97,93 @@ class CppParser(Parser):
             else:
                 log.info('Found {} scopes at depth {}.', count, depth)
 
+    def scopes_at_depth(self, depth):
+        if depth in self._scopes_at_depth:
+            return self._scopes_at_depth[depth]
+
+        # Lazily parsed scopes are expanded long after the parse. If the buffer was edited since,
+        # the view would find scopes at new offsets, which don't match our text or tree.
+        if not self.view.is_current():
+            raise ParseCancelled('View {} changed since it was parsed', self.view.id())
+
+        # Asking for a single selector only gives us scopes of that type at the top level. To get
+        # nested scopes, we have to generate a selector of the form '{type1} ... type{n}' at every
+        # depth n. Furthermore, we have s^n of these selectors where s is the number of types; ie
+        # 'meta.class meta.function' picks member functions, while 'meta.class meta.class' picks
+        # nested classes. We thus take the set S x S x ... S, where S is the set of selector types,
+        # and we join its elements to form the comma-separated selector. We do this at increasing
+        # depth until we reach a depth which has no more scopes.
+        nested_selectors = ','.join([
+            ' '.join(selector) for selector in itertools.product(self.selector_types, repeat=depth)
+        ])
+        log.debug('Searching depth {} with selector {}', depth, nested_selectors)
+
+        scopes = self.view.find_by_selector(nested_selectors)
+        self._scopes_at_depth[depth] = scopes
+        return scopes
+
     def describe(self, region):
-        region = self.expand_to_scope(region)
-        return region, self.extract_name(region)
+        '''
+        Get the region of the scope found by a selector, the region of its name, its kind, and
+        whether it is a definition. The name itself is read from the view when it is needed.
+        '''
+        region, kind, definition = self.expand_to_scope(region)
+        return region, self.name_span(region), kind, definition
 
     def expand_to_scope(self, region):
         if self.view.score_selector(region.begin(), 'meta.function,meta.method') > 0:
             # Sublime gives us a region starting from the name of the function, not the return type.
-            # We need to expand backwards to get the full prototype. We stop looking when we get to:
-            search_terms = '(' + '|'.join([
-                r';',                           # The end of a previous declaration, class, etc.
-                r'}',                           # The end of a previous function or namespace
-                r'{',                           # The beginning of a containing, class, struct, etc.
-                r'\*/',                         # The end of a multiline comment
-                r'//.*',                        # A comment
-                r'(^|\n)\s*#.*',                # A preprocessor directive
-                r'(public|private|protected):', # An access specifier
-            ]) + ')'
-
-            # Eat all whitespace between the thing we matched and the start of the prototype
-            eat_whitespace = r'[\s\n]*'
-
-            # Our "backwards" search consists of finding all matches in forwards order and taking
-            # the last one.
+            # We need to expand backwards to get the full prototype. We stop looking at the end of a
+            # previous declaration or block, the beginning of a containing block, a comment, a
+            # preprocessor directive or an access specifier.
             log.debug('Back-searching for beginning of prototype {}',
                 self.view.substr(self.view.line(region.begin())))
-            matches = re.finditer(search_terms + eat_whitespace, self.view.substr(Region(0, region.begin())))
-
-            # Find the location of the last match, or beginning of file if no matches.
-            start = 0
-            matched_string = ''
-            for match in matches:
-                start = match.end()
-                matched_string = match.group()
-
-            if matched_string:
-                log.debug('Prototype back-search concluded with string "{}".', matched_string)
+            start = self.tokens.prototype_start(region.begin())
 
             # Now we have a region including the prototype. We need to expand forwards to include
             # the block, or the semicolon for a declaration.
             log.debug('Searching for function definition or end of declaration.')
-            match = re.search(r';|{', self.view.substr(Region(region.begin(), self.view.size())))
-            if not match:
+            token = self.tokens.next(region.begin(), ';', '{')
+            if not token:
                 raise ParseError(self.view, region, 'Expected ; or {.')
-            end = region.begin() + match.end()
-            if match.group() == '{':
-                end = self.view.extract_scope(end).end()
+            end = token.end
+            if token.value == '{':
+                end = self.block_end(token.start)
 
-            return Region(start, end)
+            return Region(start, end), FUNCTION, token.value == '{'
         else:
-            region = self.view.extract_scope(region.begin())
-            if self.view.substr(Region(region.end(), region.end() + 1)) == ';':
-                return Region(region.begin(), region.end() + 1)
+            # The scope ends with the block after its name, if it has one
+            token = self.tokens.next(region.begin(), ';', '{')
+            if token and token.value == '{':
+                region = Region(region.begin(), self.block_end(token.start))
+            else:
+                region = self.view.extract_scope(region.begin())
+            kind = self.tokens.kind(region.begin())
+            if kind is None:
+                kind = OTHER
+            # Only a scope with a block is a definition, not a forward declaration like class a;
+            definition = token is not None and token.value == '{'
+            if self.text[region.end():region.end() + 1] == ';':
+                return Region(region.begin(), region.end() + 1), kind, definition
             else:
-                return region
-
-    def extract_name(self, region):
-        # From the start of the declaration/prototype, scan forward looking for the end of the
-        # statement or the start of a block. The capture groups indicate the last character that
-        # should be part of the name. For example, we include the semicolon to indicate that the
-        # scope is a declaration only.
-        match = re.search(r'(;)|(){|([^:]):[^:]',
-            self.view.substr(Region(region.begin(), self.view.size())))
-        if not match:
+                return region, kind, definition
+
+    def block_end(self, point):
+        '''
+        Get the end of the block opened by the { at the given point. Blocks are matched by the
+        tokenizer rather than the syntax, unless the brace is never closed, in which case we ask the
+        view where the syntax thinks the block ends.
+        '''
+        end = self.tokens.block_end(point)
+        if end is None:
+            log.debug('No } matching {{ at {}', point)
+            end = self.view.extract_scope(point + 1).end()
+        return end
+
+    def name_span(self, region):
+        end = self.tokens.name_end(region.begin())
+        if end is None:
             raise ParseError(self.view, region, 'Expected ;, {, or :.')
-        groups = sum([0 if group is None else 1 for group in match.groups()])
-        assert groups == 1, 'Matched {} subgroups. Expected exactly 1.'.format(groups)
-
-        end = region.begin() + match.end(match.lastindex)
-        name = self.view.substr(Region(region.begin(), end))
-        name = name.strip()
-
-        # We don't want to mess up the user's text wrapping, since the names might be very long.
-        # However, since newlines in a ScopeTree typically indicate nested scopes, we'll make it
-        # clear that the line is continuing by inserting a backslash.
-        name = re.sub(r'\s*\n', ' \\\n', name)
-
-        return name
+        return Region(region.begin(), end)
 
 register_parser('C++', CppParser)
@@ -0,0 +1,170 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import itertools
+import re
+
+from SublimeScopeTree.lib.kinds import keyword_kind
+from SublimeScopeTree.lib.log import get_logger
+
+log = get_logger('parsers.C++.lexer')
+
+# Token kinds
+STRING          = 'string'
+BOUNDARY        = 'boundary'
+COMMENT         = 'comment'
+PREPROCESSOR    = 'preprocessor'
+ACCESS          = 'access'
+COLON           = 'colon'
+
+# Tokens which end whatever came before them, so that a prototype cannot start before them
+STOP_KINDS = frozenset([BOUNDARY, COMMENT, PREPROCESSOR, ACCESS])
+
+_token_pattern = re.compile(r'''
+      (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<boundary>[;{}])
+    | (?P<comment>/\*[\s\S]*?\*/|//[^\n]*)
+    | (?P<preprocessor>^[ \t]*\#[^\n]*)
+    | (?P<access>\b(?:public|private|protected)[ \t]*:(?!:))
+    | (?P<colon>(?<!:):(?!:))
+''', re.VERBOSE | re.MULTILINE)
+
+_whitespace_pattern = re.compile(r'\s*')
+
+# Newlines in names, with any whitespace before them
+_newline_pattern = re.compile(r'\s*\n')
+
+Token = namedtuple('Token', ['kind', 'value', 'start', 'end'])
+
+class CppTokens:
+    '''
+    The tokens of a C++ source file which matter for finding the extent and name of a scope. The
+    file is scanned once, and the resulting tokens are kept in source order, so that searching
+    forwards or backwards from any point is a bisect.
+
+    Strings and comments are tokens of their own, so that the ;, { and } characters inside them are
+    not mistaken for boundaries.
+
+    If scan is False, the file is scanned in steps by calling scan, and until it is done, only the
+    tokens scanned so far are there.
+    '''
+    def __init__(self, text, scan=True):
+        self._text = text
+        self._tokens = []
+        self._starts = []
+
+        # The ends of the tokens in STOP_KINDS, for back-searching
+        self._stops = []
+
+        # Offset of each { => offset after the matching }, built when first needed. See block_end.
+        self._blocks = None
+
+        # Tokens not scanned yet, or None once the whole file is scanned
+        self._matches = _token_pattern.finditer(text)
+        if scan:
+            self.scan()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __getitem__(self, index):
+        return self._tokens[index]
+
+    def scan(self, count=None):
+        '''
+        Scan up to count more tokens, or the rest of the file if count is None. Return True if the
+        whole file has been scanned.
+        '''
+        if self.is_scanned():
+            return True
+        scanned = 0
+        for match in itertools.islice(self._matches, count):
+            scanned += 1
+            token = Token(match.lastgroup, match.group(), match.start(), match.end())
+            self._tokens.append(token)
+            self._starts.append(token.start)
+            if token.kind in STOP_KINDS:
+                self._stops.append(token.end)
+
+        if count is None or scanned < count:
+            log.debug('Scanned {} tokens', len(self._tokens))
+            self._matches = None
+        return self.is_scanned()
+
+    def is_scanned(self):
+        return self._matches is None
+
+    def scanned(self):
+        '''
+        Get the offset up to which the file has been scanned.
+        '''
+        if self.is_scanned():
+            return len(self._text)
+        return self._tokens[-1].end if self._tokens else 0
+
+    def prototype_start(self, point):
+        '''
+        Find where the prototype of a function whose name starts at the given point begins. The
+        prototype begins after the last boundary, comment, preprocessor directive or access
+        specifier before the name, skipping whitespace. If there is none, it starts at the beginning
+        of the file.
+        '''
+        index = bisect_right(self._stops, point) - 1
+        if index < 0:
+            return 0
+        return _whitespace_pattern.match(self._text, self._stops[index]).end()
+
+    def next(self, point, *values):
+        '''
+        Return the first token starting at or after point whose text is one of values, or None if
+        there is no such token.
+        '''
+        for index in range(bisect_left(self._starts, point), len(self._tokens)):
+            if self._tokens[index].value in values:
+                return self._tokens[index]
+        return None
+
+    def block_end(self, point):
+        '''
+        Get the offset just after the } matching the { at the given point, or None if there is no {
+        there or it is never closed. The first call matches every brace in the file in one pass, so
+        that the rest are lookups.
+        '''
+        if self._blocks is None:
+            self._blocks = {}
+            opened = []
+            for token in self._tokens:
+                if token.value == '{':
+                    opened.append(token.start)
+                elif token.value == '}' and opened:
+                    self._blocks[opened.pop()] = token.end
+            log.debug('Matched {} blocks', len(self._blocks))
+        return self._blocks.get(point)
+
+    def kind(self, point):
+        '''
+        Get the kind of the class, struct, union, enum or namespace declared at the given point, or
+        None if there is none there (see lib/kinds.py).
+        '''
+        return keyword_kind(self._text, point)
+
+    def name_end(self, point):
+        '''
+        From the start of a declaration or prototype, find the end of the statement or the start of
+        a block, and return the offset of the end of the scope's name, or None if there is none. We
+        include the semicolon to indicate that the scope is a declaration only.
+        '''
+        token = self.next(point, ';', '{', ':')
+        if token is None:
+            return None
+        return token.end if token.value == ';' else token.start
+
+def format_name(name):
+    '''
+    Clean up a name copied from the source. We don't want to mess up the user's text wrapping,
+    since the names might be very long. However, since newlines in a ScopeTree typically indicate
+    nested scopes, we make it clear that the line is continuing by inserting a backslash.
+    '''
+    return _newline_pattern.sub(' \\\n', name.strip())
@@ -0,0 +1,198 @@
+import re
+
+from SublimeScopeTree.lib.errors import ParseError, ScopeError
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.parse import TextParser, end_before_next, register_text_parser
+from SublimeScopeTree.lib.tree import ScopeTree
+from SublimeScopeTree.parsers.cpp_lexer import CppTokens, format_name, COMMENT, PREPROCESSOR, ACCESS
+
+from sublime import Region
+
+log = get_logger('parsers.C++.text')
+
+# Kinds of block, for the stack of open blocks
+FILE        = 'file'
+NAMESPACE   = 'namespace'
+CLASS       = 'class'
+LINKAGE     = 'linkage'
+FUNCTION    = 'function'
+INITIALIZER = 'initializer'
+BLOCK       = 'block'
+
+# Blocks in which classes, namespaces and functions can be declared
+DECLARATION_BLOCKS = frozenset([FILE, NAMESPACE, CLASS, LINKAGE])
+
+_structure_pattern = re.compile(r'^(?:template\s*<[^{;]*>\s*)?(?:(?:typedef|export|inline)\s+)*(class|struct|namespace)\b[^=]*$')
+_linkage_pattern = re.compile(r'^extern\s*"[^"]*"$')
+
+# A parameter list, followed by any qualifiers that can come between it and a function body
+_parameters = r'\)(?:\s*(?:const|volatile|noexcept(?:\s*\([^()]*\))?|override|final|&&?|throw\s*\([^()]*\)|->[^{;]*))*'
+_name = r'^(?:operator\s*[^\s(]*|[^=;])*\('
+_definition_pattern = re.compile(_name + r'.*' + _parameters + r'\s*$', re.DOTALL)
+_declaration_pattern = re.compile(_name + r'.*' + _parameters + r'\s*(?:=\s*(?:0|default|delete)\s*)?;$', re.DOTALL)
+
+# Constructor initializer list, between the parameters and the body
+_initializer_pattern = re.compile(r'\)\s*(?:noexcept\s*)?:(?!:)')
+_initializer_end_pattern = re.compile(r'[\w>]$')
+
+# Statements that look like functions but aren't
+_keyword_pattern = re.compile(r'^(?:return|typedef|using|friend|if|for|while|switch|catch|do|else|delete|new|throw|case)\b')
+
+class CppTextParser(TextParser):
+    '''
+    A C++ parser which works on the text of a file alone, driven by braces and keywords. It finds the
+    same kinds of scopes as CppParser: classes, structs, namespaces, and function declarations and
+    definitions outside of function bodies. It is much faster than asking the syntax engine, but it
+    does not understand macros, and it can be fooled by code that needs a real parser, such as the
+    most vexing parse.
+    '''
+    def __init__(self, view):
+        TextParser.__init__(self, view)
+        self.tree = ScopeTree(view)
+        self.tree.set_name_format(format_name)
+        self.view = view
+        # The file is scanned for tokens as part of the parse, so that it can stop at a deadline
+        self.tokens = CppTokens(view.text(), scan=False)
+
+    def parse(self):
+        log.debug('Parsing {} as C++ text', self.view.file_name())
+
+        # State of find_scopes: the next token, the stack of open blocks, each a pair of (kind,
+        # start of the scope or None if it is not a scope), and the start of the current statement
+        self._index = 0
+        self._stack = [(FILE, None)]
+        self._statement = 0
+        self._found = []
+
+        # The scopes to insert, once they are all found
+        self._scopes = None
+        self._next = 0
+        return self.resume()
+
+    def resume(self):
+        # Each step keeps its state in the parser, so that we can carry on from any deadline
+        while not self.tokens.scan(1024):
+            self.check_cancelled()
+            self.check_deadline()
+
+        if self._scopes is None:
+            self.find_scopes()
+            # Scopes are only complete once we see their closing brace, which is after their
+            # children. We collect them all and insert them in source order, so that each insertion
+            # is an append.
+            self._scopes = sorted(self._found, key=lambda scope: (scope[0].begin(), -scope[0].end()))
+            self._scopes = end_before_next(self._scopes)
+            self._found = None
+
+        while self._next < len(self._scopes):
+            region, name, kind, definition = self._scopes[self._next]
+            self._next += 1
+            log.debug('Inserting region {} named {}', region, name)
+            try:
+                self.tree.insert(region, name, kind=kind, definition=definition)
+            except ScopeError as err:
+                raise ParseError(self.view, region, repr(err))
+            if self._next < len(self._scopes):
+                self.check_deadline()
+        return self.tree
+
+    def progress(self):
+        # Scanning, finding and inserting count for a third each
+        if not self.tokens.is_scanned():
+            return self.tokens.scanned() / self.view.size() / 3
+        if self._scopes is None:
+            return (1 + self._index / len(self.tokens)) / 3
+        return (2 + self._next / len(self._scopes)) / 3
+
+    def find_scopes(self):
+        '''
+        Find (region, name span, kind, definition) for every scope in the file, adding them to
+        self._found in the order they are closed. If the parse runs out of time, the state of the
+        search is kept, and calling this again carries on from the same token.
+        '''
+        text = self.view.text()
+        stack = self._stack
+        statement = self._statement
+
+        first = self._index
+        for index in range(first, len(self.tokens)):
+            if index % 1024 == 0 and index > first:
+                self._index, self._statement = index, statement
+                self.check_cancelled()
+                self.check_deadline()
+            token = self.tokens[index]
+            kind = stack[-1][0]
+
+            if token.kind in (COMMENT, PREPROCESSOR, ACCESS):
+                # Like CppParser, we don't start a prototype until after the last comment,
+                # preprocessor directive or access specifier before it. Once a prototype has
+                # started, they are part of it.
+                if not text[statement:token.start].strip():
+                    statement = self.skip_whitespace(token.end)
+
+            elif token.value == ';':
+                if kind in DECLARATION_BLOCKS and self.is_function(text[statement:token.end], _declaration_pattern):
+                    self._found.append((Region(statement, token.end), self.name_span(statement), kinds.FUNCTION, False))
+                statement = self.skip_whitespace(token.end)
+
+            elif token.value == '{':
+                head = text[statement:token.start].strip()
+                if kind not in DECLARATION_BLOCKS:
+                    block, start = BLOCK, None
+                elif _structure_pattern.match(head):
+                    block = NAMESPACE if _structure_pattern.match(head).group(1) == 'namespace' else CLASS
+                    start = statement
+                elif _linkage_pattern.match(head):
+                    block, start = LINKAGE, None
+                elif _initializer_pattern.search(head) and _initializer_end_pattern.search(head):
+                    # A brace initializer in a constructor initializer list, like x{0}. It is part
+                    # of the prototype, which isn't over yet.
+                    stack.append((INITIALIZER, None))
+                    continue
+                elif self.is_function(head, _definition_pattern) or \
+                        (_initializer_pattern.search(head) and head.endswith('}')):
+                    block, start = FUNCTION, statement
+                else:
+                    block, start = BLOCK, None
+
+                stack.append((block, start))
+                statement = self.skip_whitespace(token.end)
+
+            elif token.value == '}':
+                if len(stack) == 1:
+                    raise ParseError(self.view, Region(token.start, token.end), 'Unmatched }.')
+                block, start = stack.pop()
+                if block == INITIALIZER:
+                    continue
+
+                if start is not None:
+                    end = token.end
+                    if block == CLASS and text[end:end + 1] == ';':
+                        end += 1
+                    kind = kinds.FUNCTION if block == FUNCTION else self.tokens.kind(start)
+                    self._found.append((Region(start, end), self.name_span(start), kind, True))
+                statement = self.skip_whitespace(token.end)
+
+        if len(stack) > 1:
+            raise ParseError(self.view, Region(stack[-1][1] or 0, len(text)), 'Expected }.')
+        self._index, self._statement = len(self.tokens), statement
+
+    def is_function(self, head, pattern):
+        head = head.strip()
+        return bool(head) and not _keyword_pattern.match(head) and bool(pattern.match(head))
+
+    def name_span(self, start):
+        end = self.tokens.name_end(start)
+        if end is None:
+            raise ParseError(self.view, Region(start, start), 'Expected ;, {, or :.')
+        return Region(start, end)
+
+    def skip_whitespace(self, point):
+        text = self.view.text()
+        while point < len(text) and text[point].isspace():
+            point += 1
+        return point
+
+register_text_parser('C++', CppTextParser)
+register_text_parser('C', CppTextParser)
@@ -0,0 +1,48 @@
+'''
+Tables for the generic selector parser (see SelectorParser in lib/parse.py). Each syntax gets a list
+of SelectorRules naming the scopes to outline, their kinds, and where their names end. To outline
+another language, add its table here.
+'''
+from SublimeScopeTree.lib.kinds import CLASS, STRUCT, ENUM, NAMESPACE, FUNCTION, OTHER
+from SublimeScopeTree.lib.parse import SelectorRule, register_selector_parser
+
+# Names of brace-delimited scopes end at the opening brace, or at the semicolon of a declaration
+_brace = r'\s*[{;]'
+
+tables = {
+    'C': [
+        SelectorRule('meta.struct', STRUCT, _brace, False),
+        SelectorRule('meta.enum', ENUM, _brace, False),
+        SelectorRule('meta.function', FUNCTION, _brace, False),
+    ],
+    'C#': [
+        SelectorRule('meta.namespace', NAMESPACE, _brace, False),
+        SelectorRule('meta.class', CLASS, _brace, False),
+        SelectorRule('meta.struct', STRUCT, _brace, False),
+        SelectorRule('meta.interface', CLASS, _brace, False),
+        SelectorRule('meta.enum', ENUM, _brace, False),
+        SelectorRule('meta.method', FUNCTION, _brace, False),
+        SelectorRule('meta.property', OTHER, _brace, False),
+    ],
+    'Java': [
+        SelectorRule('meta.class', CLASS, _brace, False),
+        SelectorRule('meta.interface', CLASS, _brace, False),
+        SelectorRule('meta.enum', ENUM, _brace, False),
+        SelectorRule('meta.method', FUNCTION, _brace, False),
+    ],
+    'JavaScript': [
+        SelectorRule('meta.class', CLASS, _brace, False),
+        SelectorRule('meta.function', FUNCTION, _brace, False),
+    ],
+    'Go': [
+        SelectorRule('meta.type', STRUCT, _brace, False),
+        SelectorRule('meta.function', FUNCTION, _brace, False),
+    ],
+    'Python': [
+        SelectorRule('meta.class', CLASS, r'(?m):[ \t]*(?:#.*)?$', True),
+        SelectorRule('meta.function', FUNCTION, r'(?m):[ \t]*(?:#.*)?$', True),
+    ],
+}
+
+for syntax, rules in tables.items():
+    register_selector_parser(syntax, rules)
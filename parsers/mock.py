@@ -1,23 +1,107 @@
+'''
+A parser for the mock syntax used by tests. By default it returns an empty tree, or whatever a test
+callback builds. It can also generate synthetic trees of a given size and shape, deterministically
+from a seed, for measuring the tree at scale without real sources; see set_workload and
+synthetic_scopes. A workload can be set from the mock_workload setting too, as a dict of the
+arguments to synthetic_scopes, so that rendering a view with the mock syntax in the editor renders a
+synthetic tree.
+'''
+from bisect import bisect_right
+from itertools import accumulate
+import random
+import string
+
+from sublime import Region
+
+from SublimeScopeTree.lib.log import get_logger
 from SublimeScopeTree.lib.parse import Parser, register_parser_factory
+from SublimeScopeTree.lib.settings import get_setting
 from SublimeScopeTree.lib.test import test_only
 from SublimeScopeTree.lib.tree import ScopeTree
 
+log = get_logger('parsers.mock')
+
+def synthetic_scopes(nodes, fan_out=8, depth_weights=(1, 3, 3, 2, 1), name_length=16, seed=0):
+    '''
+    Get the (region, name) pairs of a synthetic tree of the given number of scopes, in source
+    order. The depth of each scope is drawn from depth_weights, the relative weights of depths 0, 1,
+    and so on, but a scope is never more than one level deeper than the one before it, and is moved
+    up a level while its parent already has fan_out children. Top level scopes may have any number
+    of siblings. Names are random letters, name_length long. The same arguments always give the same
+    tree.
+
+    The regions are those of source text in which each scope is its name followed by braces around
+    its children, and then a newline, so that siblings don't touch, like 'name{child{}\nchild{}\n}\n'.
+    '''
+    rng = random.Random(seed)
+    cumulative_weights = list(accumulate(depth_weights))
+
+    # Scopes containing the next one, as [index, number of children so far]. The region of each
+    # scope, by index in source order, is its beginning until the scope is closed.
+    stack = []
+    regions = []
+    names = []
+    position = 0
+
+    def close():
+        nonlocal position
+        index, _ = stack.pop()
+        position += 1
+        regions[index] = Region(regions[index], position)
+        position += 1
+
+    for _ in range(nodes):
+        # Random.choices is not in Python 3.3
+        depth = bisect_right(cumulative_weights, rng.random() * cumulative_weights[-1])
+        depth = min(depth, len(stack))
+        while len(stack) > depth:
+            close()
+        while stack and stack[-1][1] >= fan_out:
+            close()
+        if stack:
+            stack[-1][1] += 1
+
+        names.append(''.join(rng.choice(string.ascii_lowercase) for _ in range(name_length)))
+        regions.append(position)
+        stack.append([len(regions) - 1, 0])
+        position += name_length + 1
+    while stack:
+        close()
+
+    log.debug('Generated {} synthetic scopes in {} characters', nodes, position)
+    return list(zip(regions, names))
+
 class MockParser(Parser):
     def __init__(self, view):
         self._on_parse = None
         self._view = view
+        self._workload = None
 
     def parse(self):
         if self._on_parse:
-            return self._on_parse(self._view)
-        else:
-            return ScopeTree()
+            tree = self._on_parse(self._view)
+            if tree is not None:
+                return tree
+
+        workload = self._workload or get_setting('mock_workload')
+        tree = ScopeTree(self._view)
+        if workload:
+            log.info('Generating synthetic tree for view {}: {}', self._view.id(), workload)
+            for region, name in synthetic_scopes(**workload):
+                tree.insert(region, name)
+        return tree
 
     @test_only
     def on_parse(self, callback):
         assert self._on_parse is None, 'Can only register one callback'
         self._on_parse = callback
 
+    def set_workload(self, **workload):
+        '''
+        Generate synthetic trees from now on, with the given arguments to synthetic_scopes.
+        '''
+        self._workload = workload
+
 def get_parser(view, instantiated={}):
     '''
     Get a mock parser for a given view. We cache the parsers which have been instantiated and only
@@ -1,47 +1,529 @@
-from sublime import active_window
+from sublime import active_window, set_timeout, Region, DRAW_NO_FILL, DRAW_NO_OUTLINE, DRAW_SOLID_UNDERLINE
 import sublime_plugin
 
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.display import FoldOverlay
+from SublimeScopeTree.lib.errors import SSTException, ParseCancelled
+from SublimeScopeTree.lib.live import Debouncer, SlicedJob, Throttle
 from SublimeScopeTree.lib.log import get_logger
-from SublimeScopeTree.lib.parse import parse
+from SublimeScopeTree.lib.memory import report
+from SublimeScopeTree.lib.metrics import CountingView, RenderRecord
+from SublimeScopeTree.lib.parse import parse, resume_in_slices
+from SublimeScopeTree.lib.query import Query
+from SublimeScopeTree.lib.registry import TreeRegistry
+from SublimeScopeTree.lib.settings import get_setting
+from SublimeScopeTree.lib.symbols import SymbolIndex
 
 log = get_logger('sublime_scope_tree')
 
-scope_trees = {}
+def parse_view(view, cancelled=None, budget=None):
+    return parse(view, lazy=get_setting('lazy_parse', False), cancelled=cancelled, budget=budget)
+
+def parse_budget():
+    '''
+    Get the time in milliseconds that a parse may block the editor for, or None for no limit.
+    '''
+    return get_setting('parse_budget_ms', 0) or None
+
+def parse_slice():
+    '''
+    Get the time in milliseconds that each slice of a parse continued in the background may take.
+    '''
+    return get_setting('parse_slice_ms', 10)
+
+# Latest trees of the outlined buffers, shared between outlines of the same buffer. These parses
+# happen when the user asks for an outline, so they must not block the editor for longer than the
+# budget.
+scope_trees = TreeRegistry(lambda view: parse_view(view, budget=parse_budget()))
+
+# Fold state of each outline view, by outline view id
+folds = {}
+
+# Queries filtering outline views, by outline view id
+filters = {}
+
+# The tree whose text each outline view shows, by outline view id: the version of the shared tree it
+# was last rendered from, or a filtered copy of it. Commands on an outline use this tree, so that
+# they match its text while newer versions are being built.
+displayed_trees = {}
+
+# Parses of trees in scope_trees continuing in slices on the main thread, by buffer id
+parse_jobs = {}
+
+# Symbols of every tree in scope_trees, by buffer id
+symbols = SymbolIndex()
+
+# Live outlines by source view id
+live_outlines = {}
+
+# Pairs of (outline view, source view), by outline view id
+outlines = {}
+
+# Throttles for following the caret, by source view id
+caret_throttles = {}
+
+def new_outline_view(source_view):
+    outline_view = active_window().new_file()
+    outline_view.set_name(source_view.name() + ' -- ScopeTree')
+    outline_view.set_scratch(True)
+    outline_view.set_read_only(True)
+    # The outline syntax matches nothing, and the outline is colored by kind instead (see
+    # color_kinds), which stays cheap however large the outline is
+    outline_view.set_syntax_file(get_setting('outline_syntax') or source_view.settings().get('syntax'))
+    outlines[outline_view.id()] = (outline_view, source_view)
+    folds[outline_view.id()] = FoldOverlay()
+    return outline_view
+
+def show_outline(outline_view, source_view):
+    '''
+    Show the tree for a source view in an outline view, parsing the source only if no other outline
+    has a tree for its current contents.
+    '''
+    record = RenderRecord(tree_cache='hit' if scope_trees.is_current(source_view) else 'miss')
+    with record.phase('parse'):
+        tree, changed = scope_trees.acquire(outline_view.id(), source_view)
+    if record.enabled() and record.fields['tree_cache'] == 'miss':
+        record.set(parse_view_calls=getattr(tree.source(), 'calls', None))
+    if changed or source_view.buffer_id() not in symbols:
+        render_buffer(source_view, {outline_view.id(): record})
+    else:
+        render_tree(outline_view, tree, record)
+
+    buffer_id = source_view.buffer_id()
+    if not tree.is_complete() and not (buffer_id in parse_jobs and parse_jobs[buffer_id].is_running()):
+        # Show what we have, and parse the rest in slices. The outlines are rendered again once
+        # the tree is complete.
+        def finished():
+            parse_jobs.pop(buffer_id, None)
+            render_buffer(source_view)
+
+        parse_jobs[buffer_id] = SlicedJob(parse_in_slices(source_view, resume_shared(buffer_id), finished))
+        parse_jobs[buffer_id].start()
+
+def resume_shared(buffer_id):
+    '''
+    Continue the parse of the shared tree of a buffer a slice at a time, in a new version of the tree
+    for each slice, which replaces the last one in scope_trees. Outlines keep showing the version
+    they were rendered from. Generates each new version, until the tree is complete or replaced by
+    a complete parse.
+    '''
+    while True:
+        tree = scope_trees.tree(buffer_id)
+        if not tree or tree.is_complete():
+            return
+        version = tree.edit()
+        version.resume(parse_slice())
+        scope_trees.replace(buffer_id, version)
+        yield version
+
+def resume_private(tree):
+    '''
+    Continue the parse of a tree which nothing else uses a slice at a time, in place. Generates the
+    tree after each slice, until it is complete.
+    '''
+    for _ in resume_in_slices(tree, parse_slice()):
+        yield tree
+
+def parse_in_slices(source_view, slices, on_complete):
+    '''
+    Generator for a SlicedJob continuing the parse of an incomplete tree, a slice at a time, given
+    the tree after each slice (see resume_shared and resume_private). The progress is shown in the
+    status bar of the source view, and on_complete is called once the tree is complete. If the parse
+    fails or is cancelled, the tree is left as it is.
+    '''
+    tree = None
+    try:
+        for tree in slices:
+            progress = tree.progress()
+            source_view.set_status('scope_tree', 'ScopeTree: parsing{} ({} scopes)'.format(
+                '' if progress is None else ' {}%'.format(int(progress * 100)), tree.size()))
+            yield
+    except ParseCancelled:
+        log.info('Parse of view {} cancelled', source_view.id())
+        return
+    except SSTException as err:
+        log.info('Abandoning parse of view {}: {}', source_view.id(), repr(err))
+        return
+    finally:
+        source_view.erase_status('scope_tree')
+
+    if tree:
+        log.info('Finished parse of view {} with {} scopes', source_view.id(), tree.size())
+    on_complete()
+
+def displayed_tree(outline_view):
+    '''
+    Get the tree whose text is shown in an outline view, which is a filtered copy of the shared tree
+    if the outline is filtered. This may be an older version than the one in scope_trees.
+    '''
+    return displayed_trees.get(outline_view.id())
+
+def outline_views(source_view):
+    return [outline_view for outline_view, source in outlines.values() if source.id() == source_view.id()]
+
+def show_source(outline_view, scope, focus=False):
+    '''
+    Move the caret in the source view of an outline to the beginning of the given scope.
+    '''
+    if outline_view.id() not in outlines:
+        return
+    source_view = outlines[outline_view.id()][1]
+    if not source_view.is_valid():
+        return
+
+    begin = scope.source_region().begin()
+    source_view.sel().clear()
+    source_view.sel().add(Region(begin))
+    source_view.show_at_center(begin)
+    if focus:
+        source_view.window().focus_view(source_view)
+
+def expand_scope(outline_view, scope):
+    '''
+    Parse the children of a lazily parsed scope shown in an outline, in a new version of the shared
+    tree, and render the outlines of its buffer again if the tree changed. If the buffer was edited
+    since it was parsed, its scopes can't be expanded any more, and it is parsed again instead.
+    Returns True if the outlines were rendered again.
+    '''
+    if scope.is_expanded():
+        return False
+
+    source_view = outlines[outline_view.id()][1]
+    if not scope_trees.is_current(source_view):
+        log.info('Parsing view {} again to expand {}, since it changed', source_view.id(), scope.name)
+        show_outline(outline_view, source_view)
+        return True
+
+    buffer_id = source_view.buffer_id()
+    version = scope_trees.tree(buffer_id).edit()
+    changed = version.expand(scope)
+    # Keep the version even if the scope has no children, so that it isn't parsed again
+    scope_trees.replace(buffer_id, version)
+    if changed:
+        render_buffer(source_view)
+    return changed
+
+def highlight_caret_scope(source_view):
+    '''
+    Highlight the line of the innermost scope containing the caret in each outline of a view.
+    '''
+    if not source_view.is_valid() or not len(source_view.sel()):
+        return
+
+    point = source_view.sel()[0].begin()
+    for outline_view in outline_views(source_view):
+        tree = displayed_tree(outline_view)
+        scope = tree.find_source(point) if tree else None
+        if not scope:
+            outline_view.erase_regions('scope_tree_caret')
+            continue
+
+        line = outline_view.line(tree.display_region(scope).begin())
+        outline_view.add_regions('scope_tree_caret', [line], 'region.bluish', '', DRAW_NO_OUTLINE)
+        outline_view.show(line)
+
+def render_tree(view, tree, record=None):
+    '''
+    Replace the text of a scratch view with the rendered tree, keeping folded regions folded. If the
+    view is filtered, only the matching scopes and their ancestors are shown. The render is measured
+    in the given RenderRecord, or a new one, and the record is written (see lib/metrics.py).
+    '''
+    record = record or RenderRecord()
+    if record.enabled():
+        view = CountingView(view)
+
+    filtered = view.id() in filters
+    if filtered:
+        with record.phase('render'):
+            if not tree.is_rendered():
+                tree.render()
+        with record.phase('filter'):
+            tree = tree.filter(filters[view.id()])
+
+    with record.phase('render'):
+        text = tree.render()
+    rendered = tree.rendered_count()
+    with record.phase('set_text'):
+        view.unfold(Region(0, view.size()))
+        view.run_command('scratch_view_set_text', {'text': text})
+    displayed_trees[view.id()] = tree
+    with record.phase('folds'):
+        folds[view.id()].restore(view, tree)
+    with record.phase('color'):
+        color_kinds(view, tree)
+
+    if record.enabled():
+        source_view = outlines[view.id()][1]
+        depths = tree.index().depths
+        record.set(
+            file_size=source_view.size(),
+            syntax=source_view.settings().get('syntax'),
+            scopes=tree.size(),
+            max_depth=max(depths) if depths else None,
+            filtered=filtered,
+            rendered_scopes=rendered,
+            reused_scopes=tree.size() - rendered,
+            view_calls=view.calls)
+        record.write()
+
+def color_kinds(view, tree):
+    '''
+    Underline the names in an outline view in a color for the kind of their scope, using the scopes
+    of the color scheme given by the kind_scopes setting. Each kind is one set of regions.
+    '''
+    scopes = get_setting('kind_scopes', {})
+    regions = tree.kind_regions() if scopes else {}
+    for kind, name in enumerate(kinds.NAMES):
+        key = 'scope_tree_' + name
+        if scopes.get(name) and kind in regions:
+            view.add_regions(key, regions[kind], scopes[name], '',
+                DRAW_NO_FILL | DRAW_NO_OUTLINE | DRAW_SOLID_UNDERLINE)
+        else:
+            view.erase_regions(key)
+
+def render_buffer(source_view, records=None):
+    '''
+    Render every outline showing the tree of a source view's buffer, and index its symbols again,
+    after the shared tree was replaced. Records may give the RenderRecord to measure the render of
+    some outlines in, by outline view id.
+    '''
+    buffer_id = source_view.buffer_id()
+    for outline_id in scope_trees.outlines(buffer_id):
+        outline_view = outlines[outline_id][0]
+        render_tree(outline_view, scope_trees.get(outline_id), (records or {}).get(outline_id))
+    tree = scope_trees.tree(buffer_id)
+    if tree:
+        symbols.update(buffer_id, source_view, tree)
+
+class LiveOutline:
+    '''
+    An outline view which follows edits to its source view. The outline view is kept for as long as
+    the outline is live, and its tree is replaced by a new parse after each burst of edits.
+    '''
+    def __init__(self, source_view):
+        self.source_view = source_view
+        self.outline_view = new_outline_view(source_view)
+        # The first slice of each parse runs off the main thread, since building the parser copies
+        # the whole buffer. If it runs out of time, the parse continues in slices on the main thread.
+        self.debouncer = Debouncer(self.update, get_setting('live_delay_ms', 500))
+        self.job = None
+
+        self.change_count = source_view.change_count()
+        show_outline(self.outline_view, source_view)
+
+    def update(self, cancelled):
+        change_count = self.source_view.change_count()
+        if change_count == self.change_count:
+            return
+
+        log.info('Updating live outline {} for view {}', self.outline_view.id(), self.source_view.id())
+        try:
+            tree = parse_view(self.source_view, cancelled=cancelled, budget=parse_slice())
+        except ParseCancelled:
+            log.info('Live update of view {} superseded by newer edits', self.source_view.id())
+            return
+        except SSTException as err:
+            # The source is often invalid while the user is typing. Keep the last good outline.
+            log.info('Keeping previous outline for view {}: {}', self.source_view.id(), repr(err))
+            return
+        # Jobs are only started and cancelled on the main thread, between their slices
+        set_timeout(lambda: self.continue_parse(tree, change_count, cancelled), 0)
+
+    def continue_parse(self, tree, change_count, cancelled):
+        if self.job:
+            self.job.cancel()
+        if cancelled():
+            return
+
+        finish = lambda: self.finish(tree, change_count, cancelled)
+        if tree.is_complete():
+            finish()
+        else:
+            # Keep showing the previous outline until the new tree is complete
+            self.job = SlicedJob(parse_in_slices(self.source_view, resume_private(tree), finish))
+            self.job.start()
+
+    def finish(self, tree, change_count, cancelled):
+        if cancelled() or self.outline_view.id() not in scope_trees:
+            return
+
+        # The tree is shared with any other outline of the same buffer, so replace it for them all
+        scope_trees.update(self.source_view.buffer_id(), change_count, tree)
+        render_buffer(self.source_view)
+        self.change_count = change_count
+
+    def stop(self):
+        self.debouncer.cancel()
+        if self.job:
+            self.job.cancel()
 
 class ScratchViewSetText(sublime_plugin.TextCommand):
     def run(self, edit, text):
         self.view.set_read_only(False)
-        self.view.insert(edit, 0, text)
+        self.view.replace(edit, Region(0, self.view.size()), text)
         self.view.set_read_only(True)
         log.debug('Set text in scratch view {}:\n{}', self.view.id(), text)
 
 class ScopeTreeRender(sublime_plugin.TextCommand):
     def run(self, _):
-        scratch_view = active_window().new_file()
-        scratch_view.set_name(self.view.name() + ' -- ScopeTree')
-        scratch_view.set_scratch(True)
-        scratch_view.set_read_only(True)
-        scratch_view.set_syntax_file(self.view.settings().get('syntax'))
-
-        scope_trees[scratch_view.id()] = parse(self.view)
-
-        scratch_view.run_command('scratch_view_set_text', {'text': scope_trees[scratch_view.id()].render()})
+        show_outline(new_outline_view(self.view), self.view)
 
 class ScopeTreeFold(sublime_plugin.TextCommand):
     def run(self, _):
         log.info('Click event in view {} at point {}', self.view.id(), self.view.sel()[0])
 
-        tree = scope_trees[self.view.id()]
-        region = tree.find(self.view.sel()[0].begin())
+        tree = displayed_tree(self.view)
+        scope = tree.find_scope(self.view.sel()[0].begin())
 
-        if not region:
+        if not scope:
             log.info('Could not find region at point {}', self.view.sel()[0])
             return
 
-        region.toggle_fold(self.view)
+        if get_setting('click_to_source', True):
+            show_source(self.view, scope)
+
+        if expand_scope(self.view, scope):
+            # The scope was lazily parsed, and now has children to show in every outline sharing it
+            return
+
+        folds[self.view.id()].toggle_fold(self.view, tree, scope)
 
     def is_enabled(self):
         if self.view.id() not in scope_trees:
-            log.debug('Rejected click event in view {}, {}', self.view.id(), scope_trees.keys())
+            log.debug('Rejected click event in view {}', self.view.id())
             return False
         return True
+
+class ScopeTreeGotoSource(sublime_plugin.TextCommand):
+    def run(self, _):
+        tree = displayed_tree(self.view)
+        scope = tree.find_scope(self.view.sel()[0].begin())
+        if not scope:
+            return
+
+        # Navigating into a lazily parsed scope parses it
+        expand_scope(self.view, scope)
+
+        show_source(self.view, scope, focus=True)
+
+    def is_enabled(self):
+        return self.view.id() in outlines and self.view.id() in scope_trees
+
+class ScopeTreeFilter(sublime_plugin.TextCommand):
+    '''
+    Show only the scopes of the given kinds (see lib/query.py) whose names match a glob, with their
+    ancestors. With no arguments, show every scope again. If prompt is True, ask for the glob.
+    '''
+    def run(self, _, kinds=None, name=None, prompt=False):
+        if prompt:
+            self.view.window().show_input_panel('Filter scopes by name:', '',
+                lambda name: self.view.run_command('scope_tree_filter', {'kinds': kinds, 'name': name}),
+                None, None)
+            return
+
+        if kinds is None and not name:
+            log.info('Removing filter from outline {}', self.view.id())
+            filters.pop(self.view.id(), None)
+        else:
+            log.info('Filtering outline {} by kinds {} and name {}', self.view.id(), kinds, name)
+            try:
+                filters[self.view.id()] = Query(kinds=kinds, name=name or None)
+            except SSTException:
+                return
+
+        render_tree(self.view, scope_trees.get(self.view.id()))
+
+    def is_enabled(self):
+        return self.view.id() in outlines and self.view.id() in scope_trees
+
+class ScopeTreeGotoSymbol(sublime_plugin.WindowCommand):
+    '''
+    Search the symbols of every outlined file, and go to the chosen one.
+    '''
+    def run(self):
+        self.window.show_input_panel('Go to symbol:', '', self.search, None, None)
+
+    def search(self, query):
+        hits = symbols.search(query)
+        if not hits:
+            self.window.status_message('No symbols matching ' + query)
+            return
+
+        items = [[hit.name, hit.view.file_name() or hit.view.name()] for hit in hits]
+        self.window.show_quick_panel(items, lambda index: self.goto(hits[index]) if index >= 0 else None)
+
+    def goto(self, hit):
+        if not hit.view.is_valid():
+            return
+        hit.view.sel().clear()
+        hit.view.sel().add(Region(hit.region.begin()))
+        hit.view.show_at_center(hit.region.begin())
+        hit.view.window().focus_view(hit.view)
+
+    def is_enabled(self):
+        return len(symbols) > 0
+
+class ScopeTreeMemoryReport(sublime_plugin.WindowCommand):
+    '''
+    Write the approximate memory used by each tree, and by the last traced parse, to the log.
+    '''
+    def run(self):
+        total = report(scope_trees.items())
+        self.window.status_message('ScopeTree: {} trees use ~{} KB, see the log for details'.format(
+            len(scope_trees), total // 1024))
+
+class ScopeTreeToggleLive(sublime_plugin.TextCommand):
+    def run(self, _):
+        if self.view.id() in live_outlines:
+            log.info('Stopping live outline for view {}', self.view.id())
+            live_outlines.pop(self.view.id()).stop()
+        else:
+            log.info('Starting live outline for view {}', self.view.id())
+            live_outlines[self.view.id()] = LiveOutline(self.view)
+
+    def is_enabled(self):
+        # Outlines don't have outlines of their own
+        return self.view.id() not in scope_trees
+
+class ScopeTreeLiveListener(sublime_plugin.EventListener):
+    def on_modified(self, view):
+        # We note the edit here rather than in on_modified_async, so that a parse in progress on the
+        # main thread knows about newer edits before its next slice, and stops early.
+        live = live_outlines.get(view.id())
+        if live:
+            live.debouncer.poke()
+
+    def on_activated_async(self, view):
+        live = live_outlines.get(view.id())
+        if live and live.change_count != view.change_count():
+            live.debouncer.poke(0)
+
+    def on_selection_modified_async(self, view):
+        if view.id() in scope_trees:
+            # Only source views follow the caret
+            return
+
+        throttle = caret_throttles.get(view.id())
+        if not throttle:
+            if not outline_views(view):
+                return
+            throttle = Throttle(lambda: highlight_caret_scope(view), get_setting('caret_sync_ms', 100))
+            caret_throttles[view.id()] = throttle
+        throttle.poke()
+
+    def on_close(self, view):
+        caret_throttles.pop(view.id(), None)
+        outlines.pop(view.id(), None)
+        if view.id() in live_outlines:
+            live_outlines.pop(view.id()).stop()
+        for source_id, live in list(live_outlines.items()):
+            if live.outline_view.id() == view.id():
+                live_outlines.pop(source_id).stop()
+        dropped = scope_trees.release(view.id())
+        if dropped is not None:
+            symbols.remove(dropped)
+            if dropped in parse_jobs:
+                parse_jobs.pop(dropped).cancel()
+        folds.pop(view.id(), None)
+        filters.pop(view.id(), None)
+        displayed_trees.pop(view.id(), None)
@@ -0,0 +1,42 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+from unittest import TestCase
+
+from SublimeScopeTree.lib import batch
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.test import test
+
+log = get_logger('test.batch')
+
+class Batch(TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+        shutil.rmtree(self.output_dir)
+
+    def write(self, path, text):
+        with open(os.path.join(self.source_dir, path), 'w') as source_file:
+            source_file.write(text)
+
+    @test
+    def test_bad_file(self):
+        # Nested too deeply for the parser to recurse through, which isn't a ParseError
+        depth = sys.getrecursionlimit()
+        self.write('a.cpp', 'void f() {}')
+        self.write('b.cpp', 'namespace n {' * depth + '}' * depth)
+        self.write('c.cpp', 'int h();int k();')
+
+        self.assertEqual(batch.main([self.source_dir, self.output_dir, '--jobs', '1']), 1)
+
+        with open(os.path.join(self.output_dir, 'timings.json')) as timings_file:
+            results = json.load(timings_file)
+        self.assertEqual([(result['file'], bool(result['error'])) for result in results],
+                         [('a.cpp', False), ('b.cpp', True), ('c.cpp', False)])
+        self.assertEqual(results[2]['scopes'], 2)
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, 'c.cpp.outline')))
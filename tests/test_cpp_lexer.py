@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.test import test
+from SublimeScopeTree.parsers.cpp_lexer import CppTokens, format_name, BOUNDARY, COMMENT, STRING
+
+log = get_logger('test.cpp_lexer')
+
+class Tokens(TestCase):
+    def prototype(self, source_code, function_name):
+        tokens = CppTokens(source_code)
+        start = tokens.prototype_start(source_code.index(function_name))
+        return format_name(source_code[start:tokens.name_end(start)])
+
+    @test
+    def test_kinds(self):
+        tokens = CppTokens('int x = \'{\'; /* } */ char const * s = "; {"; // {')
+        self.assertEqual([token.kind for token in tokens], [STRING, BOUNDARY, COMMENT, STRING, BOUNDARY, COMMENT])
+
+    @test
+    def test_scan(self):
+        source_code = 'int x = \'{\'; /* } */ char const * s = "; {"; // {'
+        tokens = CppTokens(source_code, scan=False)
+        self.assertEqual(tokens.scanned(), 0)
+        self.assertFalse(tokens.scan(2))
+        self.assertEqual(tokens.scanned(), source_code.index(';') + 1)
+        self.assertFalse(tokens.scan(4))
+        self.assertTrue(tokens.scan(4))
+        self.assertTrue(tokens.is_scanned())
+        self.assertEqual(tokens.scanned(), len(source_code))
+        self.assertEqual(list(tokens), list(CppTokens(source_code)))
+
+    @test
+    def test_start_of_file(self):
+        self.assertEqual(self.prototype('int foo();', 'foo'), 'int foo();')
+
+    @test
+    def test_after_boundary(self):
+        self.assertEqual(self.prototype('int x;\n\nchar *\nfoo() {}', 'foo'), 'char * \\\nfoo()')
+
+    @test
+    def test_after_comment(self):
+        self.assertEqual(self.prototype('/* comment; */ void foo();', 'foo'), 'void foo();')
+        self.assertEqual(self.prototype('// comment\nvoid foo();', 'foo'), 'void foo();')
+
+    @test
+    def test_after_preprocessor(self):
+        self.assertEqual(self.prototype('#include <a>\n#include <b>\nvoid foo();', 'foo'), 'void foo();')
+
+    @test
+    def test_after_access_specifier(self):
+        self.assertEqual(self.prototype('class a {\npublic:\n    a() : x(0) {}', 'a()'), 'a()')
+
+    @test
+    def test_qualified_name(self):
+        self.assertEqual(self.prototype('void a::b::foo() {}', 'foo'), 'void a::b::foo()')
+
+    @test
+    def test_block_end(self):
+        source_code = 'void f() { if (x) { s = "}"; } /* } */ }\nstruct a { char c = \'{\'; };\nvoid g() {'
+        tokens = CppTokens(source_code)
+        self.assertEqual(tokens.block_end(source_code.index('{')), source_code.index('\nstruct'))
+        self.assertEqual(tokens.block_end(source_code.index('{ s =')), source_code.index(' /*'))
+        self.assertEqual(tokens.block_end(source_code.index('{ char')), source_code.index(';\nvoid g'))
+
+        # Not a brace, or never closed
+        self.assertIsNone(tokens.block_end(0))
+        self.assertIsNone(tokens.block_end(source_code.rindex('{')))
+
+    @test
+    def test_no_end(self):
+        tokens = CppTokens('void foo()')
+        self.assertIsNone(tokens.name_end(0))
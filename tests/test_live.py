@@ -0,0 +1,131 @@
+from unittest import TestCase
+
+from SublimeScopeTree.lib.live import Debouncer, SlicedJob, Throttle
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.test import test
+
+log = get_logger('test.live')
+
+class DebouncerTest(TestCase):
+    def setUp(self):
+        self.scheduled = []
+        self.runs = []
+
+        def callback(cancelled):
+            self.runs.append(cancelled)
+
+        self.debouncer = Debouncer(callback, 100, schedule=lambda func, delay: self.scheduled.append(func))
+
+    def fire_all(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for func in scheduled:
+            func()
+
+    @test
+    def test_burst(self):
+        for _ in range(5):
+            self.debouncer.poke()
+        self.fire_all()
+        self.assertEqual(len(self.runs), 1)
+        self.assertFalse(self.runs[0]())
+
+    @test
+    def test_quiet_periods(self):
+        self.debouncer.poke()
+        self.fire_all()
+        self.debouncer.poke()
+        self.fire_all()
+        self.assertEqual(len(self.runs), 2)
+
+    @test
+    def test_cancel_in_progress(self):
+        self.debouncer.poke()
+        self.fire_all()
+        cancelled = self.runs[0]
+        self.assertFalse(cancelled())
+        self.debouncer.poke()
+        self.assertTrue(cancelled())
+
+    @test
+    def test_cancel_scheduled(self):
+        self.debouncer.poke()
+        self.debouncer.cancel()
+        self.fire_all()
+        self.assertEqual(self.runs, [])
+
+class ThrottleTest(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.scheduled = []
+        self.runs = 0
+
+        def callback():
+            self.runs += 1
+
+        self.throttle = Throttle(callback, 100,
+            schedule=lambda func, delay: self.scheduled.append((func, delay)), clock=lambda: self.now)
+
+    def fire_all(self):
+        scheduled, self.scheduled = self.scheduled, []
+        for func, delay in scheduled:
+            self.now += delay / 1000
+            func()
+
+    @test
+    def test_first_run_is_immediate(self):
+        self.throttle.poke()
+        self.assertEqual([delay for _, delay in self.scheduled], [0])
+        self.fire_all()
+        self.assertEqual(self.runs, 1)
+
+    @test
+    def test_burst(self):
+        self.throttle.poke()
+        self.fire_all()
+        for _ in range(10):
+            self.throttle.poke()
+        self.assertEqual([delay for _, delay in self.scheduled], [100])
+        self.fire_all()
+        self.assertEqual(self.runs, 2)
+
+class SlicedJobTest(TestCase):
+    def setUp(self):
+        self.scheduled = []
+        self.steps = []
+
+        def job():
+            for step in range(3):
+                self.steps.append(step)
+                yield
+
+        self.job = SlicedJob(job(), schedule=lambda func, delay: self.scheduled.append(func))
+
+    def fire_next(self):
+        self.scheduled.pop(0)()
+
+    @test
+    def test_steps(self):
+        self.job.start()
+        self.assertEqual(self.steps, [])
+
+        # One step per scheduled call, so the editor runs in between
+        self.fire_next()
+        self.assertEqual(self.steps, [0])
+        self.fire_next()
+        self.fire_next()
+        self.assertEqual(self.steps, [0, 1, 2])
+        self.assertTrue(self.job.is_running())
+
+        self.fire_next()
+        self.assertFalse(self.job.is_running())
+        self.assertEqual(self.scheduled, [])
+
+    @test
+    def test_cancel(self):
+        self.job.start()
+        self.fire_next()
+        self.job.cancel()
+        self.assertFalse(self.job.is_running())
+        for func in self.scheduled:
+            func()
+        self.assertEqual(self.steps, [0])
@@ -0,0 +1,72 @@
+from io import StringIO
+import logging
+from logging.handlers import QueueListener
+import os
+from queue import Queue
+import tempfile
+from unittest import TestCase
+
+from SublimeScopeTree.lib import log as log_module
+from SublimeScopeTree.lib.log import get_logger, get_handler, stop_logging, DroppingQueueHandler, BatchingHandler
+from SublimeScopeTree.lib.test import test
+
+log = get_logger('test.log')
+
+def record(msg):
+    return logging.LogRecord('test.log', logging.INFO, __file__, 0, msg, None, None)
+
+class SharedHandler(TestCase):
+    @test
+    def test_no_duplicate_handlers(self):
+        get_logger('test.log')
+        logger = logging.getLogger('test.log')
+        self.assertEqual(logger.handlers.count(get_handler()), 1)
+
+class Dropping(TestCase):
+    def setUp(self):
+        self.handler = DroppingQueueHandler(Queue(2))
+        self.stream = StringIO()
+        self.writer = BatchingHandler(self.stream, self.handler, batch_size=2)
+
+    def drain(self):
+        while not self.handler.queue.empty():
+            self.writer.handle(self.handler.queue.get())
+
+    @test
+    def test_drop_when_full(self):
+        for index in range(5):
+            self.handler.handle(record('message {}'.format(index)))
+        self.assertEqual(self.handler.dropped, 3)
+
+        self.drain()
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(lines, ['message 0', 'message 1', '3 log records dropped because the log queue was full'])
+
+    @test
+    def test_batched_flush(self):
+        flushes = []
+        self.stream.flush = lambda: flushes.append(self.stream.getvalue().count('\n'))
+        for index in range(2):
+            self.handler.handle(record('message {}'.format(index)))
+        self.drain()
+        self.assertEqual(flushes, [2])
+
+class Stop(TestCase):
+    def setUp(self):
+        self.listener, self.pid = log_module._listener, log_module._listener_pid
+
+    def tearDown(self):
+        log_module._listener, log_module._listener_pid = self.listener, self.pid
+
+    @test
+    def test_closed_stream(self):
+        # Like stdout closed by a test runner before the atexit handler runs
+        handler = DroppingQueueHandler(Queue())
+        stream = tempfile.TemporaryFile('w')
+        log_module._listener = QueueListener(handler.queue, BatchingHandler(stream, handler))
+        log_module._listener_pid = os.getpid()
+        log_module._listener.start()
+        stream.close()
+
+        stop_logging()
+        self.assertIsNone(log_module._listener)
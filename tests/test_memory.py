@@ -0,0 +1,78 @@
+from unittest import TestCase
+
+from sublime import Region
+
+from SublimeScopeTree.lib import memory
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.parse import TextView, ViewSnapshot
+from SublimeScopeTree.lib.test import test, inject_settings, debug
+from SublimeScopeTree.lib.tree import ScopeTree
+from SublimeScopeTree.tests.test_tree import test_tree
+
+log = get_logger('test.memory')
+
+class SelectorView(TextView):
+    '''
+    A view which answers selector queries, for filling the memo tables of a ViewSnapshot.
+    '''
+    def change_count(self):
+        return 0
+
+    def score_selector(self, point, selector):
+        return 1
+
+    def extract_scope(self, point):
+        return Region(point, point + 1)
+
+class TreeMemory(TestCase):
+    @test
+    def test_grows_with_tree(self):
+        tree = test_tree()
+        empty = memory.tree_memory(tree)
+        self.assertEqual(empty['scopes'], 0)
+
+        tree.insert(Region(0, 10), 'root')
+        tree.insert(Region(1, 5), 'child')
+        tree.render()
+        full = memory.tree_memory(tree)
+        self.assertEqual(full['scopes'], 2)
+        self.assertGreater(full['bytes'], empty['bytes'])
+        self.assertGreater(full['name_bytes'], empty['name_bytes'])
+
+        # The source text and the selector queries kept by a snapshot of the view
+        source = ViewSnapshot(SelectorView('x' * 10000))
+        tree = ScopeTree(source)
+        before = memory.tree_memory(tree)
+        self.assertGreater(before['source_bytes'], 10000)
+        self.assertGreaterEqual(before['bytes'], before['source_bytes'])
+
+        for point in range(100):
+            source.score_selector(point, 'meta.class')
+            source.extract_scope(point)
+        after = memory.tree_memory(tree)
+        self.assertGreater(after['source_bytes'], before['source_bytes'])
+        self.assertEqual(after['bytes'] - before['bytes'], after['source_bytes'] - before['source_bytes'])
+
+class TraceAllocations(TestCase):
+    def tearDown(self):
+        with debug():
+            inject_settings(trace_parse_memory=False)
+
+    @test
+    def test_disabled(self):
+        inject_settings(trace_parse_memory=False)
+        with memory.trace_allocations('nothing'):
+            pass
+        self.assertTrue(memory.last_parse() is None or memory.last_parse()['label'] != 'nothing')
+
+    @test
+    def test_trace(self):
+        if memory.tracemalloc is None:
+            self.skipTest('tracemalloc is not available')
+
+        inject_settings(trace_parse_memory=True)
+        with memory.trace_allocations('allocate'):
+            data = [list(range(100)) for _ in range(100)]
+        self.assertEqual(memory.last_parse()['label'], 'allocate')
+        self.assertGreater(memory.last_parse()['peak_bytes'], 0)
+        self.assertTrue(memory.last_parse()['top'])
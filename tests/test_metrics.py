@@ -0,0 +1,81 @@
+from io import StringIO
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from SublimeScopeTree.lib import metrics, metrics_summary
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.parse import TextView
+from SublimeScopeTree.lib.test import test, inject_settings, debug
+
+log = get_logger('test.metrics')
+
+class Record(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+        with debug():
+            inject_settings(metrics_file='')
+
+    @test
+    def test_disabled(self):
+        inject_settings(metrics_file='')
+        record = metrics.RenderRecord()
+        self.assertFalse(record.enabled())
+        with record.phase('render'):
+            pass
+        record.write()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    @test
+    def test_write(self):
+        inject_settings(metrics_file=self.path)
+        view = metrics.CountingView(TextView('text'))
+        record = metrics.RenderRecord(tree_cache='hit')
+        self.assertTrue(record.enabled())
+        with record.phase('render'):
+            view.size()
+        with record.phase('render'):
+            view.substr(view.size() - 1)
+            view.id()
+        record.set(view_calls=view.calls)
+        record.write()
+        record.write()
+
+        with open(self.path) as metrics_file:
+            lines = [json.loads(line) for line in metrics_file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]['session'], metrics.SESSION)
+        self.assertEqual(lines[0]['tree_cache'], 'hit')
+        self.assertEqual(lines[0]['view_calls'], 3)
+        self.assertEqual(list(lines[0]['phases']), ['render'])
+        self.assertGreaterEqual(lines[0]['total_ms'], lines[0]['phases']['render'])
+
+class Summary(TestCase):
+    @test
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(metrics_summary.percentile(values, 50), 50)
+        self.assertEqual(metrics_summary.percentile(values, 99), 99)
+        self.assertEqual(metrics_summary.percentile(values, 0), 1)
+        self.assertEqual(metrics_summary.percentile([7], 90), 7)
+
+    @test
+    def test_summarize(self):
+        records = [
+            {'session': 'a', 'tree_cache': 'hit', 'total_ms': 1.0, 'phases': {'render': 0.5}},
+            {'session': 'a', 'tree_cache': 'miss', 'total_ms': 3.0, 'phases': {'parse': 2.0}},
+            {'session': 'b', 'tree_cache': 'hit', 'total_ms': 2.0, 'max_depth': None},
+        ]
+        out = StringIO()
+        metrics_summary.summarize(records, [50], out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], '3 renders in 2 sessions')
+        self.assertEqual(lines[1], 'tree cache hit rate: 66.7% of 3')
+        self.assertEqual(lines[3].split(), ['total_ms', '3', '2', '3'])
+        self.assertEqual([line.split()[:2] for line in lines[4:]],
+                         [['phase', 'parse'], ['phase', 'render']])
@@ -1,14 +1,18 @@
 from unittest import TestCase
 from os.path import dirname
+import time
 
 from sublime import View, Region, active_window
 import sublime_plugin
 
-from SublimeScopeTree.lib.errors import ParserSyntaxError
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.errors import ParserSyntaxError, ParseCancelled, ParseIncomplete
 from SublimeScopeTree.lib.log import get_logger
-from SublimeScopeTree.lib.parse import parse
+from SublimeScopeTree.lib.parse import parse, parse_text, get_text_parser, resume_in_slices, run_budgeted, TextView, ViewSnapshot, SelectorParser, SelectorRule
 from SublimeScopeTree.lib.test import test, test_only, debug
 from SublimeScopeTree.lib.tree import ScopeTree, Scope
+from SublimeScopeTree.parsers import cpp_text
+from SublimeScopeTree.parsers.cpp import CppParser as CppSyntaxParser
 
 log = get_logger('test.parser')
 
@@ -40,7 +44,7 @@ def syntax_file(syntax):
 
 class Basic(TestCase):
     def setUp(self):
-        self.supported_syntax = ['C++']
+        self.supported_syntax = ['C++', 'C', 'C#', 'Java', 'JavaScript', 'Go', 'Python']
 
     @test
     def test_get_parser(self):
@@ -77,6 +81,245 @@ class Basic(TestCase):
             with self.assertRaises(ParserSyntaxError):
                 parse(view)
 
+class Snapshot(TestCase):
+    @test
+    def test_matches_view(self):
+        text = 'first line\n\n  third line\nlast'
+        with scratch_view(text=text) as view:
+            snapshot = ViewSnapshot(view)
+            self.assertEqual(snapshot, view)
+            self.assertEqual(snapshot.size(), view.size())
+            self.assertEqual(snapshot.text(), text)
+            for point in range(view.size() + 1):
+                self.assertEqual(snapshot.rowcol(point), view.rowcol(point))
+                self.assertEqual(snapshot.line(point), view.line(point))
+                self.assertEqual(snapshot.substr(point), view.substr(point))
+                self.assertEqual(snapshot.text_point(*view.rowcol(point)), point)
+            self.assertEqual(snapshot.line(Region(1, 14)), view.line(Region(1, 14)))
+            self.assertEqual(snapshot.substr(Region(3, 17)), view.substr(Region(3, 17)))
+
+    @test
+    def test_calls(self):
+        view = EditedView('text', {1: [Region(0, 4)]})
+        snapshot = ViewSnapshot(view)
+        self.assertEqual(snapshot.calls, 4)
+        for _ in range(3):
+            snapshot.find_by_selector('meta.function')
+            snapshot.score_selector(0, 'comment')
+            snapshot.id()
+        self.assertEqual(snapshot.calls, 6)
+        self.assertTrue(snapshot.is_current())
+        self.assertEqual(snapshot.calls, 7)
+
+class Synthetic(TestCase):
+    def parse(self, **workload):
+        from SublimeScopeTree.parsers.mock import MockParser
+        parser = MockParser(TextView(''))
+        parser.set_workload(**workload)
+        return parser.parse()
+
+    @test
+    def test_shape(self):
+        tree = self.parse(nodes=500, fan_out=3, depth_weights=(1, 1, 1), name_length=5, seed=1)
+        self.assertEqual(tree.size(), 500)
+
+        scopes = list(tree.walk())
+        self.assertEqual(max(scope.depth() for scope in scopes), 2)
+        self.assertEqual(set(len(scope.name) for scope in scopes), {5})
+        self.assertLessEqual(max(len(scope.children) for scope in scopes), 3)
+        self.assertGreater(len(tree.top_level_scopes()), 3)
+
+    @test
+    def test_seed(self):
+        workload = dict(nodes=200, fan_out=4, depth_weights=(1, 2, 2, 1), name_length=8)
+        self.assertEqual(self.parse(seed=7, **workload), self.parse(seed=7, **workload))
+        self.assertNotEqual(self.parse(seed=7, **workload), self.parse(seed=8, **workload))
+
+    @test
+    def test_render_and_find(self):
+        tree = self.parse(nodes=300, fan_out=5, seed=2)
+        text = tree.render()
+        self.assertEqual(len(text.splitlines()), 300)
+        for scope in tree.walk():
+            self.assertEqual(tree.find(scope.display_region().begin()), scope.display_region())
+            self.assertIs(tree.find_source(scope.source_region().begin()), scope)
+
+class SelectorView(TextView):
+    '''
+    A view which finds scopes by selector from a table of regions, rather than a syntax.
+    '''
+    def __init__(self, text, selections):
+        TextView.__init__(self, text)
+        self.selections = selections
+        self.queries = []
+
+    def find_by_selector(self, selector):
+        self.queries.append(selector)
+        return self.selections.get(selector, [])
+
+class SlowParser(SelectorParser):
+    '''
+    A parser which runs out of time at every check, after each query and each scope it inserts, if
+    it has a deadline.
+    '''
+    def check_deadline(self):
+        if self._deadline is not None:
+            raise ParseIncomplete('Out of time')
+
+class Selector(TestCase):
+    rules = [
+        SelectorRule('meta.class', kinds.CLASS, r'(?m):[ \t]*$', True),
+        SelectorRule('meta.function', kinds.FUNCTION, r'(?m):[ \t]*$', True),
+    ]
+
+    @test
+    def test_indented(self):
+        source_code = \
+'''class Outer:
+    class Inner:
+        def go(self):
+            pass
+
+    def run(self):
+
+        pass
+def main():
+    pass'''
+
+        def header(text):
+            begin = source_code.index(text)
+            return Region(begin, source_code.index('\n', begin))
+
+        view = SelectorView(source_code, {
+            'meta.class': [header('class Outer')],
+            'meta.class meta.class': [header('class Inner')],
+            'meta.function': [header('def go'), header('def run'), header('def main')],
+        })
+        tree = SelectorParser(view, self.rules).parse()
+        self.assertEqual(view.queries,
+            ['meta.class', 'meta.class meta.class', 'meta.class meta.class meta.class',
+             'meta.function', 'meta.function meta.function'])
+
+        inner = source_code.index('class Inner')
+        self.assertEqual([(scope.name, scope.kind(), scope.source_region()) for scope in tree.walk()], [
+            ('class Outer', kinds.CLASS, Region(0, source_code.index('\ndef main'))),
+            ('class Inner', kinds.CLASS, Region(inner, source_code.index('\n\n    def run'))),
+            ('def go(self)', kinds.FUNCTION, Region(source_code.index('def go'), source_code.index('\n\n    def run'))),
+            ('def run(self)', kinds.FUNCTION, Region(source_code.index('def run'), source_code.index('\ndef main'))),
+            ('def main()', kinds.FUNCTION, Region(source_code.index('def main'), len(source_code))),
+        ])
+
+    @test
+    def test_overlap(self):
+        view = SelectorView('0123456789', {
+            'meta.class': [Region(0, 6)],
+            'meta.function': [Region(0, 6), Region(4, 9)],
+        })
+        tree = SelectorParser(view, self.rules).parse()
+        self.assertEqual([scope.source_region() for scope in tree.walk()], [Region(0, 6)])
+
+    @test
+    def test_adjacent(self):
+        # Siblings which touch, like f(){}g(){}, end a character early
+        view = SelectorView('f(){}g(){}', {
+            'meta.class': [Region(0, 10)],
+            'meta.function': [Region(0, 5), Region(5, 10)],
+        })
+        tree = SelectorParser(view, self.rules).parse()
+        self.assertEqual([scope.source_region() for scope in tree.walk()],
+                         [Region(0, 10), Region(0, 4), Region(5, 10)])
+
+    def slow_view(self):
+        return SelectorView('0123456789', {
+            'meta.class': [Region(0, 9)],
+            'meta.function': [Region(1, 4), Region(5, 8)],
+        })
+
+    @test
+    def test_budget(self):
+        expected = SelectorParser(self.slow_view(), self.rules).parse()
+
+        view = self.slow_view()
+        parser = SlowParser(view, self.rules)
+        tree = run_budgeted(parser, parser.parse, 1)
+        self.assertFalse(tree.is_complete())
+        self.assertEqual(view.queries, ['meta.class'])
+        self.assertEqual(tree.size(), 0)
+
+        # The remaining queries, then the first insertion
+        for _ in range(3):
+            self.assertFalse(tree.resume(1))
+        self.assertEqual(len(view.queries), 4)
+        self.assertEqual([scope.source_region() for scope in tree.walk()], [Region(0, 9)])
+
+        self.assertFalse(tree.resume(1))
+        self.assertEqual(tree.size(), 2)
+
+        # Without a budget, the rest of the parse is done at once
+        self.assertTrue(tree.resume())
+        self.assertTrue(tree.is_complete())
+        self.assertEqual(tree, expected)
+
+    @test
+    def test_slices(self):
+        view = self.slow_view()
+        parser = SlowParser(view, self.rules)
+        tree = run_budgeted(parser, parser.parse, 1)
+        self.assertEqual(tree.progress(), 0.0)
+
+        # Finding the scopes is the first half, by rule, and inserting them the second
+        progress = list(resume_in_slices(tree, 1))
+        for actual, expected in zip(progress, [1 / 4, 1 / 4, 2 / 3, 5 / 6]):
+            self.assertAlmostEqual(actual, expected)
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(tree.progress(), 1.0)
+        self.assertEqual(tree, SelectorParser(view, self.rules).parse())
+
+class EditedView(TextView):
+    '''
+    A C++ view which finds the scopes at each depth from a table, and can be edited.
+    '''
+    def __init__(self, text, depths):
+        TextView.__init__(self, text)
+        self.depths = depths
+        self.changes = 0
+
+    def change_count(self):
+        return self.changes
+
+    def find_by_selector(self, selector):
+        return self.depths.get(selector.split(',')[0].count(' ') + 1, [])
+
+    def score_selector(self, point, selector):
+        return 0
+
+class StaleExpand(TestCase):
+    source_code = 'namespace outer {\nclass inner {};\n}'
+
+    def parse(self):
+        inner = self.source_code.index('class')
+        self.view = EditedView(self.source_code, {
+            1: [Region(0, len(self.source_code))],
+            2: [Region(inner, self.source_code.index(';') + 1)],
+        })
+        return CppSyntaxParser(ViewSnapshot(self.view)).parse_lazy()
+
+    @test
+    def test_expand(self):
+        tree = self.parse()
+        self.assertTrue(tree.expand(tree.top_level_scopes()[0]))
+        self.assertEqual([scope.name for scope in tree.walk()], ['namespace outer', 'class inner'])
+
+    @test
+    def test_edited(self):
+        # The offsets found in the edited view don't match the text of the parse
+        tree = self.parse()
+        self.view.changes += 1
+        with self.assertRaises(ParseCancelled):
+            tree.expand(tree.top_level_scopes()[0])
+        self.assertFalse(tree.top_level_scopes()[0].is_expanded())
+        self.assertEqual(tree.size(), 1)
+
 class CppParser(TestCase):
     def view(self, *args, **kwargs):
         return scratch_view(syntax_file=syntax_file('C++'), *args, **kwargs)
@@ -87,6 +330,21 @@ class CppParser(TestCase):
             correct_tree.set_top_level_scopes(*top_level_scopes)
             self.assertEqual(correct_tree, parse(view))
 
+    def parse_source(self, source_code):
+        with self.view(text=source_code) as view:
+            return parse(view)
+
+    def lazy_test(self, source_code):
+        '''
+        Check that lazily parsing the source and then expanding every scope gives the same tree as
+        parsing it all at once.
+        '''
+        with self.view(text=source_code) as view:
+            tree = parse(view, lazy=True)
+            while any([tree.expand(scope) for scope in list(tree.walk())]):
+                pass
+            self.assertEqual(tree, parse(view))
+
     def simple_test(self, source_code):
         '''
         Test a source file with a single scope named by the first line of the source code.
@@ -192,6 +450,72 @@ private:
                                  'void foo()'))
         self.run_test(source_code, my_class)
 
+    @test
+    def test_lazy(self):
+        source_code = \
+'''namespace my_namespace
+{
+class my_class
+{
+public:
+    my_class() = default;
+private:
+    struct inner_struct
+    {
+        void inner_struct_go() {}
+    };
+};
+}
+
+void foo() {}'''
+
+        with self.view(text=source_code) as view:
+            tree = parse(view, lazy=True)
+            self.assertEqual(tree.size(), 2)
+            self.assertFalse(any([scope.is_expanded() for scope in tree.walk()]))
+
+        self.lazy_test(source_code)
+
+    @test
+    def test_kinds(self):
+        source_code = \
+'''namespace my_namespace
+{
+struct my_struct
+{
+    void go();
+};
+void my_struct::go() {}
+}'''
+
+        tree = self.parse_source(source_code)
+
+        # Names are only read from the source once they are needed
+        self.assertTrue(all([scope.name_span() for scope in tree.walk()]))
+        self.assertEqual([(scope.name, scope.kind(), scope.is_definition()) for scope in tree.walk()], [
+            ('namespace my_namespace', kinds.NAMESPACE, True),
+            ('struct my_struct', kinds.STRUCT, True),
+            ('void go();', kinds.FUNCTION, False),
+            ('void my_struct::go()', kinds.FUNCTION, True),
+        ])
+        self.assertFalse(any([scope.name_span() for scope in tree.walk()]))
+
+    @test
+    def test_forward_declaration(self):
+        source_code = \
+'''class my_class;
+struct my_struct
+{
+    class my_class;
+};'''
+
+        # Only scopes with a block are definitions
+        tree = self.parse_source(source_code)
+        self.assertTrue(any([scope.kind() == kinds.STRUCT for scope in tree.walk()]))
+        self.assertEqual([scope.is_definition() for scope in tree.walk()],
+                         ['{' in source_code[scope.source_region().begin():scope.source_region().end()]
+                          for scope in tree.walk()])
+
     @test
     def test_all_scope_types(self):
 
@@ -304,3 +628,101 @@ main(int argc, char ** argv)
                       my_namespace,
                       foo_definition,
                       main)
+
+class SlowTextParser(cpp_text.CppTextParser):
+    '''
+    A C++ text parser which runs out of time at every check, if it has a deadline.
+    '''
+    def check_deadline(self):
+        if self._deadline is not None:
+            raise ParseIncomplete('Out of time')
+
+class CppTextParser(CppParser):
+    '''
+    Run all of the C++ tests against the text parser, which should produce the same trees without
+    using a view.
+    '''
+    def run_test(self, source_code, *top_level_scopes):
+        correct_tree = ScopeTree(TextView(source_code))
+        correct_tree.set_top_level_scopes(*top_level_scopes)
+        self.assertEqual(correct_tree, parse_text(source_code, 'C++'))
+
+    def parse_source(self, source_code):
+        return parse_text(source_code, 'C++')
+
+    @test
+    def test_constructor_initializers(self):
+        source_code = \
+'''struct my_struct
+{
+    my_struct() : a(0), b{1} { /* { */ }
+    int a, b;
+};'''
+
+        my_struct = Scope(Region(0, len(source_code)), 'struct my_struct')
+        my_struct.add_child(Scope(Region(source_code.index('my_struct()'), source_code.index('\n    int')),
+                                  'my_struct()'))
+        self.run_test(source_code, my_struct)
+
+    @test
+    def test_not_functions(self):
+        source_code = \
+'''int x = foo(1);
+enum class color { red, green };
+extern "C" {
+int bar(void);
+}
+void baz()
+{
+    if (x) { return; }
+}'''
+
+        self.run_test(source_code,
+                      Scope(Region(source_code.index('int bar'), source_code.index('\n}\nvoid')), 'int bar(void);'),
+                      Scope(Region(source_code.index('void baz'), len(source_code)), 'void baz()'))
+
+    @test
+    def test_budget(self):
+        # The scan for tokens, the search for scopes within a namespace, and the insertions all
+        # stop many times, and carry on where they left off
+        source_code = 'namespace n {\n' + ''.join(
+            'void f{}() {{ if (x) {{ }} }}\n'.format(i) for i in range(1000)) + '}\n'
+        parser = SlowTextParser(TextView(source_code))
+        tree = run_budgeted(parser, parser.parse, 1)
+        self.assertFalse(tree.is_complete())
+        self.assertEqual(tree.size(), 0)
+
+        progress = list(resume_in_slices(tree, 1))
+        self.assertGreater(len(progress), 1000)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(tree, parse_text(source_code, 'C++'))
+
+    @test
+    def test_first_slice(self):
+        # The scan and the search of a large file stop at the deadline, not only the insertions
+        view = TextView(''.join('void f{}(int a) {{\n    return a;\n}}\n'.format(i) for i in range(20000)))
+        start = time.perf_counter()
+        parser = get_text_parser(view, 'C++')
+        tree = run_budgeted(parser, parser.parse, 10)
+        self.assertLess(time.perf_counter() - start, 0.05)
+        self.assertFalse(tree.is_complete())
+        self.assertEqual(tree.size(), 0)
+
+    @test
+    def test_adjacent(self):
+        # Scopes which touch the next one end a character early, so that siblings don't touch
+        source_code = 'int h();int k();void f(){}void g(){}namespace n{int m();}class c{};'
+
+        def scope(name, end):
+            start = source_code.index(name)
+            return Scope(Region(start, source_code.index(end, start) + len(end) - 1), name)
+
+        namespace = scope('namespace n', '}')
+        namespace.add_child(scope('int m();', ';}'))
+        self.run_test(source_code,
+                      scope('int h();', ';'),
+                      scope('int k();', ';'),
+                      scope('void f()', '}'),
+                      scope('void g()', '}'),
+                      namespace,
+                      Scope(Region(source_code.index('class c'), len(source_code)), 'class c'))
@@ -0,0 +1,131 @@
+from unittest import TestCase
+
+from sublime import Region
+
+from SublimeScopeTree.lib.errors import QueryError, RenderError
+from SublimeScopeTree.lib.kinds import classify, CLASS, STRUCT, NAMESPACE, FUNCTION, OTHER
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.parse import TextView
+from SublimeScopeTree.lib.settings import get_setting
+from SublimeScopeTree.lib.query import Query
+from SublimeScopeTree.lib.test import test
+from SublimeScopeTree.lib.tree import ScopeTree
+
+log = get_logger('test.query')
+
+source_code = \
+'''namespace outer {
+class widget {
+    void draw();
+    int size() { return 0; }
+};
+struct point { int x; };
+}
+void draw_all() {}
+'''
+
+class Classify(TestCase):
+    @test
+    def test_kinds(self):
+        self.assertEqual(classify('class widget'), CLASS)
+        self.assertEqual(classify('template <typename T> struct point'), STRUCT)
+        self.assertEqual(classify('namespace outer'), NAMESPACE)
+        self.assertEqual(classify('void draw()'), FUNCTION)
+        self.assertEqual(classify('extern "C"'), OTHER)
+
+class QueryTest(TestCase):
+    def setUp(self):
+        self.tree = ScopeTree(TextView(source_code))
+        for name, start, end in [
+            ('namespace outer', 'namespace outer', ';\n}'),
+            ('class widget', 'class widget', '};'),
+            ('void draw()', 'void draw()', ';'),
+            ('int size()', 'int size()', '}'),
+            ('struct point', 'struct point', '};'),
+            ('void draw_all()', 'void draw_all()', '}'),
+        ]:
+            begin = source_code.index(start)
+            end = source_code.index(end, begin) + len(end)
+            self.tree.insert(Region(begin, end), name)
+        self.tree.render()
+
+    def names(self, **kwargs):
+        return [scope.name for scope in self.tree.query(Query(**kwargs))]
+
+    @test
+    def test_needs_render(self):
+        self.tree.insert(Region(0, 1), 'n')
+        with self.assertRaises(RenderError):
+            self.tree.index()
+
+    @test
+    def test_kind(self):
+        self.assertEqual(self.names(kinds=[CLASS, STRUCT]), ['class widget', 'struct point'])
+        self.assertEqual(self.names(kinds=['namespace']), ['namespace outer'])
+        with self.assertRaises(QueryError):
+            Query(kinds=['widget'])
+
+    @test
+    def test_name(self):
+        self.assertEqual(self.names(name='void draw*'), ['void draw()', 'void draw_all()'])
+        self.assertEqual(self.names(regex='size'), ['int size()'])
+        with self.assertRaises(QueryError):
+            Query(regex='(')
+
+    @test
+    def test_depth(self):
+        self.assertEqual(self.names(min_depth=2), ['void draw()', 'int size()'])
+        self.assertEqual(self.names(kinds=[FUNCTION], max_depth=0), ['void draw_all()'])
+
+    @test
+    def test_region(self):
+        begin = source_code.index('class')
+        end = source_code.index('struct')
+        self.assertEqual(self.names(region=Region(begin, end)), ['class widget', 'void draw()', 'int size()'])
+
+    @test
+    def test_definition(self):
+        self.assertEqual(self.names(kinds=[FUNCTION], definition=False), ['void draw()'])
+        self.assertEqual(self.names(kinds=[FUNCTION], definition=True), ['int size()', 'void draw_all()'])
+
+    @test
+    def test_parser_definition(self):
+        self.tree.insert(Region(source_code.index('int x;'), source_code.index('int x;') + 6), 'int x()',
+            definition=True)
+        self.tree.render()
+        self.assertEqual(self.names(regex='x', definition=True), ['int x()'])
+
+    @test
+    def test_filter(self):
+        tree = self.tree.filter(Query(name='int size()'))
+        indent = ' ' * get_setting('indent_width')
+        self.assertEqual(tree.render(), 'namespace outer\n{0}class widget\n{0}{0}int size()\n'.format(indent))
+        self.assertEqual(tree.size(), 3)
+
+    @test
+    def test_filter_keeps_kinds(self):
+        # Kinds and definitions given by the parser, which can't be guessed from the names
+        begin = source_code.index('int x;')
+        self.tree.insert(Region(begin, begin + 6), 'public int x', kind=CLASS, definition=False)
+        self.tree.render()
+
+        tree = self.tree.filter(Query(regex='x$'))
+        self.assertEqual([(scope.name, scope.kind(), scope.is_definition()) for scope in tree.walk()], [
+            ('namespace outer', NAMESPACE, None),
+            ('struct point', STRUCT, None),
+            ('public int x', CLASS, False),
+        ])
+
+    @test
+    def test_filter_lazy(self):
+        begin = source_code.index('class widget')
+        lazy = ScopeTree(TextView(source_code))
+        lazy.insert(Region(0, source_code.index('\nvoid')), 'namespace outer', expanded=False)
+        lazy.set_expander(lambda tree, scope: tree.insert(Region(begin, begin + 12), 'class widget'))
+        lazy.render()
+
+        tree = lazy.filter(Query(kinds=[NAMESPACE]))
+        self.assertEqual([(scope.name, scope.is_expanded()) for scope in tree.walk()],
+                         [('namespace outer', False)])
+        self.assertTrue(tree.expand(tree.top_level_scopes()[0]))
+        self.assertEqual(tree.render(), 'namespace outer\n{}class widget\n'.format(' ' * get_setting('indent_width')))
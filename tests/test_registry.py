@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.registry import TreeRegistry
+from SublimeScopeTree.lib.test import test
+
+log = get_logger('test.registry')
+
+class Source:
+    '''
+    The parts of a view which the registry uses.
+    '''
+    def __init__(self, buffer_id, change_count=1):
+        self._buffer_id = buffer_id
+        self._change_count = change_count
+
+    def buffer_id(self):
+        return self._buffer_id
+
+    def change_count(self):
+        return self._change_count
+
+class Tree:
+    def __init__(self, source):
+        self.contents = (source.buffer_id(), source.change_count())
+
+class RegistryTest(TestCase):
+    def setUp(self):
+        self.parses = 0
+
+        def parse(source):
+            self.parses += 1
+            return Tree(source)
+
+        self.registry = TreeRegistry(parse)
+
+    @test
+    def test_share(self):
+        source = Source(1)
+        first, changed = self.registry.acquire(10, source)
+        self.assertFalse(changed)
+        second, changed = self.registry.acquire(11, source)
+        self.assertFalse(changed)
+        self.assertIs(first, second)
+        self.assertEqual(self.parses, 1)
+        self.assertTrue(self.registry.is_current(source))
+        self.assertFalse(self.registry.is_current(Source(1, change_count=2)))
+        self.assertEqual(len(self.registry), 1)
+        self.assertEqual(sorted(self.registry.outlines(1)), [10, 11])
+
+    @test
+    def test_separate_buffers(self):
+        first, _ = self.registry.acquire(10, Source(1))
+        second, _ = self.registry.acquire(11, Source(2))
+        self.assertIsNot(first, second)
+        self.assertEqual(self.parses, 2)
+
+    @test
+    def test_stale(self):
+        tree, _ = self.registry.acquire(10, Source(1))
+        updated, changed = self.registry.acquire(11, Source(1, change_count=2))
+        self.assertTrue(changed)
+        self.assertIsNot(tree, updated)
+        self.assertIs(self.registry.get(10), updated)
+        self.assertEqual(updated.contents, (1, 2))
+        # Readers holding the old tree still see the old contents
+        self.assertEqual(tree.contents, (1, 1))
+        self.assertEqual(self.parses, 2)
+
+    @test
+    def test_replace(self):
+        source = Source(1)
+        self.registry.acquire(10, source)
+        version = Tree(source)
+        self.registry.replace(1, version)
+        self.assertIs(self.registry.get(10), version)
+        # The new version is for the same contents, so the buffer is not parsed again
+        tree, changed = self.registry.acquire(11, source)
+        self.assertIs(tree, version)
+        self.assertFalse(changed)
+        self.assertEqual(self.parses, 1)
+
+    @test
+    def test_release(self):
+        source = Source(1)
+        self.registry.acquire(10, source)
+        self.registry.acquire(11, source)
+        self.assertIsNone(self.registry.release(10))
+        self.assertNotIn(10, self.registry)
+        self.assertIsNotNone(self.registry.get(11))
+        self.assertEqual(self.registry.release(11), 1)
+        self.assertEqual(len(self.registry), 0)
+        self.assertIsNone(self.registry.get(11))
@@ -0,0 +1,81 @@
+import os
+from tempfile import mkdtemp
+from unittest import TestCase
+
+from sublime import Region
+
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.errors import SerializeError
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.serialize import encode_varint, decode_varint
+from SublimeScopeTree.lib.test import test, debug
+from SublimeScopeTree.lib.tree import ScopeTree
+from SublimeScopeTree.tests.test_tree import test_tree
+
+log = get_logger('test.serialize')
+
+class Varint(TestCase):
+    @test
+    def test_round_trip(self):
+        for value in [0, 1, 127, 128, 300, 2**21, 2**35 + 7]:
+            out = bytearray()
+            encode_varint(value, out)
+            self.assertEqual(decode_varint(out, 0), (value, len(out)))
+
+    @test
+    def test_truncated(self):
+        with self.assertRaises(SerializeError):
+            decode_varint(bytearray([0x80]), 0)
+
+class DumpLoad(TestCase):
+    def setUp(self):
+        log.debug('Setting up test.test_serialize.DumpLoad.')
+        with debug():
+            self.tree = test_tree()
+
+        self.tree.insert(Region(0, 10), 'root1', kind=kinds.CLASS, definition=True)
+        self.tree.insert(Region(1, 5), 'overload()', kind=kinds.FUNCTION, definition=False)
+        self.tree.insert(Region(6, 9), 'overload()')
+        self.tree.insert(Region(2, 4), 'child3a')
+        self.tree.insert(Region(20, 30), 'root2 λ')
+        self.tree.insert(Region(21, 25), 'child1b')
+        self.tree.insert(Region(400, 9000), 'root3')
+
+        self.path = os.path.join(mkdtemp(), 'tree.sst')
+        self.tree.dump(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+        os.rmdir(os.path.dirname(self.path))
+
+    @test
+    def test_eager(self):
+        tree = ScopeTree.load(self.path, lazy=False)
+        self.assertEqual(tree, self.tree)
+        self.assertEqual(tree.size(), self.tree.size())
+        self.assertEqual(tree.source_size(), self.tree.source_size())
+        self.assertEqual(tree.render(), self.tree.render())
+
+    @test
+    def test_lazy(self):
+        tree = ScopeTree.load(self.path)
+        self.assertEqual(tree.size(), 3)
+        self.assertEqual([scope.is_expanded() for scope in tree.top_level_scopes()], [False, False, True])
+
+        while any([tree.expand(scope) for scope in list(tree.walk())]):
+            pass
+        self.assertEqual(tree, self.tree)
+        self.assertEqual(tree.render(), self.tree.render())
+
+    @test
+    def test_kinds(self):
+        tree = ScopeTree.load(self.path, lazy=False)
+        self.assertEqual([(scope.kind(), scope.is_definition()) for scope in tree.walk()],
+                         [(scope.kind(), scope.is_definition()) for scope in self.tree.walk()])
+
+    @test
+    def test_not_a_tree(self):
+        with open(self.path, 'wb') as tree_file:
+            tree_file.write(b'not a tree')
+        with self.assertRaises(SerializeError):
+            ScopeTree.load(self.path)
@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+from sublime import Region
+
+from SublimeScopeTree.lib.log import get_logger
+from SublimeScopeTree.lib.symbols import SymbolIndex, identifiers
+from SublimeScopeTree.lib.test import test, test_only, debug
+from SublimeScopeTree.tests.test_tree import test_tree
+
+log = get_logger('test.symbols')
+
+@test_only
+def make_tree(*names):
+    tree = test_tree()
+    for index, name in enumerate(names):
+        tree.insert(Region(index * 10, index * 10 + 5), name)
+    return tree
+
+class Identifiers(TestCase):
+    @test
+    def test_identifiers(self):
+        self.assertEqual(identifiers('void widget::draw(int count)'), ['widget', 'draw'])
+        self.assertEqual(identifiers('class Widget'), ['widget'])
+
+class SymbolIndexTest(TestCase):
+    def setUp(self):
+        self.index = SymbolIndex()
+        with debug():
+            self.index.update(1, 'first', make_tree('class widget', 'void draw_widget()'))
+            self.index.update(2, 'second', make_tree('void draw()', 'struct window'))
+
+    def names(self, query):
+        return sorted(hit.name for hit in self.index.search(query))
+
+    @test
+    def test_prefix(self):
+        self.assertEqual(self.names('dr'), ['void draw()', 'void draw_widget()'])
+        hit = self.index.search('window')[0]
+        self.assertEqual((hit.view, hit.region), ('second', Region(10, 15)))
+
+    @test
+    def test_prefix_first(self):
+        hits = self.index.search('wi', limit=2)
+        self.assertEqual(sorted(hit.name for hit in hits), ['class widget', 'struct window'])
+
+    @test
+    def test_fuzzy(self):
+        self.assertEqual(self.names('wdg'), ['class widget', 'void draw_widget()'])
+
+    @test
+    def test_update(self):
+        self.index.update(2, 'second', make_tree('void paint()'))
+        self.assertEqual(self.names('win'), [])
+        self.assertEqual(self.names('paint'), ['void paint()'])
+
+    @test
+    def test_remove(self):
+        self.index.remove(1)
+        self.assertNotIn(1, self.index)
+        self.assertEqual(self.names('widg'), [])
+        self.assertEqual(len(self.index), 2)
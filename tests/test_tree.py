@@ -3,8 +3,10 @@ from unittest import TestCase
 
 from sublime import Region, View
 
+from SublimeScopeTree.lib import kinds
+from SublimeScopeTree.lib.display import FoldOverlay
 from SublimeScopeTree.lib.tree import ScopeTree, Scope
-from SublimeScopeTree.lib.errors import ScopeIntersectError, DuplicateScopeError, RenderError
+from SublimeScopeTree.lib.errors import ScopeIntersectError, DuplicateScopeError, RenderError, FrozenTreeError
 from SublimeScopeTree.lib.settings import get_setting
 from SublimeScopeTree.lib.test import test, test_only, debug, inject_settings
 from SublimeScopeTree.lib.log import get_logger
@@ -19,6 +21,24 @@ class MockView(View):
     def size(self):
         return self._size
 
+class FoldingView(MockView):
+    '''
+    Records the regions folded in it.
+    '''
+    @test_only
+    def __init__(self, size):
+        MockView.__init__(self, size)
+        self.folded = []
+
+    def id(self):
+        return 0
+
+    def fold(self, region):
+        self.folded.append(region)
+
+    def unfold(self, region):
+        self.folded.remove(region)
+
 @test_only
 def test_view():
     return MockView(10000)
@@ -405,3 +425,408 @@ root2
         log.debug('Rendered tree:\n{}', self.tree.render())
         log.debug('Correct tree:\n{}', self.rendered.format(indent=' '*new_indent))
         self.assertEqual(self.tree.render(), self.rendered.format(indent=' '*new_indent))
+
+    @test
+    def test_kind_regions(self):
+        self.tree.insert(Region(40, 50), 'class widget', kind=kinds.CLASS)
+        text = self.tree.render()
+        regions = self.tree.kind_regions()
+        self.assertEqual(sorted(regions), [kinds.CLASS, kinds.OTHER])
+        self.assertEqual([text[region.begin():region.end()] for region in regions[kinds.CLASS]], ['class widget'])
+        self.assertEqual(
+            [text[region.begin():region.end()] for region in regions[kinds.OTHER]],
+            [scope.name for scope in self.tree.walk()][:-1])
+
+    @test
+    def test_kind_regions_multiline(self):
+        # Prototypes split over several lines are kept that way in their names
+        self.tree.insert(Region(40, 50), 'void f(int a, \\\n       int b)', kind=kinds.FUNCTION)
+        self.tree.insert(Region(41, 45), 'class C', kind=kinds.CLASS)
+        self.tree.insert(Region(60, 70), 'namespace n', kind=kinds.NAMESPACE)
+        text = self.tree.render()
+        regions = self.tree.kind_regions()
+        self.assertEqual([text[region.begin():region.end()] for kind in (kinds.FUNCTION, kinds.CLASS, kinds.NAMESPACE)
+                          for region in regions[kind]],
+                         ['void f(int a, \\\n       int b)', 'class C', 'namespace n'])
+
+class Expand(TestCase):
+    def setUp(self):
+        log.debug('Setting up test.test_tree.Expand.')
+        with debug():
+            self.tree = test_tree()
+
+        self.children = {
+            'root': [(Region(1, 4), 'child1'), (Region(5, 9), 'child2')],
+            'child2': [(Region(6, 8), 'grandchild')]
+        }
+        self.expanded = []
+
+        def expander(tree, scope):
+            self.expanded.append(scope.name)
+            for child in self.children.get(scope.name, []):
+                self.tree.insert(*child, expanded=False)
+
+        self.tree.set_expander(expander)
+        self.tree.insert(Region(0, 10), 'root', expanded=False)
+
+    @test
+    def test_expand(self):
+        root = next(self.tree.walk())
+        self.assertFalse(root.is_expanded())
+        self.assertTrue(self.tree.expand(root))
+        self.assertTrue(root.is_expanded())
+        self.assertEqual([child.name for child in root.children], ['child1', 'child2'])
+        self.assertEqual(self.tree.size(), 3)
+
+        # Expansion is memoized
+        self.assertFalse(self.tree.expand(root))
+        self.assertEqual(self.expanded, ['root'])
+
+    @test
+    def test_expand_leaf(self):
+        root = next(self.tree.walk())
+        self.tree.expand(root)
+        child1 = root.children[0]
+        self.assertFalse(self.tree.expand(child1))
+        self.assertTrue(child1.is_expanded())
+        self.assertFalse(self.tree.expand(child1))
+        self.assertEqual(self.expanded, ['root', 'child1'])
+
+    @test
+    def test_render_after_expand(self):
+        self.assertEqual(self.tree.render(), 'root\n')
+        root = next(self.tree.walk())
+        self.tree.expand(root)
+        self.tree.expand(root.children[1])
+
+        indent = ' '*get_setting('indent_width')
+        self.assertEqual(self.tree.render(),
+            'root\n{0}child1\n{0}child2\n{0}{0}grandchild\n'.format(indent))
+        grandchild = root.children[1].children[0]
+        self.assertEqual(self.tree.find(center(grandchild.display_region())), grandchild.display_region())
+
+class Intern(TestCase):
+    def setUp(self):
+        log.debug('Setting up test.test_tree.Intern.')
+        with debug():
+            self.tree = test_tree()
+
+    @test
+    def test_duplicate_names(self):
+        self.tree.insert(Region(0, 10), 'void overload(int)')
+        self.tree.insert(Region(20, 30), 'void overload(int)')
+        self.tree.insert(Region(40, 50), 'void overload(char)')
+
+        self.assertEqual(self.tree.names(), ['void overload(int)', 'void overload(char)'])
+        self.assertEqual([scope.name for scope in self.tree.walk()],
+                         ['void overload(int)', 'void overload(int)', 'void overload(char)'])
+
+    @test
+    def test_equality(self):
+        self.tree.insert(Region(0, 10), 'root')
+        other = test_tree()
+        other.insert(Region(0, 5), 'unrelated')
+        other.insert(Region(0, 10), 'root')
+
+        # Same name at a different index in another tree's table
+        self.assertEqual(next(self.tree.walk()), next(other.walk()))
+        self.assertEqual(next(self.tree.walk()), Scope(Region(0, 10), 'root'))
+        self.assertNotEqual(next(self.tree.walk()), Scope(Region(0, 10), 'other'))
+
+    @test
+    def test_rename(self):
+        self.tree.insert(Region(0, 10), 'root')
+        scope = next(self.tree.walk())
+        scope.name = 'renamed'
+        self.assertEqual(scope.name, 'renamed')
+        self.assertEqual(self.tree.render(), 'renamed\n')
+
+class Reparse(TestCase):
+    def setUp(self):
+        log.debug('Setting up test.test_tree.Reparse.')
+        with debug():
+            self.tree = test_tree()
+            self.new_tree = test_tree()
+
+        self.tree.insert(Region(0, 10), 'root')
+        self.tree.insert(Region(1, 5), 'child')
+        self.new_tree.insert(Region(0, 12), 'root')
+        self.new_tree.insert(Region(1, 5), 'child')
+        self.new_tree.insert(Region(6, 11), 'new child')
+
+    @test
+    def test_keep_folds(self):
+        self.tree.render()
+        root = next(self.tree.walk())
+        view = FoldingView(100)
+        folds = FoldOverlay()
+        folds.toggle_fold(view, self.tree, root)
+        self.assertEqual(view.folded, [root.display_region().fold_region()])
+
+        # The outline shows a new parse of the source
+        self.new_tree.render()
+        view.folded = []
+        folds.restore(view, self.new_tree)
+        self.assertEqual([folds.is_folded(self.new_tree, scope) for scope in self.new_tree.walk()],
+                         [True, False, False])
+        self.assertEqual(view.folded, [next(self.new_tree.walk()).display_region().fold_region()])
+
+        folds.toggle_fold(view, self.new_tree, next(self.new_tree.walk()))
+        self.assertEqual(view.folded, [])
+        self.assertEqual(len(folds), 0)
+
+    @test
+    def test_fold_duplicates(self):
+        # The same prototype in two scopes, and twice in one, is folded separately in each place
+        for name, region in [('namespace a', Region(20, 40)), ('namespace b', Region(50, 70)),
+                             ('void f()', Region(21, 25)), ('void f()', Region(51, 55)),
+                             ('void f()', Region(56, 60))]:
+            self.tree.insert(region, name)
+        self.tree.insert(Region(22, 23), 'child')
+        self.tree.insert(Region(57, 58), 'child')
+        self.tree.render()
+
+        view = FoldingView(100)
+        folds = FoldOverlay()
+        duplicates = [scope for scope in self.tree.walk() if scope.name == 'void f()']
+        folds.toggle_fold(view, self.tree, duplicates[2])
+        self.assertEqual([folds.is_folded(self.tree, scope) for scope in duplicates], [False, False, True])
+
+        view.folded = []
+        folds.restore(view, self.tree)
+        self.assertEqual(view.folded, [duplicates[2].display_region().fold_region()])
+
+    @test
+    def test_resume_version(self):
+        # A newer version of an incomplete tree is the one whose parse is resumed
+        resumed = []
+        def resume(tree, budget):
+            resumed.append((tree, budget))
+            tree.set_resume(None)
+
+        self.new_tree.set_resume(resume)
+        version = self.new_tree.edit()
+        self.assertFalse(version.is_complete())
+        self.assertTrue(version.resume(50))
+        self.assertEqual(resumed, [(version, 50)])
+        self.assertTrue(version.is_complete())
+
+class Incremental(TestCase):
+    '''
+    Changes to a rendered tree update the display regions without rendering it again.
+    '''
+    def setUp(self):
+        log.debug('Setting up test.test_tree.Incremental.')
+        with debug():
+            self.tree = test_tree()
+
+        self.scopes = [
+            (Region(0, 10), 'root1'),
+            (Region(1, 5), 'child1a'),
+            (Region(6, 9), 'child2a'),
+            (Region(20, 30), 'root2'),
+            (Region(21, 25), 'child1b'),
+        ]
+        for scope in self.scopes:
+            self.tree.insert(*scope)
+        self.tree.render()
+
+    def assert_layout(self, *scopes):
+        '''
+        Check that the display regions of the tree, and find, agree with a new render of a tree
+        with the given scopes.
+        '''
+        with debug():
+            expected = test_tree()
+        for scope in scopes:
+            expected.insert(*scope)
+        expected.render()
+
+        self.assertFalse(self.tree.is_rendered())
+        self.assertEqual(
+            [scope.display_region() for scope in self.tree.walk()],
+            [scope.display_region() for scope in expected.walk()])
+        for scope in expected.walk():
+            region = scope.display_region()
+            self.assertEqual(self.tree.find(region.begin()), region)
+            self.assertEqual(self.tree.find(region.end()).begin(), expected.find(region.end()).begin())
+        self.assertEqual(self.tree.render(), expected.render())
+
+    @test
+    def test_insert(self):
+        self.tree.insert(Region(2, 4), 'child3a')
+        self.tree.insert(Region(40, 50), 'root3')
+        self.assert_layout(*self.scopes + [(Region(2, 4), 'child3a'), (Region(40, 50), 'root3')])
+
+    @test
+    def test_insert_around(self):
+        # The new scope takes over existing ones, which move a level deeper
+        self.tree.insert(Region(0, 35), 'outer')
+        self.assert_layout(*[(Region(0, 35), 'outer')] + self.scopes)
+
+    @test
+    def test_rename(self):
+        self.tree.top_level_scopes()[0].children[0].name = 'a much longer name'
+        self.assert_layout(*[self.scopes[0], (Region(1, 5), 'a much longer name')] + self.scopes[2:])
+
+    @test
+    def test_remove(self):
+        self.tree.remove(self.tree.top_level_scopes()[0].children[0])
+        self.assertEqual(self.tree.size(), 4)
+        self.assert_layout(*self.scopes[:1] + self.scopes[2:])
+
+        self.tree.remove(self.tree.top_level_scopes()[1])
+        self.assertEqual(self.tree.size(), 2)
+        self.assert_layout(*self.scopes[:1] + self.scopes[2:3])
+
+    @test
+    def test_render_changed_only(self):
+        # Scopes which are rendered again are given new display regions as they are rendered
+        rendered = []
+        for scope in self.tree.walk():
+            scope.display_start = lambda offset, scope=scope: \
+                rendered.append(scope.name) or Scope.display_start(scope, offset)
+
+        # Only the path from the new scope to the root
+        self.tree.insert(Region(2, 4), 'child3a')
+        self.tree.render()
+        self.assertEqual(rendered, ['root1', 'child1a'])
+        self.assertEqual(self.tree.rendered_count(), 3)
+
+        # Nothing changed, so nothing is rendered
+        rendered.clear()
+        self.tree.render()
+        self.assertEqual(rendered, [])
+        self.assertEqual(self.tree.rendered_count(), 0)
+
+        self.tree.top_level_scopes()[1].children[0].name = 'renamed'
+        self.assert_layout(*self.scopes[:4] + [(Region(2, 4), 'child3a'), (Region(21, 25), 'renamed')])
+        self.assertEqual(rendered, ['root2', 'renamed'])
+
+    @test
+    def test_indent_width(self):
+        indent_width = get_setting('indent_width')
+        try:
+            inject_settings(indent_width=2 * indent_width)
+            self.assertEqual(self.tree.render().splitlines()[1], ' '*2*indent_width + 'child1a')
+        finally:
+            inject_settings(indent_width=indent_width)
+
+class Versions(TestCase):
+    '''
+    Changes to a new version of a tree leave the old version as it was, and share the scopes which
+    did not change.
+    '''
+    def setUp(self):
+        log.debug('Setting up test.test_tree.Versions.')
+        with debug():
+            self.tree = test_tree()
+
+        self.scopes = [
+            (Region(0, 10), 'root1'),
+            (Region(1, 5), 'child1a'),
+            (Region(6, 9), 'child2a'),
+            (Region(20, 30), 'root2'),
+            (Region(21, 25), 'child1b'),
+        ]
+        for scope in self.scopes:
+            self.tree.insert(*scope)
+        self.text = self.tree.render()
+        self.regions = [scope.display_region() for scope in self.tree.walk()]
+
+    def assert_version(self, version, *scopes):
+        '''
+        Check that a version of the tree agrees with a new tree of the given scopes, and that the
+        old version is unchanged.
+        '''
+        with debug():
+            expected = test_tree()
+        for scope in scopes:
+            expected.insert(*scope)
+
+        self.assertEqual(version.render(), expected.render())
+        self.assertEqual(version, expected)
+        self.assertEqual(
+            [version.display_region(scope) for scope in version.walk()],
+            [scope.display_region() for scope in expected.walk()])
+        for scope in expected.walk():
+            region = scope.display_region()
+            self.assertEqual(version.find(region.begin()), region)
+
+        self.assertEqual(self.tree.render(), self.text)
+        self.assertEqual([scope.display_region() for scope in self.tree.walk()], self.regions)
+
+    @test
+    def test_frozen(self):
+        self.tree.edit()
+        with self.assertRaises(FrozenTreeError):
+            self.tree.insert(Region(40, 50), 'root3')
+        with self.assertRaises(FrozenTreeError):
+            self.tree.top_level_scopes()[0].name = 'renamed'
+
+    @test
+    def test_insert(self):
+        version = self.tree.edit()
+        version.insert(Region(2, 4), 'child3a')
+        self.assert_version(version, *self.scopes + [(Region(2, 4), 'child3a')])
+
+        # Only the path to the new scope is copied
+        old, new = self.tree.top_level_scopes(), version.top_level_scopes()
+        self.assertIsNot(new[0], old[0])
+        self.assertIs(new[0].children[1], old[0].children[1])
+        self.assertIs(new[1], old[1])
+
+    @test
+    def test_insert_around(self):
+        version = self.tree.edit()
+        version.insert(Region(0, 35), 'outer')
+        self.assert_version(version, *[(Region(0, 35), 'outer')] + self.scopes)
+
+    @test
+    def test_rename_and_remove(self):
+        version = self.tree.edit()
+        version.rename(self.tree.top_level_scopes()[0].children[0], 'a much longer name')
+        version.remove(self.tree.top_level_scopes()[1].children[0])
+        self.assert_version(version, self.scopes[0], (Region(1, 5), 'a much longer name'), *self.scopes[2:4])
+
+    @test
+    def test_versions_of_versions(self):
+        first = self.tree.edit()
+        first.insert(Region(40, 50), 'root3')
+        first.render()
+        second = first.edit()
+        second.remove(first.top_level_scopes()[0])
+        self.assert_version(second, *self.scopes[3:] + [(Region(40, 50), 'root3')])
+        self.assertEqual(first.size(), 6)
+
+class FindSource(TestCase):
+    def setUp(self):
+        log.debug('Setting up test.test_tree.FindSource.')
+        with debug():
+            self.tree = test_tree()
+
+        self.tree.insert(Region(0, 10), 'root1')
+        self.tree.insert(Region(1, 5), 'child1a')
+        self.tree.insert(Region(6, 9), 'child2a')
+        self.tree.insert(Region(2, 4), 'child3a')
+        self.tree.insert(Region(20, 30), 'root2')
+        self.tree.insert(Region(22, 24), 'child1b')
+
+    def name_at(self, point):
+        scope = self.tree.find_source(point)
+        return scope.name if scope else None
+
+    @test
+    def test_needs_render(self):
+        with self.assertRaises(RenderError):
+            self.tree.find_source(0)
+
+    @test
+    def test_find_source(self):
+        self.tree.render()
+        expected = {
+            0: 'root1', 1: 'child1a', 3: 'child3a', 5: 'child1a', 6: 'child2a', 9: 'child2a',
+            10: 'root1', 11: None, 19: None, 21: 'root2', 23: 'child1b', 25: 'root2', 31: None
+        }
+        for point, name in expected.items():
+            self.assertEqual(self.name_at(point), name, 'at {}'.format(point))